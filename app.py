@@ -1,5 +1,7 @@
 # app.py
 
+import os
+
 from flask import Flask, redirect, url_for
 from config import Config
 from database import db
@@ -23,6 +25,9 @@ from features.supervisor.viewProjectListing.supervisorViewProjectListingControll
 from features.supervisor.viewProjectListing.supervisorWishlistController import supervisor_wishlist_bp
 from features.authentication.changePassword.changePassword import change_password_bp
 from shared.models import create_default_admin_account
+from shared.service.import_jobs import start_import_workers
+from shared.service.email_outbox import start_outbox_workers
+from shared.service.sync_scheduler import start_sync_scheduler, sync_external_command
 from features.systemAdmin.manageSchool.manageSchoolController import manage_school_bp
 from features.academicCoordinator.viewCourseTerm.viewCourseTermController import view_course_term_bp
 from shared.navigationBar.navigationController import navigation_bp, inject_navigation
@@ -68,6 +73,9 @@ app.register_blueprint(manage_projects_bp)
 # --- CONTEXT PROCESSORS ---
 app.context_processor(inject_navigation)
 
+# --- CLI COMMANDS ---
+app.cli.add_command(sync_external_command)  # flask sync-external (nightly cron)
+
 # --- ROUTES ---
 @app.route('/')
 def index():
@@ -93,9 +101,31 @@ def manage_timeframes_redirect():
 def dashboard_redirect():
     return redirect(url_for('universal_dashboard_bp.dashboard'))
 
+# --- BACKGROUND JOBS ---
+# Only processes that serve requests run the job workers, outbox workers and scheduler; importing
+# the app (flask db, flask sync-external, a password hashing worker) starts no threads
+_background_workers_started = False
+
+def start_background_workers():
+    # Each start function is idempotent per process
+    global _background_workers_started
+    _background_workers_started = True
+    start_import_workers(app)
+    start_outbox_workers(app)
+    start_sync_scheduler(app)
+
+@app.before_request
+def ensure_background_workers():
+    # WSGI servers and flask run: started by the first request each process serves
+    if not _background_workers_started:
+        start_background_workers()
+
 # --- MAIN ---
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
         create_default_admin_account()
+    # With the debug reloader only the serving child process runs the job workers
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_workers()
     app.run(debug=True)
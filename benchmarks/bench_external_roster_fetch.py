@@ -0,0 +1,75 @@
+"""
+Benchmark for reading rosters from the external API simulator.
+
+Seeds a throw-away SQLite copy of external_school_db with synthetic students, serves it with
+external_api_simulator on a local port, and times shared.service.external_api_client reading
+every period with cursor pages of several sizes, with the NDJSON stream, and with the periods
+fetched one after another versus in parallel.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_external_roster_fetch --students 100000 --sessions 4 --page-sizes 500 1000 5000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+
+import external_api_simulator as simulator  # noqa: E402
+from shared.service.external_api_client import (  # noqa: E402
+    ExternalRosterResponse, close_sessions, fetch_concurrently, get_session
+)
+
+HEADERS = {'X-API-Key': 'uow_api_key_123', 'X-API-Secret': 'UOW_SECRET'}
+
+
+def read_period(base_url, period, **options):
+    return sum(1 for _ in ExternalRosterResponse(base_url, HEADERS, period, session=get_session('bench'), **options))
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    records = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f} s  {records / elapsed:10.0f} records/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[500, 1000, 5000])
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        simulator.SQLITE_PATH = os.path.join(directory, 'external_school_db.sqlite3')
+        rows = simulator.seed_database(args.students, args.sessions)
+        periods = [f"{2025 + i // 2}-Sem{i % 2 + 1}" for i in range(args.sessions)]
+        print(f"Seeded {rows} rows across {args.sessions} sessions")
+
+        server = make_server('127.0.0.1', args.port, simulator.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{args.port}"
+
+        app = Flask(__name__)
+        with app.app_context():
+            for page_size in args.page_sizes:
+                timed(f"pages of {page_size}",
+                      lambda: sum(read_period(base_url, period, page_size=page_size) for period in periods))
+            timed("ndjson stream", lambda: sum(read_period(base_url, period, stream=True) for period in periods))
+            timed(f"{len(periods)} periods in parallel",
+                  lambda: sum(fetch_concurrently(lambda period: read_period(base_url, period), periods).values()))
+
+        server.shutdown()
+        close_sessions()
+
+
+if __name__ == '__main__':
+    main()
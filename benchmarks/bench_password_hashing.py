@@ -0,0 +1,56 @@
+"""
+Benchmark for shared.service.password_hashing.
+
+Generates and hashes a cohort's worth of passwords with 1..N pool workers and reports
+throughput, so the scaling with cores can be checked on the deployment hardware.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_password_hashing --count 512 --workers 1 2 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from shared.service.password_hashing import generate_credentials, shutdown_hash_pool  # noqa: E402
+
+
+def bench(app, count, workers):
+    app.config['PASSWORD_HASH_WORKERS'] = workers
+    with app.app_context():
+        # Warm-up run starts the pool so process spawning is not measured
+        generate_credentials(min(count, app.config['PASSWORD_HASH_CHUNK_SIZE'] * workers))
+        start = time.perf_counter()
+        generate_credentials(count)
+        elapsed = time.perf_counter() - start
+    print(f"{workers:>3} workers  {elapsed:8.2f} s  {count / elapsed:10.1f} hashes/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=512)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--method', default='scrypt', help='werkzeug hash method, e.g. pbkdf2:sha256:600000')
+    parser.add_argument('--chunk-size', type=int, default=32)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config['PASSWORD_HASH_METHOD'] = args.method
+    app.config['PASSWORD_HASH_CHUNK_SIZE'] = args.chunk_size
+
+    print(f"Hashing {args.count} passwords with {args.method} ({os.cpu_count()} CPUs available)")
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        elapsed = bench(app, args.count, workers)
+        baseline = baseline or elapsed
+        print(f"{'':>14} speed-up x{baseline / elapsed:.2f}")
+    shutdown_hash_pool()
+
+
+if __name__ == '__main__':
+    main()
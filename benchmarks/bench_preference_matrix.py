@@ -0,0 +1,121 @@
+"""
+Benchmark for shared.service.preference_matrix.
+
+Measures building a PreferenceMatrix from 100k synthetic preference rows, the common
+analytics on top of it, and the end-to-end load from a throwaway SQLite database.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_preference_matrix --students 20000 --projects 800 --ranks 5
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.service.preference_matrix import PreferenceMatrix, load_preference_matrix  # noqa: E402
+
+
+def synthetic_preferences(n_students, n_projects, n_ranks, seed=0):
+    """Zipf-skewed preferences: a few projects are very popular, as in real cohorts"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, n_projects + 1) ** 0.8
+    popularity /= popularity.sum()
+    # Gumbel top-k sampling gives every student n_ranks distinct projects in one vectorised step
+    keys = np.log(popularity)[None, :] + rng.gumbel(size=(n_students, n_projects))
+    choices = np.argpartition(-keys, n_ranks, axis=1)[:, :n_ranks]
+    user_ids = np.repeat(np.arange(1, n_students + 1), n_ranks)
+    project_ids = choices.ravel() + 1
+    ranks = np.tile(np.arange(1, n_ranks + 1), n_students)
+    capacities = rng.integers(1, 10, size=n_projects)
+    return user_ids, project_ids, ranks, capacities
+
+
+def timed(label, fn, repeat=5):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:<40} {best * 1000:8.2f} ms")
+    return result
+
+
+def bench_in_memory(user_ids, project_ids, ranks, capacities, n_students, n_projects):
+    print(f"\nIn-memory ({len(ranks)} preference rows)")
+    matrix = timed('PreferenceMatrix.from_arrays', lambda: PreferenceMatrix.from_arrays(
+        user_ids, project_ids, ranks,
+        member_user_ids=np.arange(1, n_students + 1),
+        project_ids=np.arange(1, n_projects + 1), capacities=capacities
+    ))
+    timed('sparse()', matrix.sparse)
+    timed('dense()', matrix.dense)
+    timed('demand()', matrix.demand)
+    timed('demand_by_rank()', matrix.demand_by_rank)
+    timed('oversubscription()', matrix.oversubscription)
+    # Everyone gets their first choice: project ids are 1..n so the column is id - 1
+    first_choice = project_ids.reshape(n_students, -1)[:, 0] - 1
+    timed('satisfaction(assignment)', lambda: matrix.satisfaction(first_choice))
+
+
+def bench_sqlite(user_ids, project_ids, ranks, capacities, n_students, n_projects):
+    from flask import Flask
+    from database import db
+    from shared.models import School, User, Role, Timeframe, Project, Preference, user_role_timeframes
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(School(id=1, name='Benchmark School'))
+        db.session.add(Role(id=1, name='student'))
+        db.session.add(Timeframe(
+            id=1, name='BENCH', school_id=1, delivery_type='on campus',
+            start_date=date.today(), end_date=date.today(),
+            preference_startTiming=date.today(), preference_endTiming=date.today()
+        ))
+        db.session.execute(User.__table__.insert(), [
+            {'id': uid, 'email': f'student{uid}@example.com', 'password_hash': '-'}
+            for uid in range(1, n_students + 1)
+        ])
+        db.session.execute(user_role_timeframes.insert(), [
+            {'user_id': uid, 'role_id': 1, 'timeframe_id': 1} for uid in range(1, n_students + 1)
+        ])
+        db.session.execute(Project.__table__.insert(), [
+            {'id': pid, 'title': f'Project {pid}', 'student_capacity': int(capacities[pid - 1]),
+             'timeframe_id': 1, 'created_by': 1}
+            for pid in range(1, n_projects + 1)
+        ])
+        db.session.execute(Preference.__table__.insert(), [
+            {'user_id': int(u), 'project_id': int(p), 'timeframe_id': 1, 'preference_rank': int(r)}
+            for u, p, r in zip(user_ids, project_ids, ranks)
+        ])
+        db.session.commit()
+
+        print(f"\nSQLite end-to-end ({len(ranks)} preference rows)")
+        timed('load_preference_matrix(timeframe)', lambda: load_preference_matrix(1, 'student'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=20000)
+    parser.add_argument('--projects', type=int, default=800)
+    parser.add_argument('--ranks', type=int, default=5)
+    parser.add_argument('--skip-db', action='store_true', help='only run the in-memory benchmark')
+    args = parser.parse_args()
+
+    data = synthetic_preferences(args.students, args.projects, args.ranks)
+    bench_in_memory(*data, args.students, args.projects)
+    if not args.skip_db:
+        bench_sqlite(*data, args.students, args.projects)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark for the welcome email senders in shared.service.email_service.
+
+Seeds a throw-away SQLite database with a cohort, points its EmailConfig at the local SMTP sink
+(benchmarks/smtp_sink.py) and times send_welcome_emails in every SMTP_SEND_MODE: one connection
+for all messages (single), a connection per message on 8 threads (threaded), the pool of reused
+connections (pooled), the asyncio sender (async) and the one picked from the sink's capabilities
+(auto). No external mail provider is involved; --latency stands in for the round trip to one.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_welcome_email_send --users 500 --latency 0.02 --modes single pooled async
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from benchmarks.smtp_sink import SMTPSink  # noqa: E402
+from database import db  # noqa: E402
+from shared.models import EmailConfig, Role, School, Timeframe, User, user_roles, user_timeframes  # noqa: E402
+from shared.service.email_service import SEND_MODES, send_welcome_emails  # noqa: E402
+
+
+def seed(n_users, port):
+    db.session.add(School(id=1, name='Benchmark School'))
+    db.session.add(Role(id=1, name='student'))
+    db.session.add(Timeframe(
+        id=1, name='BENCH', school_id=1, delivery_type='on campus',
+        start_date=date.today(), end_date=date.today(),
+        preference_startTiming=date.today(), preference_endTiming=date.today()
+    ))
+    db.session.add(EmailConfig(
+        school_id=1, smtp_server='127.0.0.1', smtp_port=port, smtp_username='bench', smtp_password='bench',
+        from_email='noreply@example.com', use_tls=False, use_ssl=False, is_active=True
+    ))
+    db.session.execute(User.__table__.insert(), [
+        {'id': uid, 'email': f'student{uid}@example.com', 'name': f'Student {uid}', 'password_hash': '-',
+         'school_id': 1, 'email_sent': False}
+        for uid in range(1, n_users + 1)
+    ])
+    db.session.execute(user_roles.insert(), [{'user_id': uid, 'role_id': 1} for uid in range(1, n_users + 1)])
+    db.session.execute(user_timeframes.insert(), [
+        {'user_id': uid, 'timeframe_id': 1} for uid in range(1, n_users + 1)
+    ])
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds the sink delays each reply')
+    parser.add_argument('--modes', nargs='+', choices=sorted(SEND_MODES) + ['auto'],
+                        default=['single', 'threaded', 'pooled', 'async', 'auto'])
+    parser.add_argument('--pool-size', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--no-pipelining', action='store_true', help='the sink does not offer PIPELINING')
+    args = parser.parse_args()
+
+    # Per-message INFO logs would dominate the timings
+    logging.disable(logging.INFO)
+
+    sink = SMTPSink(latency=args.latency, pipelining=not args.no_pipelining).start()
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SMTP_POOL_SIZE'] = args.pool_size
+    app.config['SMTP_ASYNC_CONCURRENCY'] = args.concurrency
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        seed(args.users, sink.port)
+        timeframe = db.session.get(Timeframe, 1)
+        users = list(timeframe.users)
+        passwords = {user.email: 'Welcome-123' for user in users}
+        print(f"{len(users)} welcome emails to a local sink, {args.latency * 1000:.0f} ms reply latency, "
+              f"pipelining {'off' if args.no_pipelining else 'on'}")
+
+        for mode in args.modes:
+            app.config['SMTP_SEND_MODE'] = mode
+            messages, connections = sink.messages, sink.connections
+            start = time.perf_counter()
+            result = send_welcome_emails(users, timeframe, passwords, school_id=1)
+            elapsed = time.perf_counter() - start
+            print(f"{mode:<10} {elapsed:8.2f} s  {result['sent_count'] / elapsed:8.1f} msgs/s  "
+                  f"{result['failed_count']:>4} failed  {sink.messages - messages:>6} received  "
+                  f"{sink.connections - connections:>5} connections")
+
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
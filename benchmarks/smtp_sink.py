@@ -0,0 +1,159 @@
+"""
+Local SMTP sink for benchmarks and manual testing of email sending.
+
+Accepts any login and every message, counts them and throws them away. Each reply is held back
+by --latency seconds, as if the server were a network round trip away, and replies keep their
+order, so pipelined commands share one delay the way they do against a real provider.
+STARTTLS is not offered; point an EmailConfig at it with TLS and SSL off.
+
+Usage (from the repository root):
+    python -m benchmarks.smtp_sink --port 2525 --latency 0.02
+"""
+import argparse
+import asyncio
+import threading
+import time
+
+
+class SMTPSink:
+    """SMTP server on its own event loop thread; start() returns once it is listening"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, pipelining=True, reject=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.pipelining = pipelining
+        self.reject = reject  # recipients containing this text get 550
+        self.messages = 0
+        self.connections = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = threading.Event()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='smtp-sink', daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+            self._loop = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _send_replies(self, writer, replies):
+        while True:
+            due, data = await replies.get()
+            if data is None:
+                break
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        replies = asyncio.Queue()
+        sender = asyncio.ensure_future(self._send_replies(writer, replies))
+
+        def reply(*lines):
+            text = ''.join(f"{line[:3]}{'-' if i < len(lines) - 1 else ' '}{line[4:]}\r\n" for i, line in enumerate(lines))
+            replies.put_nowait((time.monotonic() + self.latency, text.encode()))
+
+        recipients = 0
+        try:
+            reply('220 smtp-sink ready')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('latin-1').strip()
+                verb = command[:4].upper()
+                if verb == 'EHLO':
+                    extensions = ['250 smtp-sink', '250 AUTH PLAIN LOGIN', '250 SIZE 35882577', '250 8BITMIME']
+                    if self.pipelining:
+                        extensions.append('250 PIPELINING')
+                    reply(*extensions)
+                elif verb == 'AUTH':
+                    if command.upper().startswith('AUTH LOGIN'):
+                        # The username may come with the command (initial response)
+                        prompts = ('334 VXNlcm5hbWU6', '334 UGFzc3dvcmQ6')[len(command.split()) - 2:]
+                        for prompt in prompts:
+                            reply(prompt)
+                            await reader.readline()
+                    elif len(command.split()) < 3:
+                        reply('334 ')
+                        await reader.readline()
+                    reply('235 Authentication successful')
+                elif verb == 'RCPT':
+                    if self.reject and self.reject in command:
+                        reply('550 No such user')
+                    else:
+                        recipients += 1
+                        reply('250 OK')
+                elif verb == 'DATA' and not recipients:
+                    reply('554 No valid recipients')
+                elif verb == 'DATA':
+                    reply('354 End data with <CR><LF>.<CR><LF>')
+                    while True:
+                        data = await reader.readline()
+                        if data in (b'.\r\n', b'.\n', b''):
+                            break
+                    self.messages += 1
+                    recipients = 0
+                    reply('250 Queued')
+                elif verb == 'STAR':
+                    reply('454 TLS not available')
+                elif verb == 'QUIT':
+                    reply('221 Bye')
+                    break
+                else:
+                    # HELO, MAIL, RSET, NOOP
+                    if verb in ('MAIL', 'RSET'):
+                        recipients = 0
+                    reply('250 OK')
+        except ConnectionError:
+            pass
+        finally:
+            replies.put_nowait((0, None))
+            await sender
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each reply is delayed')
+    parser.add_argument('--no-pipelining', action='store_true')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, args.latency, pipelining=not args.no_pipelining).start()
+    print(f"SMTP sink on {sink.host}:{sink.port} (reply latency {args.latency * 1000:.0f} ms), Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"{sink.messages} messages over {sink.connections} connections")
+    except KeyboardInterrupt:
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()
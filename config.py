@@ -34,6 +34,55 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     DATABASE_TYPE = None
 
+    # Password hashing for new accounts (werkzeug generate_password_hash parameters)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_HASH_SALT_LENGTH = int(os.environ.get('PASSWORD_HASH_SALT_LENGTH') or 16)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or 0)  # 0 = one per CPU
+    PASSWORD_HASH_CHUNK_SIZE = int(os.environ.get('PASSWORD_HASH_CHUNK_SIZE') or 32)
+
+    # Background roster import jobs (shared/service/import_jobs.py)
+    IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS') or 2)  # threads per process, 0 = disabled
+    IMPORT_JOB_POLL_SECONDS = float(os.environ.get('IMPORT_JOB_POLL_SECONDS') or 2)
+    IMPORT_JOB_HEARTBEAT_SECONDS = float(os.environ.get('IMPORT_JOB_HEARTBEAT_SECONDS') or 15)
+    IMPORT_JOB_STALE_SECONDS = float(os.environ.get('IMPORT_JOB_STALE_SECONDS') or 120)
+    IMPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('IMPORT_JOB_MAX_ATTEMPTS') or 3)
+    IMPORT_JOB_MAX_PER_SCHOOL = int(os.environ.get('IMPORT_JOB_MAX_PER_SCHOOL') or 2)  # running jobs per school
+
+    # External API syncs are deltas since the last high-water mark, with a full reconcile this often
+    EXTERNAL_SYNC_FULL_RECONCILE_HOURS = float(os.environ.get('EXTERNAL_SYNC_FULL_RECONCILE_HOURS') or 168)
+    # Users applied per commit during an external sync (savepoint per user); 0 = one transaction
+    EXTERNAL_SYNC_COMMIT_EVERY = int(os.environ.get('EXTERNAL_SYNC_COMMIT_EVERY', 500))
+
+    # Nightly sync of every open timeframe of every school with an active API (shared/service/sync_scheduler.py)
+    EXTERNAL_SYNC_SCHEDULE_ENABLED = os.environ.get('EXTERNAL_SYNC_SCHEDULE_ENABLED', 'false').lower() == 'true'
+    EXTERNAL_SYNC_SCHEDULE_HOUR = int(os.environ.get('EXTERNAL_SYNC_SCHEDULE_HOUR') or 2)
+    EXTERNAL_SYNC_JITTER_SECONDS = float(os.environ.get('EXTERNAL_SYNC_JITTER_SECONDS') or 3600)
+
+    # External API client (shared/service/external_api_client.py): records per page, or NDJSON streaming
+    EXTERNAL_API_PAGE_SIZE = int(os.environ.get('EXTERNAL_API_PAGE_SIZE') or 1000)
+    EXTERNAL_API_STREAM = os.environ.get('EXTERNAL_API_STREAM', 'false').lower() == 'true'
+    EXTERNAL_API_TIMEOUT_SECONDS = float(os.environ.get('EXTERNAL_API_TIMEOUT_SECONDS') or 30)
+    EXTERNAL_API_POOL_SIZE = int(os.environ.get('EXTERNAL_API_POOL_SIZE') or 10)  # keep-alive connections per school
+    EXTERNAL_API_RETRIES = int(os.environ.get('EXTERNAL_API_RETRIES') or 3)
+    EXTERNAL_API_BACKOFF_SECONDS = float(os.environ.get('EXTERNAL_API_BACKOFF_SECONDS') or 0.5)
+    EXTERNAL_API_MAX_CONCURRENCY = int(os.environ.get('EXTERNAL_API_MAX_CONCURRENCY') or 4)  # periods fetched in parallel
+
+    # Pooled SMTP sending of welcome emails (shared/service/smtp_pool.py)
+    SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE') or 8)  # reused connections per server
+    SMTP_RATE_LIMIT_PER_SECOND = float(os.environ.get('SMTP_RATE_LIMIT_PER_SECOND', 0))  # per server, 0 = unlimited
+    SMTP_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MESSAGES_PER_CONNECTION') or 100)
+    SMTP_TIMEOUT_SECONDS = float(os.environ.get('SMTP_TIMEOUT_SECONDS') or 30)
+    SMTP_ASYNC_CONCURRENCY = int(os.environ.get('SMTP_ASYNC_CONCURRENCY') or 16)  # asyncio sender (shared/service/async_smtp.py)
+    SMTP_SEND_MODE = os.environ.get('SMTP_SEND_MODE', 'auto')  # auto, pooled, async, threaded or single (outbox: async or pooled)
+
+    # Email outbox delivered by background workers (shared/service/email_outbox.py)
+    EMAIL_OUTBOX_WORKERS = int(os.environ.get('EMAIL_OUTBOX_WORKERS', 1))  # threads per process, 0 = disabled
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get('EMAIL_OUTBOX_BATCH_SIZE') or 200)
+    EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL_SECONDS') or 5)
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS') or 5)  # then dead-lettered
+    EMAIL_OUTBOX_BACKOFF_SECONDS = float(os.environ.get('EMAIL_OUTBOX_BACKOFF_SECONDS') or 60)  # doubled per attempt
+    EMAIL_OUTBOX_LEASE_SECONDS = float(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS') or 600)
+
 def check_postgresql_connection():
     """Check if PostgreSQL is available and accessible"""
     try:
@@ -1,5 +1,10 @@
-from flask import Flask, request, jsonify
-import mysql.connector
+from flask import Flask, Response, request, jsonify
+import argparse
+import json
+import os
+import random
+import sqlite3
+import threading
 from datetime import datetime
 
 app = Flask(__name__)
@@ -13,12 +18,143 @@ DB_CONFIG = {
     'password': ''  # Your MySQL password
 }
 
+# Connections kept open by the MySQL pool (mysql.connector allows at most 32)
+DB_POOL_SIZE = int(os.environ.get('SIMULATOR_DB_POOL_SIZE') or 10)
+
+# Set to a file path to serve from SQLite instead of MySQL (no database server needed)
+SQLITE_PATH = os.environ.get('SIMULATOR_SQLITE_PATH')
+
 # Simple API key validation
 VALID_API_KEYS = {
     'uow_api_key_123': 'UOW_SECRET',
     'test_school_key': 'TEST_SECRET'
 }
 
+class MySQLBackend:
+    """external_school_db on MySQL, with connections reused from a mysql.connector pool"""
+
+    def __init__(self, config, pool_size=DB_POOL_SIZE):
+        import mysql.connector
+        from mysql.connector import pooling
+        
+        self.Error = mysql.connector.Error
+        self.pool = pooling.MySQLConnectionPool(pool_name='external_api_simulator', pool_size=pool_size, **config)
+        # The pool raises when empty; requests beyond pool_size wait for a connection instead
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+    def connect(self):
+        self._slots.acquire()
+        try:
+            return self.pool.get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def cursor(self, connection):
+        return connection.cursor(dictionary=True)
+
+    def sql(self, query):
+        return query
+
+    def param(self, value):
+        return value
+
+    def release(self, connection):
+        # close() on a pooled connection hands it back to the pool
+        try:
+            connection.close()
+        finally:
+            self._slots.release()
+
+    def fetch_rows(self, cursor, size=None):
+        return cursor.fetchmany(size) if size else cursor.fetchall()
+
+class SQLiteBackend:
+    """external_school_db in a SQLite file, one connection per server thread"""
+    
+    Error = sqlite3.Error
+    
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS fyp_data (
+        id_num INTEGER PRIMARY KEY AUTOINCREMENT,
+        id VARCHAR(50) NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        email VARCHAR(120) NOT NULL,
+        course VARCHAR(200) NOT NULL,
+        fyp_session VARCHAR(100) NOT NULL,
+        fyp_eligible BOOLEAN DEFAULT TRUE,
+        status VARCHAR(20) DEFAULT 'active',
+        role VARCHAR(50) DEFAULT 'student',
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_fyp_session_updated ON fyp_data (fyp_session, last_updated);
+    -- MySQL's ON UPDATE CURRENT_TIMESTAMP
+    CREATE TRIGGER IF NOT EXISTS fyp_data_touch AFTER UPDATE ON fyp_data
+    FOR EACH ROW WHEN NEW.last_updated = OLD.last_updated
+    BEGIN
+        UPDATE fyp_data SET last_updated = CURRENT_TIMESTAMP WHERE id_num = NEW.id_num;
+    END;
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        connection = self.connect()
+        connection.executescript(self.SCHEMA)
+        connection.commit()
+
+    def connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def cursor(self, connection):
+        return connection.cursor()
+
+    def sql(self, query):
+        return query.replace('%s', '?').replace('NOW()', 'CURRENT_TIMESTAMP')
+
+    def param(self, value):
+        # Stored timestamps are 'YYYY-MM-DD HH:MM:SS' text and compare as strings
+        return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+
+    def release(self, connection):
+        # Kept open for the thread's next request
+        pass
+
+    def fetch_rows(self, cursor, size=None):
+        rows = cursor.fetchmany(size) if size else cursor.fetchall()
+        return [dict(row) for row in rows]
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = SQLiteBackend(SQLITE_PATH) if SQLITE_PATH else MySQLBackend(DB_CONFIG)
+        return _backend
+
+def execute(backend, cursor, query, params=()):
+    cursor.execute(backend.sql(query), [backend.param(value) for value in params])
+
+def close_connection(backend, connection, cursor=None):
+    """Close the cursor and hand the connection back, even when closing the cursor fails"""
+    try:
+        if cursor is not None:
+            cursor.close()
+    finally:
+        backend.release(connection)
+
+def database_now(backend, cursor):
+    execute(backend, cursor, "SELECT NOW() AS sync_timestamp")
+    value = backend.fetch_rows(cursor)[0]['sync_timestamp']
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
 def validate_api_key():
     api_key = request.headers.get('X-API-Key')
     api_secret = request.headers.get('X-API-Secret')
@@ -43,12 +179,14 @@ def get_fyp_eligible_students():
     # Optional filters
     academic_period = request.args.get('academic_period')
     
+    backend = get_backend()
+    connection = cursor = None
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor(dictionary=True)
+        connection = backend.connect()
+        cursor = backend.cursor(connection)
         
         query = """
-        SELECT id, name, email, course, fyp_session, 
+        SELECT id, name, email, course, fyp_session,
                fyp_eligible, role, last_updated
         FROM fyp_data
         WHERE fyp_eligible = TRUE AND status = 'active'
@@ -58,19 +196,11 @@ def get_fyp_eligible_students():
         if academic_period:
             query += " AND fyp_session = %s"
             params.append(academic_period)
-            
-        query += " ORDER BY fyp_session, name"
         
-        cursor.execute(query, params)
-        students = cursor.fetchall()
-        
-        # Convert datetime to string for JSON serialization
-        for student in students:
-            if student['last_updated']:
-                student['last_updated'] = student['last_updated'].isoformat()
+        query += " ORDER BY fyp_session, name"
         
-        cursor.close()
-        connection.close()
+        execute(backend, cursor, query, params)
+        students = [serialize_student(student) for student in backend.fetch_rows(cursor)]
         
         return jsonify({
             'success': True,
@@ -79,50 +209,189 @@ def get_fyp_eligible_students():
             'school_code': 'UOW',
             'sync_timestamp': datetime.now().isoformat()
         })
-        
-    except mysql.connector.Error as e:
+    
+    except backend.Error as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        if connection is not None:
+            close_connection(backend, connection, cursor)
+
+# Largest page a client may ask for; rows per fetchmany() when streaming NDJSON
+MAX_PAGE_SIZE = 5000
+STREAM_BATCH_SIZE = 500
+
+def build_period_query(period, since=None, after_id=None):
+    """
+    SQL and params for one academic period, ordered by id_num so pages can resume from a cursor.
+    With `since`, only emails with a row changed since then (all their rows, tombstones flagged)
+    """
+    if since:
+        # >= because last_updated has one-second resolution; re-sending a row is harmless
+        query = """
+        SELECT f.id_num, f.id, f.name, f.email, f.course, f.fyp_session,
+               f.fyp_eligible, f.role, f.last_updated,
+               NOT (f.fyp_eligible = TRUE AND f.status = 'active') AS deleted
+        FROM fyp_data f
+        JOIN (
+            SELECT DISTINCT email FROM fyp_data
+            WHERE fyp_session = %s AND last_updated >= %s
+        ) changed ON changed.email = f.email
+        WHERE f.fyp_session = %s
+        """
+        params = [period, since, period]
+    else:
+        query = """
+        SELECT f.id_num, f.id, f.name, f.email, f.course, f.fyp_session,
+               f.fyp_eligible, f.role, f.last_updated
+        FROM fyp_data f
+        WHERE f.fyp_session = %s AND f.fyp_eligible = TRUE AND f.status = 'active'
+        """
+        params = [period]
+    
+    if after_id is not None:
+        query += " AND f.id_num > %s"
+        params.append(after_id)
+    query += " ORDER BY f.id_num"
+    return query, params
+
+def serialize_student(student):
+    student.pop('id_num', None)
+    last_updated = student['last_updated']
+    if last_updated:
+        # datetime from MySQL, 'YYYY-MM-DD HH:MM:SS' text from SQLite
+        student['last_updated'] = (last_updated.isoformat() if isinstance(last_updated, datetime)
+                                   else str(last_updated).replace(' ', 'T'))
+    student['fyp_eligible'] = bool(student['fyp_eligible'])
+    if 'deleted' in student:
+        student['deleted'] = bool(student['deleted'])
+    return student
 
 @app.route('/api/students/by-period/<period>', methods=['GET'])
 def get_students_by_period(period):
-    """Get students for specific academic period"""
+    """
+    Get students for specific academic period
+    With ?since=<sync_timestamp from an earlier response>, only emails with a row changed since
+    then are returned: all of their rows for the period, with inactive or ineligible rows flagged
+    `deleted` (tombstones), so the caller can apply the changes without the full roster
+    ?limit=N returns one page plus `next_cursor` to pass back as ?cursor= (null on the last page);
+    ?format=ndjson streams every record as one JSON object per line, metadata in X- headers
+    """
     
     is_valid, error = validate_api_key()
     if not is_valid:
         return jsonify({'error': error}), 401
     
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({'error': 'Invalid since timestamp'}), 400
+    
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        cursor = connection.cursor(dictionary=True)
+        limit = request.args.get('limit', type=int)
+        cursor_arg = request.args.get('cursor')
+        after_id = int(cursor_arg) if cursor_arg else None
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': f'limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+    
+    if request.args.get('format') == 'ndjson':
+        return stream_students_ndjson(period, since)
+    
+    backend = get_backend()
+    connection = cursor = None
+    try:
+        connection = backend.connect()
+        cursor = backend.cursor(connection)
         
-        cursor.execute("""
-        SELECT id, name, email, course, fyp_session, 
-               fyp_eligible, role, last_updated
-        FROM fyp_data 
-        WHERE fyp_session = %s AND fyp_eligible = TRUE AND status = 'active'
-        ORDER BY name
-        """, (period,))
+        # Taken before reading so rows changed during the query are picked up by the next delta
+        sync_timestamp = database_now(backend, cursor)
         
-        students = cursor.fetchall()
+        query, params = build_period_query(period, since, after_id)
+        if limit is not None:
+            # One extra row tells us whether another page follows
+            query += " LIMIT %s"
+            params.append(limit + 1)
+        execute(backend, cursor, query, params)
         
-        for student in students:
-            if student['last_updated']:
-                student['last_updated'] = student['last_updated'].isoformat()
+        students = backend.fetch_rows(cursor)
         
-        cursor.close()
-        connection.close()
+        next_cursor = None
+        if limit is not None and len(students) > limit:
+            students = students[:limit]
+            next_cursor = str(students[-1]['id_num'])
         
-        return jsonify({
+        students = [serialize_student(student) for student in students]
+        
+        response = {
             'success': True,
             'academic_period': period,
             'students': students,
-            'count': len(students)
-        })
-        
-    except mysql.connector.Error as e:
+            'count': len(students),
+            'sync_timestamp': sync_timestamp.isoformat(),
+            'next_cursor': next_cursor
+        }
+        if since:
+            response['since'] = since.isoformat()
+        return jsonify(response)
+    
+    except backend.Error as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+    finally:
+        if connection is not None:
+            close_connection(backend, connection, cursor)
+
+def stream_students_ndjson(period, since=None):
+    """NDJSON body read from the database in batches; a failure mid-stream ends with an error line"""
+    backend = get_backend()
+    connection = cursor = None
+    released = threading.Lock()
+
+    def release():
+        # Runs from the generator or, if the client left before it started, when the response closes
+        if connection is not None and released.acquire(blocking=False):
+            close_connection(backend, connection, cursor)
+
+    try:
+        connection = backend.connect()
+        cursor = backend.cursor(connection)
+        sync_timestamp = database_now(backend, cursor)
+        query, params = build_period_query(period, since)
+        execute(backend, cursor, query, params)
+    except backend.Error as e:
+        release()
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    except Exception:
+        release()
+        raise
+
+    def generate():
+        try:
+            while True:
+                rows = backend.fetch_rows(cursor, STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(serialize_student(row)) + '\n' for row in rows)
+        except backend.Error as e:
+            yield json.dumps({'error': f'Database error: {str(e)}'}) + '\n'
+        finally:
+            release()
+    
+    headers = {
+        'X-Academic-Period': period,
+        'X-Sync-Timestamp': sync_timestamp.isoformat()
+    }
+    if since:
+        headers['X-Since'] = since.isoformat()
+    response = Response(generate(), mimetype='application/x-ndjson', headers=headers)
+    response.call_on_close(release)
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -133,5 +402,81 @@ def health_check():
         'service': 'External School API Simulator'
     })
 
+# Synthetic data for load tests
+COURSES = ['Computer Science', 'Information Systems', 'Software Engineering', 'Data Science', 'Cyber Security']
+STAFF_ROLES = ['supervisor', 'assessor', 'supervisor, assessor']
+GENERATE_BATCH_SIZE = 5000
+
+def generate_fyp_rows(students, sessions, staff_ratio=0.05, inactive_ratio=0.01, seed=0):
+    """
+    Yield fyp_data rows for `students` students spread evenly over `sessions` fyp_session values
+    (2025-Sem1, 2025-Sem2, 2026-Sem1, ...). About `staff_ratio` of the people are staff, listed in
+    every session with a supervisor and/or assessor role, and `inactive_ratio` of the rows are
+    inactive so delta syncs see tombstones
+    """
+    rnd = random.Random(seed)
+    session_names = [f"{2025 + i // 2}-Sem{i % 2 + 1}" for i in range(sessions)]
+    staff = max(int(students * staff_ratio), 1)
+
+    def status():
+        return 'inactive' if rnd.random() < inactive_ratio else 'active'
+    
+    for i in range(students):
+        yield (f"ST{i:07d}", f"Student {i}", f"student{i}@example.edu", rnd.choice(COURSES),
+               session_names[i % sessions], True, status(), 'student')
+    for i in range(staff):
+        role = rnd.choice(STAFF_ROLES)
+        for session_name in session_names:
+            yield (f"SF{i:05d}", f"Staff {i}", f"staff{i}@example.edu", rnd.choice(COURSES),
+                   session_name, True, status(), role)
+
+def seed_database(students, sessions, replace=False, **options):
+    """Insert generated rows in batches; with `replace`, existing fyp_data rows are deleted first"""
+    backend = get_backend()
+    connection = backend.connect()
+    cursor = None
+    try:
+        cursor = backend.cursor(connection)
+        if replace:
+            execute(backend, cursor, "DELETE FROM fyp_data")
+        insert = backend.sql("""
+        INSERT INTO fyp_data (id, name, email, course, fyp_session, fyp_eligible, status, role)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """)
+        rows = generate_fyp_rows(students, sessions, **options)
+        total = 0
+        while True:
+            batch = [row for _, row in zip(range(GENERATE_BATCH_SIZE), rows)]
+            if not batch:
+                break
+            cursor.executemany(insert, batch)
+            total += len(batch)
+        connection.commit()
+        return total
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        close_connection(backend, connection, cursor)
+
+def main():
+    global SQLITE_PATH
+    parser = argparse.ArgumentParser(description='External school API simulator')
+    parser.add_argument('--port', type=int, default=5002)
+    parser.add_argument('--sqlite', metavar='PATH', help='serve from a SQLite file instead of MySQL')
+    parser.add_argument('--generate', type=int, metavar='N', help='seed N synthetic students before serving')
+    parser.add_argument('--sessions', type=int, default=2, metavar='M', help='fyp_session values to spread them over')
+    parser.add_argument('--replace', action='store_true', help='delete existing fyp_data rows before seeding')
+    parser.add_argument('--no-serve', action='store_true', help='seed and exit')
+    args = parser.parse_args()
+    
+    if args.sqlite:
+        SQLITE_PATH = args.sqlite
+    if args.generate:
+        count = seed_database(args.generate, args.sessions, replace=args.replace)
+        print(f"Inserted {count} rows across {args.sessions} sessions")
+    if not args.no_serve:
+        app.run(port=args.port, debug=True, threaded=True)  # Different port from your main app
+
 if __name__ == '__main__':
-    app.run(port=5002, debug=True)  # Different port from your main app
\ No newline at end of file
+    main()
@@ -21,7 +21,9 @@ CREATE TABLE fyp_data (
     fyp_eligible BOOLEAN DEFAULT TRUE,
     status VARCHAR(20) DEFAULT 'active',
     role VARCHAR(50) DEFAULT 'student',
-    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    -- Delta syncs ask for rows changed in a session since a timestamp
+    INDEX idx_fyp_session_updated (fyp_session, last_updated)
 );
 
 -- Insert sample data (5 roles)
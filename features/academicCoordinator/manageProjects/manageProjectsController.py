@@ -1,5 +1,9 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
 from shared.models import User, Timeframe, Project, db
+from shared.service.allocation_service import run_student_allocation
+from shared.service.allocation_scenarios import run_allocation_scenarios, MAX_SCENARIOS
+from shared.service.incremental_allocation import repair_allocation_after_change
+from shared.service.staff_allocation import run_staff_allocation
 from datetime import datetime
 import logging
 
@@ -245,6 +249,7 @@ def update_project(project_id):
                 return jsonify({'success': False, 'message': f'{name} capacity must be between 0 and 100'}), 400
         
         # Update project
+        capacity_changed = project.student_capacity != int(student_capacity)
         project.title = title
         project.description = description if description else None
         project.student_capacity = int(student_capacity)
@@ -253,6 +258,11 @@ def update_project(project_id):
         
         db.session.commit()
         
+        # Repair an existing allocation around the new capacity
+        if capacity_changed:
+            repair_allocation_after_change(project.timeframe_id, changed_project_ids=[project.id],
+                                           allocated_by=user_id)
+        
         return jsonify({
             'success': True,
             'message': 'Project updated successfully',
@@ -311,4 +321,142 @@ def delete_project(project_id):
     except Exception as e:
         db.session.rollback()
         logging.error(f"Error deleting project: {str(e)}")
-        return jsonify({'success': False, 'message': 'Failed to delete project'}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'message': 'Failed to delete project'}), 500
+
+@manage_projects_bp.route('/course-term/<int:timeframe_id>/run-allocation', methods=['POST'])
+def run_allocation(timeframe_id):
+    """
+    Run the automatic student allocation for a course term
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    user = User.query.get(user_id)
+    
+    if not user:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    # Check role
+    user_roles = [role.name for role in user.roles]
+    if 'academic coordinator' not in user_roles:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        Timeframe.query.get_or_404(timeframe_id)
+        
+        # Verify user access
+        user_timeframes_ids = [tf.id for tf in user.timeframes]
+        if timeframe_id not in user_timeframes_ids:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+        
+        summary = run_student_allocation(timeframe_id, allocated_by=user_id)
+        db.session.commit()
+        
+        summary['message'] = (f"Allocated {summary['allocated']} students, "
+                              f"{summary['unallocated']} need manual allocation")
+        return jsonify(summary)
+    
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error running allocation: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to run allocation'}), 500
+
+
+@manage_projects_bp.route('/course-term/<int:timeframe_id>/run-staff-allocation', methods=['POST'])
+def run_staff_allocation_route(timeframe_id):
+    """
+    Assign supervisors and assessors to the projects of a course term
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    user = User.query.get(user_id)
+    
+    if not user:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    # Check role
+    user_roles = [role.name for role in user.roles]
+    if 'academic coordinator' not in user_roles:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        Timeframe.query.get_or_404(timeframe_id)
+        
+        # Verify user access
+        user_timeframes_ids = [tf.id for tf in user.timeframes]
+        if timeframe_id not in user_timeframes_ids:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+        
+        summary = run_staff_allocation(timeframe_id, allocated_by=user_id)
+        db.session.commit()
+        
+        summary['message'] = (f"Assigned {summary['supervisors_assigned']} supervisors and "
+                              f"{summary['assessors_assigned']} assessors; "
+                              f"{summary['open_supervisor_slots']} supervisor and "
+                              f"{summary['open_assessor_slots']} assessor slots remain open")
+        return jsonify(summary)
+    
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error running staff allocation: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to run staff allocation'}), 500
+
+
+@manage_projects_bp.route('/course-term/<int:timeframe_id>/allocation-scenarios', methods=['POST'])
+def allocation_scenarios(timeframe_id):
+    """
+    Compare what-if capacity / preference limit variants without saving an allocation
+    """
+    if 'user_id' not in session:
+        return jsonify({'success': False, 'message': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    user = User.query.get(user_id)
+    
+    if not user:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    
+    # Check role
+    user_roles = [role.name for role in user.roles]
+    if 'academic coordinator' not in user_roles:
+        return jsonify({'success': False, 'message': 'Access denied'}), 403
+    
+    try:
+        Timeframe.query.get_or_404(timeframe_id)
+        
+        # Verify user access
+        user_timeframes_ids = [tf.id for tf in user.timeframes]
+        if timeframe_id not in user_timeframes_ids:
+            return jsonify({'success': False, 'message': 'Access denied'}), 403
+        
+        scenarios = (request.json or {}).get('scenarios', [])
+        if not isinstance(scenarios, list) or not scenarios:
+            return jsonify({'success': False, 'message': 'At least one scenario is required'}), 400
+        if len(scenarios) > MAX_SCENARIOS:
+            return jsonify({'success': False, 'message': f'At most {MAX_SCENARIOS} scenarios are allowed'}), 400
+        
+        # Validate with the same bounds as project and preference limit edits
+        for scenario in scenarios:
+            if not isinstance(scenario, dict):
+                return jsonify({'success': False, 'message': 'Each scenario must be an object'}), 400
+            if not isinstance(scenario.get('student_capacity') or {}, dict):
+                return jsonify({'success': False, 'message': 'Scenario student_capacity must map project ids to capacities'}), 400
+            preference_limit = scenario.get('preference_limit')
+            if preference_limit is not None:
+                if not str(preference_limit).isdigit() or not 1 <= int(preference_limit) <= 10:
+                    return jsonify({'success': False, 'message': 'Preference limit must be between 1 and 10'}), 400
+                scenario['preference_limit'] = int(preference_limit)
+            for capacity in (scenario.get('student_capacity') or {}).values():
+                if not str(capacity).isdigit() or int(capacity) > 100:
+                    return jsonify({'success': False, 'message': 'Student capacity must be between 0 and 100'}), 400
+        
+        return jsonify(run_allocation_scenarios(timeframe_id, scenarios))
+    
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error running allocation scenarios: {str(e)}")
+        return jsonify({'success': False, 'message': 'Failed to run allocation scenarios'}), 500
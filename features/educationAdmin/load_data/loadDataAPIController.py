@@ -1,12 +1,22 @@
 import requests
-from flask import Blueprint, request, jsonify, flash, redirect, url_for, session
+from flask import Blueprint, request, jsonify, flash, redirect, url_for, session, current_app
 from database import db
-from shared.models import User, Role, Timeframe, ExternalAPIConfig, School
-from werkzeug.security import generate_password_hash
-from datetime import datetime
+from shared.models import (
+    User, Role, Timeframe, ExternalAPIConfig, ExternalSyncState, SyncRunLog, School, UserSyncFingerprint
+)
+from datetime import datetime, timedelta
+import hashlib
+import json
 import logging
-import secrets
-import string
+from shared.service.password_hashing import unusable_password_hash
+from shared.utils.bulk_helpers import chunked
+from shared.service.external_api_client import ExternalAPIError, ExternalRosterResponse, get_session
+from shared.service.external_roles import ExternalRoleIndex, ExternalRolePrefetcher, parse_roles
+from shared.service.external_sync_diff import DIFF_ACTIONS, compute_external_sync_diff
+from shared.utils.ttl_cache import TTLCache
+from shared.service.import_jobs import (
+    EXTERNAL_SYNC_JOB, ImportJobError, checkpoint, enqueue_job, register_job_handler, report_progress
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,13 +28,23 @@ from sqlalchemy import and_
 
 load_data_api_bp = Blueprint('load_data_api', __name__)
 
-# Import the passwords dictionary from the main controller - now no circular import
-from features.educationAdmin.load_data.loadDataController import passwords_for_email
+from features.educationAdmin.load_data.loadDataController import invalidate_external_roster_cache
 
-def generate_random_password(length=12):
-    """Generate a secure random password"""
-    characters = string.ascii_letters + string.digits + string.punctuation
-    return ''.join(secrets.choice(characters) for _ in range(length))
+# Users between progress reports from a background sync
+SYNC_PROGRESS_INTERVAL = 100
+
+# 'auto' runs a delta when a high-water mark exists, otherwise (or when a reconcile is due) a full sync
+EXTERNAL_SYNC_MODES = ('auto', 'delta', 'full')
+DEFAULT_FULL_RECONCILE_HOURS = 168
+
+# Users applied per commit by a background sync (EXTERNAL_SYNC_COMMIT_EVERY); 0 = one transaction
+DEFAULT_SYNC_COMMIT_EVERY = 500
+
+# Dry-run diffs kept while an admin pages through them, keyed by (school_id, timeframe_id)
+SYNC_DIFF_CACHE_TTL = 300  # seconds
+SYNC_DIFF_PAGE_SIZE = 100
+SYNC_DIFF_MAX_PAGE_SIZE = 1000
+sync_diff_cache = TTLCache(maxsize=16, ttl=SYNC_DIFF_CACHE_TTL)
 
 def _get_or_create_role(role_name: str):
     """Helper function to get or create a role"""
@@ -150,11 +170,28 @@ def fetch_external_data_via_api(api_config, academic_period):
     """
     Fetch eligible students from external API for specific academic period
     """
+    response = fetch_external_changes_via_api(api_config, academic_period)
+    if not response:
+        return []
+    try:
+        return list(response)
+    except (ExternalAPIError, requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error reading external API response: {e}")
+        return []
+
+def fetch_external_changes_via_api(api_config, academic_period, since=None):
+    """
+    Open the roster for an academic period, or with `since` (an earlier response's sync_timestamp)
+    only the records of emails changed since then, tombstones included.
+    Returns an ExternalRosterResponse that reads further pages as it is iterated, or None if the
+    API could not be reached. Its `delta` is False when the API answered with the full roster
+    (e.g. it ignores `since`)
+    """
     try:
         # Parse API configuration
         config = get_external_api_config(api_config)
         if not config:
-            return []
+            return None
         
         api_key, api_secret, base_url = config
         
@@ -165,31 +202,34 @@ def fetch_external_data_via_api(api_config, academic_period):
             'Content-Type': 'application/json'
         }
         
-        # Make API request
-        api_url = f"{base_url}/api/students/by-period/{academic_period}"
-        logger.info(f"Making API request to: {api_url}")
-        
-        response = requests.get(api_url, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                students = data.get('students', [])
-                logger.info(f"Successfully fetched {len(students)} students from external API")
-                return students
-            else:
-                logger.error(f"API returned success=False: {data}")
-                return []
-        else:
-            logger.error(f"API request failed with status {response.status_code}: {response.text}")
-            return []
+        logger.info(f"Making API request to: {base_url} for {academic_period}" + (f" (changes since {since})" if since else ""))
+        return ExternalRosterResponse(base_url, headers, academic_period, since=since,
+                                      session=get_session(api_config.school_id))
         
+    except ExternalAPIError as e:
+        logger.error(str(e))
+        return None
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error when calling external API: {e}")
-        return []
+        return None
     except Exception as e:
         logger.error(f"Unexpected error fetching from external API: {e}")
-        return []
+        return None
+
+def external_sync_mode(sync_state, requested_mode='auto'):
+    """
+    'full' or 'delta' for a sync of the timeframe whose ExternalSyncState is `sync_state`.
+    Deltas need a high-water mark; 'auto' also falls back to a full reconcile once the last one is
+    older than EXTERNAL_SYNC_FULL_RECONCILE_HOURS, which catches rows deleted outright upstream
+    """
+    if requested_mode == 'full' or not sync_state or not sync_state.high_water_mark or not sync_state.last_full_sync_at:
+        return 'full'
+    if requested_mode == 'delta':
+        return 'delta'
+    reconcile_hours = current_app.config.get('EXTERNAL_SYNC_FULL_RECONCILE_HOURS', DEFAULT_FULL_RECONCILE_HOURS)
+    if datetime.utcnow() - sync_state.last_full_sync_at >= timedelta(hours=reconcile_hours):
+        return 'full'
+    return 'delta'
 
 def test_external_api_connection(api_config):
     """
@@ -210,7 +250,7 @@ def test_external_api_connection(api_config):
         }
         
         # Test with health check endpoint
-        response = requests.get(f"{base_url}/api/health", headers=headers, timeout=10)
+        response = get_session(api_config.school_id).get(f"{base_url}/api/health", headers=headers, timeout=10)
         
         if response.status_code == 200:
             return True, "Connection successful"
@@ -222,10 +262,12 @@ def test_external_api_connection(api_config):
     except Exception as e:
         return False, f"Error: {str(e)}"
 
-def create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_mappings=None):
+def create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_mappings=None,
+                                     role_prefetcher=None):
     """
     Create new user or update existing user with external data supporting multiple roles
     This mirrors the Excel controller's ability to handle multiple roles per user
+    `role_prefetcher` is an ExternalRolePrefetcher shared across one import
     Returns (user, created_flag, roles_processed)
     """
     try:
@@ -294,7 +336,7 @@ def create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_m
             
             # Get roles this user should have in other timeframes
             roles_needed_in_other_timeframes = get_user_roles_in_other_timeframes(
-                existing_user, timeframe, school_id
+                existing_user, timeframe, school_id, role_prefetcher
             )
             
             # Start with roles needed in other timeframes
@@ -327,17 +369,11 @@ def create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_m
             return existing_user, False, roles_processed
             
         else:
-            # Create NEW user - ONLY generate password for truly new users
-            temp_password = generate_random_password()
-            passwords_for_email[email] = temp_password
-            
-            # Generate hash for database storage
-            password_hash = generate_password_hash(temp_password)
-            
+            # Create NEW user - the password is issued with their welcome email
             new_user = User(
                 name=name.strip() if name else '',
                 email=email,
-                password_hash=password_hash,
+                password_hash=unusable_password_hash(),
                 course=course.strip() if course else '',
                 student_staff_id=str(student_id).strip() if student_id else '',
                 school_id=school_id,
@@ -370,6 +406,25 @@ def create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_m
         logger.error(f"Error creating/updating user with multi-role data {user_data}: {e}")
         return None, False, []
 
+def external_user_fingerprint(user_data, school_id, field_mappings):
+    """
+    sha256 of the external fields a sync applies to a user (normalised the way
+    create_or_update_user_multi_role stores them); equal fingerprints mean nothing to write
+    """
+    mappings = field_mappings
+    name = user_data.get(mappings['name'])
+    course = user_data.get(mappings['course'])
+    student_id = user_data.get(mappings['id'])
+    roles = parse_roles(user_data.get(mappings.get('roles', 'roles')) or user_data.get(mappings.get('role', 'role')))
+    fields = [
+        name.strip() if name else None,
+        course.strip() if course else None,
+        str(student_id).strip() if student_id else None,
+        sorted(roles),
+        school_id,
+    ]
+    return hashlib.sha256(json.dumps(fields, separators=(',', ':')).encode('utf-8')).hexdigest()
+
 def create_or_update_user(user_data, school_id, timeframe_id, field_mappings=None):
     """
     Legacy function for backward compatibility - now uses multi-role function
@@ -377,58 +432,49 @@ def create_or_update_user(user_data, school_id, timeframe_id, field_mappings=Non
     user, created, roles_processed = create_or_update_user_multi_role(user_data, school_id, timeframe_id, field_mappings)
     return user, created
 
-def get_user_roles_in_other_timeframes(user, current_timeframe, school_id):
+def get_user_roles_in_other_timeframes(user, current_timeframe, school_id, role_prefetcher=None):
     """
     Get roles that this user needs in their other timeframes (not the current one being processed)
+    Pass the import's ExternalRolePrefetcher so each other period is fetched once per import
+    rather than once per user
     """
     try:
-        # Get API config to fetch external data
-        api_config = ExternalAPIConfig.query.filter_by(
-            school_id=school_id,
-            is_active=True
-        ).first()
-        
-        if not api_config:
-            # If no API config, return current roles as fallback
-            return user.roles
-        
-        field_mappings = get_field_mappings_from_config(api_config)
-        
-        # Get all other timeframes this user is in (excluding current one)
-        other_timeframes = [tf for tf in user.timeframes if tf.id != current_timeframe.id]
-        
-        required_roles = set()
-        
-        for timeframe in other_timeframes:
-            # Fetch external data for this timeframe
-            external_data = fetch_external_data_via_api(api_config, timeframe.name)
+        if role_prefetcher is None:
+            # Get API config to fetch external data
+            api_config = ExternalAPIConfig.query.filter_by(
+                school_id=school_id,
+                is_active=True
+            ).first()
             
-            # Find this user's role in this timeframe
-            user_roles_in_timeframe = get_user_roles_for_specific_timeframe_multi_role(
-                user.email, timeframe.name, external_data, field_mappings
-            )
+            if not api_config:
+                # If no API config, return current roles as fallback
+                return user.roles
             
-            # Add these roles to required set
-            for role_name in user_roles_in_timeframe:
-                role = Role.query.filter_by(name=role_name.lower().strip()).first()
-                if role:
-                    required_roles.add(role)
+            role_prefetcher = ExternalRolePrefetcher(
+                api_config, get_field_mappings_from_config(api_config), fetch_external_data_via_api
+            )
+        
+        # Get all other timeframes this user is in (excluding current one)
+        other_timeframes = [tf.name for tf in user.timeframes if tf.id != current_timeframe.id]
         
-        return list(required_roles)
+        # Answered from the prefetched email -> timeframe -> roles index
+        required_role_names = role_prefetcher.roles_in(user.email, other_timeframes)
+        return role_prefetcher.role_objects(sorted(required_role_names))
         
     except Exception as e:
         logger.error(f"Error getting user roles in other timeframes: {e}")
         # Fallback: return current roles to avoid data loss
         return user.roles
 
-def cleanup_user_roles_after_timeframe_removal(user, removed_timeframe, external_data, field_mappings):
+def cleanup_user_roles_after_timeframe_removal(user, removed_timeframe, external_data, field_mappings, external_index=None):
     """
     Clean up user roles after removing them from a timeframe.
     Only removes roles that are not needed in other timeframes.
+    `external_index` is the sync's ExternalRoleIndex over external_data; built here if not given
     """
     try:
         # Get all timeframes this user is still in
-        remaining_timeframes = user.timeframes
+        remaining_timeframes = list(user.timeframes)
         
         if not remaining_timeframes:
             # User is not in any timeframes, clear all roles
@@ -436,50 +482,20 @@ def cleanup_user_roles_after_timeframe_removal(user, removed_timeframe, external
             logger.info(f"Cleared all roles for {user.email} - not in any timeframes")
             return
         
-        # Get field mappings
-        email_field = field_mappings.get('email', 'email')
-        roles_field = field_mappings.get('roles', 'roles')
-        role_field = field_mappings.get('role', 'role')
-        timeframe_field = field_mappings.get('timeframe', 'fyp_session')
+        if external_index is None:
+            external_index = ExternalRoleIndex.from_records(external_data, field_mappings)
         
         # Find what roles this user should have in their remaining timeframes
-        required_roles = set()
-        
-        for user_data in external_data:
-            user_email = user_data.get(email_field)
-            user_timeframe = user_data.get(timeframe_field)
-            
-            if (user_email and user_email.lower().strip() == user.email.lower() and
-                user_timeframe):
-                
-                # Check if this role is for one of the user's remaining timeframes
-                for remaining_tf in remaining_timeframes:
-                    if remaining_tf.name == user_timeframe:
-                        # Extract roles for this timeframe
-                        roles_data = user_data.get(roles_field) or user_data.get(role_field)
-                        if roles_data:
-                            if isinstance(roles_data, str):
-                                roles = [role.strip().lower() for role in roles_data.split(',')]
-                            elif isinstance(roles_data, list):
-                                roles = [str(role).strip().lower() for role in roles_data]
-                            else:
-                                roles = [str(roles_data).strip().lower()]
-                            
-                            for role in roles:
-                                if role:
-                                    required_roles.add(role)
-                        break
+        required_roles = external_index.roles_in(user.email, [tf.name for tf in remaining_timeframes])
         
         # Remove roles that are no longer required
-        current_role_names = {role.name.lower() for role in user.roles}
+        current_roles = list(user.roles)
+        current_role_names = {role.name.lower() for role in current_roles}
         roles_to_remove = current_role_names - required_roles
         
         if roles_to_remove:
             # Remove the specific roles that are no longer needed
-            roles_to_keep = []
-            for role in user.roles:
-                if role.name.lower() not in roles_to_remove:
-                    roles_to_keep.append(role)
+            roles_to_keep = [role for role in current_roles if role.name.lower() not in roles_to_remove]
             
             user.roles = roles_to_keep
             logger.info(f"Removed roles {roles_to_remove} from {user.email} after timeframe removal")
@@ -489,41 +505,16 @@ def cleanup_user_roles_after_timeframe_removal(user, removed_timeframe, external
     except Exception as e:
         logger.error(f"Error cleaning up roles for user {user.email}: {e}")
 
-def get_user_roles_for_specific_timeframe_multi_role(user_email, timeframe_name, external_data, field_mappings):
+def get_user_roles_for_specific_timeframe_multi_role(user_email, timeframe_name, external_data, field_mappings,
+                                                     external_index=None):
     """
     Enhanced version that supports multiple roles per user per timeframe
+    Pass an ExternalRoleIndex built once over external_data to avoid rescanning it per user
     """
     try:
-        email_field = field_mappings.get('email', 'email')
-        roles_field = field_mappings.get('roles', 'roles')
-        role_field = field_mappings.get('role', 'role')  # Fallback
-        timeframe_field = field_mappings.get('timeframe', 'fyp_session')
-        
-        all_roles_for_timeframe = []
-        
-        for user_data in external_data:
-            external_email = user_data.get(email_field)
-            external_timeframe = user_data.get(timeframe_field)
-            
-            if (external_email and external_email.lower().strip() == user_email.lower() and
-                external_timeframe == timeframe_name):
-                
-                # Try to get roles from multiple role field first, then single role
-                roles_data = user_data.get(roles_field) or user_data.get(role_field)
-                
-                if roles_data:
-                    if isinstance(roles_data, str):
-                        roles = [role.strip() for role in roles_data.split(',')]
-                    elif isinstance(roles_data, list):
-                        roles = [str(role).strip() for role in roles_data]
-                    else:
-                        roles = [str(roles_data).strip()]
-                    
-                    for role in roles:
-                        if role and role not in all_roles_for_timeframe:
-                            all_roles_for_timeframe.append(role)
-        
-        return all_roles_for_timeframe
+        if external_index is None:
+            external_index = ExternalRoleIndex.from_records(external_data, field_mappings)
+        return external_index.roles_for(user_email, timeframe_name)
         
     except Exception as e:
         logger.error(f"Error getting multi-roles for user {user_email} in timeframe {timeframe_name}: {e}")
@@ -535,12 +526,26 @@ def get_user_roles_for_specific_timeframe(user_email, timeframe_name, external_d
     """
     return get_user_roles_for_specific_timeframe_multi_role(user_email, timeframe_name, external_data, field_mappings)
 
-def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id, field_mappings=None):
+def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id, field_mappings=None, progress=None,
+                                         delta=False, commit_chunk=None, commit_every=DEFAULT_SYNC_COMMIT_EVERY):
     """
     Enhanced synchronization supporting multiple roles per user
     This mirrors the Excel controller's multi-role functionality
     NOW ALSO CREATES ROLE-SCOPED ASSIGNMENTS in user_role_timeframes
-    Returns (created, updated, removed, assigned, errors, total_roles_processed)
+    `progress`, if given, is called as progress(users_processed) while users are processed
+    With `delta`, external_data holds only changed emails (all their rows, tombstones flagged
+    `deleted`) and only those emails can be removed; otherwise it is the full roster
+    external_data may be any iterable (e.g. a paged API response); it is read once, as it arrives,
+    and applied every `commit_every` users of the timeframe, so only one chunk of records is held
+    at a time besides the email -> roles index. An email whose records straddle two chunks is
+    applied again, with the roles gathered so far, when its later records add roles
+    Members whose external fields hash to the fingerprint stored by the previous sync are skipped
+    without touching their rows
+    Each user is applied in a savepoint, so a failing user is rolled back alone and counted as an
+    error. With `commit_chunk`, it is called as commit_chunk(users_processed, counts) after each
+    chunk but the last and must commit; fingerprints are written in the same commit, so a
+    sync interrupted between chunks skips the users already applied when it runs again
+    Returns (created, updated, removed, assigned, errors, total_roles_processed, skipped)
     """
     try:
         timeframe = Timeframe.query.get(timeframe_id)
@@ -560,50 +565,9 @@ def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id,
             'timeframe': 'fyp_session'
         }
         
-        # Group external data by email for this timeframe
-        external_users = {}
         timeframe_field = mappings.get('timeframe', 'fyp_session')
-        
-        for user_data in external_data:
-            # Check if this record belongs to the current timeframe
-            user_timeframe = user_data.get(timeframe_field)
-            if user_timeframe and user_timeframe == timeframe.name:
-                email_field = mappings['email']
-                if email_field in user_data and user_data[email_field]:
-                    email = user_data[email_field].lower().strip()
-                    
-                    # Aggregate multiple role entries for the same user
-                    if email not in external_users:
-                        external_users[email] = {
-                            'user_data': user_data.copy(),
-                            'all_roles': []
-                        }
-                    
-                    # Extract roles from this record
-                    roles_data = user_data.get(mappings.get('roles', 'roles')) or user_data.get(mappings.get('role', 'role'))
-                    if roles_data:
-                        if isinstance(roles_data, str):
-                            roles = [role.strip().lower() for role in roles_data.split(',')]
-                        elif isinstance(roles_data, list):
-                            roles = [str(role).strip().lower() for role in roles_data]
-                        else:
-                            roles = [str(roles_data).strip().lower()]
-                        
-                        # Add roles to the user's total roles
-                        for role in roles:
-                            if role and role not in external_users[email]['all_roles']:
-                                external_users[email]['all_roles'].append(role)
-        
-        # Create consolidated user data with all roles
-        consolidated_external_users = {}
-        for email, user_info in external_users.items():
-            consolidated_data = user_info['user_data'].copy()
-            # Set the consolidated roles
-            consolidated_data[mappings.get('roles', 'roles')] = user_info['all_roles']
-            consolidated_external_users[email] = consolidated_data
-        
-        external_emails = set(consolidated_external_users.keys())
-        logger.info(f"DEBUG: Found {len(external_emails)} unique users in external data for timeframe {timeframe.name}")
+        email_field = mappings['email']
+        roles_field = mappings.get('roles', 'roles')
         
         # Get current users assigned to this timeframe from the same school
         current_users_in_timeframe = User.query.join(User.timeframes).filter(
@@ -611,9 +575,15 @@ def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id,
             User.school_id == school_id
         ).all()
         
-        current_emails = {user.email.lower() for user in current_users_in_timeframe}
+        current_users_by_email = {user.email.lower(): user for user in current_users_in_timeframe}
+        current_emails = set(current_users_by_email)
         logger.info(f"DEBUG: Found {len(current_emails)} current users in timeframe {timeframe.name}")
         
+        # Skip members whose external fields are unchanged since the last sync of this timeframe
+        stored_fingerprints = {
+            row.user_id: row for row in UserSyncFingerprint.query.filter_by(timeframe_id=timeframe_id)
+        }
+        
         # Track changes
         created_count = 0
         updated_count = 0
@@ -621,60 +591,173 @@ def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id,
         assigned_count = 0
         error_count = 0
         total_roles_processed = 0
+        skipped_count = 0
+        users_processed = 0
         
-        # 1. Process users from external data (create/update/assign)
-        for email, user_data in consolidated_external_users.items():
-            try:
-                logger.info(f"DEBUG: Processing user {email} with roles {user_data.get(mappings.get('roles', 'roles'))}")
-                
-                user, created, roles_processed = create_or_update_user_multi_role(
-                    user_data, school_id, timeframe_id, field_mappings
-                )
+        # Other academic periods' rosters, fetched at most once per period for the whole import
+        role_prefetcher = None
+        api_config = ExternalAPIConfig.query.filter_by(school_id=school_id, is_active=True).first()
+        if api_config:
+            role_prefetcher = ExternalRolePrefetcher(
+                api_config, get_field_mappings_from_config(api_config), fetch_external_data_via_api
+            )
+        
+        # email -> timeframe -> roles over the live records read so far. Records themselves are kept
+        # only until their chunk is applied, so this index is the one structure that grows with the roster
+        external_index = ExternalRoleIndex(mappings)
+        # Live emails of this timeframe handled so far -> number of roles they were handled with
+        handled_role_counts = {}
+        # Emails a delta reports on; the ones left without live records below are removals
+        changed_emails = set()
+        
+        def save_fingerprints(applied_users, fingerprints):
+            # Remember what was applied so later syncs skip these users while they are unchanged
+            for email, user in applied_users:
+                stored = stored_fingerprints.get(user.id)
+                if stored is None:
+                    stored = UserSyncFingerprint(user_id=user.id, timeframe_id=timeframe_id)
+                    db.session.add(stored)
+                    stored_fingerprints[user.id] = stored
+                stored.fingerprint = fingerprints[email]
+        
+        def apply_chunk(first_records):
+            # Create/update/assign the users of one chunk; each email's first record supplies profile fields
+            nonlocal created_count, updated_count, assigned_count, error_count, total_roles_processed, \
+                skipped_count, users_processed
+            
+            # Consolidate each user's roles in this timeframe and drop the users that are unchanged
+            fingerprints = {}
+            changed_external_users = {}
+            for email, user_data in first_records.items():
+                roles = external_index.roles_for(email, timeframe.name)
+                # Set when the email's records straddle chunks: it is applied again only if they added roles
+                previous = handled_role_counts.get(email)
+                if previous is not None and previous >= len(roles):
+                    continue
+                handled_role_counts[email] = len(roles)
+                consolidated_data = user_data.copy()
+                consolidated_data[roles_field] = roles
+                fingerprints[email] = external_user_fingerprint(consolidated_data, school_id, mappings)
+                member = current_users_by_email.get(email)
+                stored = stored_fingerprints.get(member.id) if member is not None else None
+                if stored is not None and stored.fingerprint == fingerprints[email]:
+                    if previous is None:
+                        skipped_count += 1
+                    continue
+                changed_external_users[email] = (consolidated_data, previous)
+            
+            existing_emails = set()
+            for chunk in chunked(list(changed_external_users)):
+                existing_emails.update(email for (email,) in db.session.query(User.email).filter(User.email.in_(chunk)))
+            
+            if role_prefetcher is not None:
+                # Every other period these existing users are in, fetched in parallel before the loop
+                other_periods = set()
+                for chunk in chunked(list(existing_emails)):
+                    other_periods.update(name for (name,) in db.session.query(Timeframe.name).join(
+                        user_timeframes, user_timeframes.c.timeframe_id == Timeframe.id
+                    ).join(User, User.id == user_timeframes.c.user_id).filter(
+                        User.email.in_(chunk), Timeframe.id != timeframe_id
+                    ).distinct())
+                role_prefetcher.prefetch(other_periods)
+            
+            applied_users = []
+            for email, (user_data, previous) in changed_external_users.items():
+                if progress and users_processed % SYNC_PROGRESS_INTERVAL == 0:
+                    progress(users_processed)
+                users_processed += 1
+                try:
+                    logger.info(f"DEBUG: Processing user {email} with roles {user_data.get(roles_field)}")
+                    
+                    # Everything written for this user is undone together if any of it fails
+                    with db.session.begin_nested():
+                        user, created, roles_processed = create_or_update_user_multi_role(
+                            user_data, school_id, timeframe_id, field_mappings,
+                            role_prefetcher=role_prefetcher
+                        )
+                        if not user:
+                            raise ValueError(f"External record for {email} could not be applied")
+                        
+                        # LEGACY: Assign user to timeframe if not already assigned
+                        newly_assigned = timeframe not in user.timeframes
+                        if newly_assigned:
+                            user.timeframes.append(timeframe)
+                            logger.info(f"Assigned user {user.email} to timeframe {timeframe.name}")
+                        
+                        # NEW: Also create role-scoped assignments for EACH role
+                        for role_name in roles_processed:
+                            logger.info(f"DEBUG: About to call assign_user_role_timeframe for {user.email}, role={role_name}, timeframe={timeframe.name}")
+                            assign_user_role_timeframe(user, role_name, timeframe)
+                            logger.info(f"Created role-scoped assignment: {user.email} as {role_name} in {timeframe.name}")
+                        
+                except Exception as e:
+                    logger.error(f"Error processing user data: {e}")
+                    error_count += 1
+                    continue
                 
-                if user:
+                if previous is None:
                     if created:
                         created_count += 1
                     else:
                         updated_count += 1
-                    
                     total_roles_processed += len(roles_processed)
-                    
-                    # LEGACY: Assign user to timeframe if not already assigned
-                    if timeframe not in user.timeframes:
-                        user.timeframes.append(timeframe)
-                        assigned_count += 1
-                        logger.info(f"Assigned user {user.email} to timeframe {timeframe.name}")
-                    
-                    # NEW: Also create role-scoped assignments for EACH role
-                    for role_name in roles_processed:
-                        logger.info(f"DEBUG: About to call assign_user_role_timeframe for {user.email}, role={role_name}, timeframe={timeframe.name}")
-                        assign_user_role_timeframe(user, role_name, timeframe)
-                        logger.info(f"Created role-scoped assignment: {user.email} as {role_name} in {timeframe.name}")
-                    
-                    logger.info(f"Processed {len(roles_processed)} roles for user {user.email}: {roles_processed}")
                 else:
-                    error_count += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing user data: {e}")
-                error_count += 1
+                    # Counted when an earlier chunk applied it; only the roles added since are new
+                    total_roles_processed += len(roles_processed) - previous
+                if newly_assigned:
+                    assigned_count += 1
+                logger.info(f"Processed {len(roles_processed)} roles for user {user.email}: {roles_processed}")
+                applied_users.append((email, user))
+            
+            save_fingerprints(applied_users, fingerprints)
+        
+        # 1. Read the external data once, applying (and, with commit_chunk, committing) every
+        # `commit_every` users of this timeframe as they arrive
+        chunk_records = {}
+        for user_data in external_data:
+            # Check if this record belongs to the current timeframe
+            email = user_data.get(email_field)
+            in_timeframe = user_data.get(timeframe_field) == timeframe.name and email
+            if in_timeframe:
+                email = email.lower().strip()
+                if delta:
+                    changed_emails.add(email)
+            # Tombstones (inactive or ineligible upstream) only tell us a record went away
+            if user_data.get('deleted'):
+                continue
+            external_index.add_record(user_data)
+            if not in_timeframe:
                 continue
+            chunk_records.setdefault(email, user_data)
+            if commit_every and len(chunk_records) >= commit_every:
+                apply_chunk(chunk_records)
+                chunk_records = {}
+                if commit_chunk:
+                    commit_chunk(users_processed, {
+                        'created': created_count, 'updated': updated_count,
+                        'errors': error_count, 'skipped': skipped_count
+                    })
+        # The last chunk is committed by the caller, together with the removals below
+        apply_chunk(chunk_records)
+        logger.info(f"DEBUG: Found {len(handled_role_counts)} unique users in external data for timeframe {timeframe.name}")
+        logger.info(f"Skipped {skipped_count} unchanged users in timeframe {timeframe.name}")
         
         # Check what's in the user_role_timeframes table before commit
         role_assignments_count = db.session.query(user_role_timeframes).count()
         logger.info(f"DEBUG: Total role assignments in user_role_timeframes table before commit: {role_assignments_count}")
         
         # 2. Handle users who are no longer in external data for this timeframe
-        emails_to_remove = current_emails - external_emails
+        if delta:
+            emails_to_remove = (current_emails & changed_emails) - handled_role_counts.keys()
+        else:
+            emails_to_remove = current_emails - handled_role_counts.keys()
         
         for email in emails_to_remove:
             try:
-                user = User.query.filter(
-                    User.email.ilike(email),
-                    User.school_id == school_id
-                ).first()
+                # Loaded above from this timeframe's members in the same school
+                user = current_users_by_email.get(email)
                 
-                if user and timeframe in user.timeframes:
+                if user:
                     # Remove user from this timeframe (legacy)
                     user.timeframes.remove(timeframe)
                     removed_count += 1
@@ -691,8 +774,12 @@ def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id,
                     )
                     logger.info(f"Removed role-scoped assignments for {user.email} in {timeframe.name}")
                     
+                    # A user who rejoins later is processed in full again
+                    if user.id in stored_fingerprints:
+                        db.session.delete(stored_fingerprints[user.id])
+                    
                     # SMART ROLE CLEANUP: Remove roles that are no longer needed
-                    cleanup_user_roles_after_timeframe_removal(user, timeframe, external_data, mappings)
+                    cleanup_user_roles_after_timeframe_removal(user, timeframe, (), mappings, external_index)
                     
                     # If user is not in any timeframes anymore, clear all roles
                     if not user.timeframes:
@@ -704,7 +791,7 @@ def sync_users_with_timeframe_multi_role(external_data, school_id, timeframe_id,
                 error_count += 1
                 continue
         
-        return created_count, updated_count, removed_count, assigned_count, error_count, total_roles_processed
+        return created_count, updated_count, removed_count, assigned_count, error_count, total_roles_processed, skipped_count
         
     except Exception as e:
         logger.error(f"Error in sync_users_with_timeframe_multi_role: {e}")
@@ -714,7 +801,7 @@ def sync_users_with_timeframe_smart(external_data, school_id, timeframe_id, fiel
     """
     Legacy function for backward compatibility - now uses multi-role function
     """
-    created, updated, removed, assigned, errors, total_roles = sync_users_with_timeframe_multi_role(
+    created, updated, removed, assigned, errors, total_roles, skipped = sync_users_with_timeframe_multi_role(
         external_data, school_id, timeframe_id, field_mappings
     )
     return created, updated, removed, assigned, errors
@@ -752,89 +839,25 @@ def load_from_external_database(timeframe_id):
             flash('External API not configured. Please set up API configuration first.', 'warning')
             return jsonify({'success': False, 'message': 'API not configured.'}), 400
         
-        # Extract field mappings from config with multi-role support
-        field_mappings = get_field_mappings_from_config(api_config)
-        logger.info(f"Using field mappings with multi-role support: {field_mappings}")
-        
-        # Use timeframe name as academic period for matching
-        academic_period = timeframe.name
-        
-        # Fetch data from external API
-        external_data = fetch_external_data_via_api(api_config, academic_period)
-        
-        if external_data is None:
-            flash('Failed to connect to external API. Please check configuration.', 'error')
-            return jsonify({
-                'success': False,
-                'message': 'Failed to connect to external API'
-            }), 500
-        
-        if not external_data:
-            # Even if no data, we still want to sync (remove users who shouldn't be there)
-            logger.info(f'No data found for academic period: {academic_period}, proceeding with cleanup')
-        
-        logger.info(f"DEBUG: About to start sync with {len(external_data)} external records")
+        # 'full' forces a complete reconcile; the default lets the job pick a delta when it can
+        sync_mode = (request.get_json(silent=True) or {}).get('mode') or request.args.get('mode', 'auto')
+        if sync_mode not in EXTERNAL_SYNC_MODES:
+            return jsonify({'success': False, 'message': f'Invalid sync mode: {sync_mode}'}), 400
         
-        # Synchronize users with timeframe using multi-role handling
-        created_count, updated_count, removed_count, assigned_count, error_count, total_roles_processed = sync_users_with_timeframe_multi_role(
-            external_data, 
-            current_user.school_id, 
-            timeframe_id,
-            field_mappings
+        # Fetching and syncing run in a background job; the page polls its progress
+        job, created = enqueue_job(
+            EXTERNAL_SYNC_JOB, timeframe_id, current_user.school_id, current_user.id,
+            options={'mode': sync_mode}, dedupe_active=True
         )
+        message = 'External sync started' if created else 'An external sync for this timeframe is already running'
+        logger.info(f"{message}: import job {job.id} for timeframe {timeframe_id}")
         
-        # Check what's in the table before commit
-        role_assignments_count = db.session.query(user_role_timeframes).count()
-        logger.info(f"DEBUG: About to commit transaction with {total_roles_processed} roles processed")
-        logger.info(f"DEBUG: Role assignments in user_role_timeframes before commit: {role_assignments_count}")
-        
-        # Commit all changes
-        db.session.commit()
-        logger.info("DEBUG: Transaction committed successfully")
-        
-        # Check what's in the table after commit
-        role_assignments_count_after = db.session.query(user_role_timeframes).count()
-        logger.info(f"DEBUG: Role assignments in user_role_timeframes after commit: {role_assignments_count_after}")
-        
-        # Prepare success message
-        message_parts = []
-        if created_count > 0:
-            message_parts.append(f"{created_count} new users created")
-        if updated_count > 0:
-            message_parts.append(f"{updated_count} users updated")
-        if assigned_count > 0:
-            message_parts.append(f"{assigned_count} users assigned to timeframe")
-        if removed_count > 0:
-            message_parts.append(f"{removed_count} users removed from timeframe")
-        if total_roles_processed > 0:
-            message_parts.append(f"{total_roles_processed} total roles processed")
-        
-        if not message_parts:
-            message_parts.append("No changes needed - data already synchronized")
-        
-        success_message = "Multi-role sync completed: " + ", ".join(message_parts)
-        
-        if error_count > 0:
-            success_message += f" ({error_count} errors occurred)"
-            flash(success_message, 'warning')
-        else:
-            flash(success_message, 'success')
-        
-        logger.info(f"Multi-role data sync completed for timeframe {timeframe_id}: {success_message}")
-        
-        # Return JSON response for the JavaScript
         return jsonify({
             'success': True,
-            'message': success_message,
-            'total_external': len(external_data),
-            'created': created_count,
-            'updated': updated_count,
-            'assigned': assigned_count,
-            'removed': removed_count,
-            'errors': error_count,
-            'total_roles_processed': total_roles_processed,
-            'field_mappings_used': field_mappings
-        })
+            'message': message,
+            'job_id': job.id,
+            'status_url': url_for('load_data.import_job_status', job_id=job.id)
+        }), 202
             
     except Exception as e:
         db.session.rollback()
@@ -845,6 +868,229 @@ def load_from_external_database(timeframe_id):
             'message': f'Error synchronizing data: {str(e)}'
         }), 500
 
+def process_external_sync_job(job):
+    """
+    Background handler for queued external API syncs (manual or scheduled).
+    Every attempt is recorded in sync_run_logs: a completed run in the sync's own commit, a
+    failed one after its changes are rolled back.
+    """
+    run_log = SyncRunLog(
+        import_job_id=job.id,
+        school_id=job.school_id,
+        timeframe_id=job.timeframe_id,
+        trigger=job.get_options().get('trigger', 'manual'),
+        started_at=datetime.utcnow()
+    )
+    try:
+        return run_external_sync(job, run_log)
+    except Exception as e:
+        db.session.rollback()
+        run_log.status = 'failed'
+        run_log.error_message = str(e)
+        run_log.finished_at = datetime.utcnow()
+        run_log.duration_seconds = (run_log.finished_at - run_log.started_at).total_seconds()
+        db.session.add(run_log)
+        db.session.commit()
+        raise
+
+def run_external_sync(job, run_log):
+    """
+    Fetch and apply the external roster for the job's timeframe, filling in `run_log`.
+    Users are committed in chunks of EXTERNAL_SYNC_COMMIT_EVERY, so row locks are held briefly
+    and a failure late in the run keeps the earlier chunks. A retried job runs again and skips
+    the users already applied (their fingerprints were committed with them); removals and the
+    new high-water mark need the whole roster and are committed last.
+    Unless a full reconcile is due, only records changed since the timeframe's high-water mark
+    are fetched and applied.
+    """
+    api_config = ExternalAPIConfig.query.filter_by(
+        school_id=job.school_id,
+        is_active=True
+    ).first()
+    if not api_config:
+        raise ImportJobError('External API not configured. Please set up API configuration first.')
+    
+    timeframe = Timeframe.query.get(job.timeframe_id)
+    if not timeframe:
+        raise ImportJobError(f"Timeframe {job.timeframe_id} not found")
+    
+    # Extract field mappings from config with multi-role support
+    field_mappings = get_field_mappings_from_config(api_config)
+    logger.info(f"Using field mappings with multi-role support: {field_mappings}")
+    
+    # Use timeframe name as academic period for matching
+    academic_period = timeframe.name
+    
+    # Counters committed by an earlier, interrupted attempt of this job. Unlike an upload, a resumed
+    # sync reads the whole roster again: the users that attempt applied now match their fingerprints
+    # and come back as skipped (so they are taken off the skipped count), and the users it failed on
+    # are retried (so their errors are counted again by this attempt, not carried over)
+    resumed_from = job.rows_processed
+    base = {'created_count': job.created_count, 'updated_count': job.updated_count,
+            'reskipped_count': job.created_count + job.updated_count} if resumed_from else \
+        {'created_count': 0, 'updated_count': 0, 'reskipped_count': 0}
+    if resumed_from:
+        logger.info(f"Resuming external sync job {job.id} after {resumed_from} users committed")
+    
+    def commit_chunk(processed, counts):
+        # The roster size is only known once it has been read; rows_total is set by the last commit
+        checkpoint(
+            job,
+            rows_processed=resumed_from + processed,
+            created_count=base['created_count'] + counts['created'],
+            updated_count=base['updated_count'] + counts['updated'],
+            error_count=counts['errors'],
+            skipped_count=max(counts['skipped'] - base['reskipped_count'], 0),
+        )
+    
+    sync_state = ExternalSyncState.query.filter_by(timeframe_id=job.timeframe_id).first()
+    sync_mode = external_sync_mode(sync_state, job.get_options().get('mode', 'auto'))
+    
+    # Open the external API response; records are fetched page by page while the sync reads them
+    response = fetch_external_changes_via_api(
+        api_config, academic_period, since=sync_state.high_water_mark if sync_mode == 'delta' else None
+    )
+    
+    if response is None:
+        raise RuntimeError('Failed to connect to external API')
+    
+    if sync_mode == 'delta' and not response.delta:
+        # The API sent its full roster instead of changes
+        sync_mode = 'full'
+    run_log.mode = sync_mode
+    
+    logger.info(f"DEBUG: About to start {sync_mode} sync from the external API")
+    
+    try:
+        # Synchronize users with timeframe using multi-role handling
+        (created_count, updated_count, removed_count, assigned_count, error_count, total_roles_processed,
+         skipped_count) = sync_users_with_timeframe_multi_role(
+            response, 
+            job.school_id, 
+            job.timeframe_id,
+            field_mappings,
+            progress=lambda processed: report_progress(job, rows_processed=resumed_from + processed),
+            delta=sync_mode == 'delta',
+            commit_chunk=commit_chunk,
+            commit_every=int(current_app.config.get('EXTERNAL_SYNC_COMMIT_EVERY', DEFAULT_SYNC_COMMIT_EVERY))
+        )
+        created_count += base['created_count']
+        updated_count += base['updated_count']
+        skipped_count = max(skipped_count - base['reskipped_count'], 0)
+    
+        # Advance the high-water mark in the same commit as the changes it covers
+        if sync_state is None:
+            sync_state = ExternalSyncState(school_id=job.school_id, timeframe_id=job.timeframe_id)
+            db.session.add(sync_state)
+        if response.sync_timestamp:
+            sync_state.high_water_mark = response.sync_timestamp
+        if sync_mode == 'full':
+            sync_state.last_full_sync_at = datetime.utcnow()
+        else:
+            sync_state.last_delta_sync_at = datetime.utcnow()
+    
+        run_log.status = 'completed'
+        run_log.records_fetched = response.records_read
+        run_log.created_count = created_count
+        run_log.updated_count = updated_count
+        run_log.removed_count = removed_count
+        run_log.skipped_count = skipped_count
+        run_log.error_count = error_count
+        run_log.finished_at = datetime.utcnow()
+        run_log.duration_seconds = (run_log.finished_at - run_log.started_at).total_seconds()
+        db.session.add(run_log)
+    
+        # Commit all changes together with the final counters
+        checkpoint(
+            job,
+            rows_total=response.records_read,
+            rows_processed=response.records_read,
+            created_count=created_count,
+            updated_count=updated_count,
+            error_count=error_count,
+            skipped_count=skipped_count,
+        )
+        logger.info("DEBUG: Transaction committed successfully")
+    finally:
+        # Only once the sync has committed (or failed): invalidating earlier would let a render
+        # during the sync cache pre-sync roles and diffs for the whole TTL
+        invalidate_external_roster_cache(job.school_id, academic_period)
+        sync_diff_cache.invalidate((job.school_id, job.timeframe_id))
+    
+    # Prepare success message
+    message_parts = []
+    if created_count > 0:
+        message_parts.append(f"{created_count} new users created")
+    if updated_count > 0:
+        message_parts.append(f"{updated_count} users updated")
+    if assigned_count > 0:
+        message_parts.append(f"{assigned_count} users assigned to timeframe")
+    if removed_count > 0:
+        message_parts.append(f"{removed_count} users removed from timeframe")
+    if total_roles_processed > 0:
+        message_parts.append(f"{total_roles_processed} total roles processed")
+    if skipped_count > 0:
+        message_parts.append(f"{skipped_count} unchanged users skipped")
+    
+    if not message_parts:
+        message_parts.append("No changes needed - data already synchronized")
+    
+    sync_label = "Multi-role sync" if sync_mode == 'full' else "Incremental multi-role sync"
+    success_message = f"{sync_label} completed: " + ", ".join(message_parts)
+    
+    if error_count > 0:
+        success_message += f" ({error_count} errors occurred)"
+    
+    logger.info(f"Multi-role data sync completed for timeframe {job.timeframe_id}: {success_message}")
+    
+    return {
+        'message': success_message,
+        'total_external': response.records_read,
+        'mode': sync_mode,
+        'created': created_count,
+        'updated': updated_count,
+        'assigned': assigned_count,
+        'removed': removed_count,
+        'skipped': skipped_count,
+        'errors': error_count,
+        'resumed_from': resumed_from,
+        'total_roles_processed': total_roles_processed,
+        'field_mappings_used': field_mappings
+    }
+
+register_job_handler(EXTERNAL_SYNC_JOB, process_external_sync_job)
+
+@load_data_api_bp.route('/load_data/sync_runs', methods=['GET'])
+def get_sync_runs():
+    """
+    Recent external sync runs for the current user's school (newest first)
+    Optional ?timeframe_id= and ?limit= (default 50, at most 500)
+    """
+    try:
+        current_user_id = session.get('user_id')
+        if not current_user_id:
+            return jsonify({'success': False, 'message': 'Please log in to continue.'}), 401
+        
+        current_user = User.query.get(current_user_id)
+        if not current_user or not current_user.school_id:
+            return jsonify({'success': False, 'message': 'User school not found.'}), 400
+        
+        limit = min(request.args.get('limit', 50, type=int), 500)
+        query = SyncRunLog.query.filter_by(school_id=current_user.school_id)
+        timeframe_id = request.args.get('timeframe_id', type=int)
+        if timeframe_id:
+            query = query.filter_by(timeframe_id=timeframe_id)
+        runs = query.order_by(SyncRunLog.started_at.desc()).limit(limit).all()
+        
+        return jsonify({
+            'success': True,
+            'runs': [run.to_dict() for run in runs]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting sync runs: {e}")
+        return jsonify({'success': False, 'message': f'Error getting sync runs: {str(e)}'}), 500
+
 @load_data_api_bp.route('/users/roles_summary/<int:school_id>')
 def get_users_roles_summary(school_id):
     """
@@ -1087,29 +1333,20 @@ def preview_external_data(timeframe_id):
             }
             preview_data.append(mapped_record)
         
-        # Analyze role distribution in the data
+        # Analyze role distribution in the data (one pass)
         all_roles = set()
         user_role_counts = {}
+        records_for_timeframe = 0
         
         for record in external_data:
             if record.get(field_mappings['timeframe']) == timeframe.name:
+                records_for_timeframe += 1
                 email = record.get(field_mappings['email'])
-                roles_data = record.get(field_mappings.get('roles', 'roles')) or record.get(field_mappings.get('role', 'role'))
+                roles = parse_roles(record.get(field_mappings.get('roles', 'roles')) or record.get(field_mappings.get('role', 'role')))
                 
-                if email and roles_data:
-                    if isinstance(roles_data, str):
-                        roles = [role.strip().lower() for role in roles_data.split(',')]
-                    elif isinstance(roles_data, list):
-                        roles = [str(role).strip().lower() for role in roles_data]
-                    else:
-                        roles = [str(roles_data).strip().lower()]
-                    
-                    for role in roles:
-                        if role:
-                            all_roles.add(role)
-                            if email not in user_role_counts:
-                                user_role_counts[email] = set()
-                            user_role_counts[email].add(role)
+                if email and roles:
+                    all_roles.update(roles)
+                    user_role_counts.setdefault(email, set()).update(roles)
         
         # Calculate statistics
         multi_role_users = sum(1 for roles in user_role_counts.values() if len(roles) > 1)
@@ -1117,7 +1354,7 @@ def preview_external_data(timeframe_id):
         return jsonify({
             'success': True,
             'total_records': len(external_data),
-            'records_for_timeframe': len([r for r in external_data if r.get(field_mappings['timeframe']) == timeframe.name]),
+            'records_for_timeframe': records_for_timeframe,
             'preview_records': preview_data,
             'field_mappings': field_mappings,
             'timeframe': timeframe.name,
@@ -1131,6 +1368,89 @@ def preview_external_data(timeframe_id):
         
     except Exception as e:
         logger.error(f"Error previewing external data: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }), 500
+
+@load_data_api_bp.route('/load_data/sync_diff/<int:timeframe_id>', methods=['GET'])
+def preview_external_sync_diff(timeframe_id):
+    """
+    Dry run of a full external sync: every user it would create, assign, update or remove, paginated
+    Optional ?action= (create, assign, update, remove), ?page=, ?per_page= and ?refresh=1
+    The diff is computed once and kept for a few minutes so pages load without re-fetching the API
+    """
+    try:
+        # Get current user's school
+        current_user_id = session.get('user_id')
+        if not current_user_id:
+            return jsonify({'success': False, 'message': 'Please log in to continue.'}), 401
+        
+        current_user = User.query.get(current_user_id)
+        if not current_user or not current_user.school_id:
+            return jsonify({'success': False, 'message': 'User school not found.'}), 400
+        
+        # Get timeframe
+        timeframe = Timeframe.query.get_or_404(timeframe_id)
+        if timeframe.school_id != current_user.school_id:
+            return jsonify({'success': False, 'message': 'Unauthorized access.'}), 403
+        
+        action = request.args.get('action')
+        if action and action not in DIFF_ACTIONS:
+            return jsonify({'success': False, 'message': f'Invalid action: {action}'}), 400
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', SYNC_DIFF_PAGE_SIZE, type=int), 1), SYNC_DIFF_MAX_PAGE_SIZE)
+        
+        cache_key = (current_user.school_id, timeframe_id)
+        if request.args.get('refresh'):
+            sync_diff_cache.invalidate(cache_key)
+        diff = sync_diff_cache.get(cache_key)
+        
+        if diff is None:
+            # Get API configuration for the school
+            api_config = ExternalAPIConfig.query.filter_by(
+                school_id=current_user.school_id,
+                is_active=True
+            ).first()
+            
+            if not api_config:
+                return jsonify({'success': False, 'message': 'API not configured.'}), 400
+            
+            # Read the full roster once, page by page, straight into the diff
+            response = fetch_external_changes_via_api(api_config, timeframe.name)
+            if response is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Failed to connect to external API'
+                }), 500
+            
+            diff = compute_external_sync_diff(
+                response, current_user.school_id, timeframe, get_field_mappings_from_config(api_config)
+            )
+            diff['computed_at'] = datetime.utcnow().isoformat()
+            sync_diff_cache.set(cache_key, diff)
+        
+        entries = diff['entries']
+        if action:
+            entries = [entry for entry in entries if entry['action'] == action]
+        start = (page - 1) * per_page
+        
+        return jsonify({
+            'success': True,
+            'timeframe': timeframe.name,
+            'computed_at': diff['computed_at'],
+            'counts': diff['counts'],
+            'invalid_emails': diff['invalid_emails'],
+            'action': action,
+            'page': page,
+            'per_page': per_page,
+            'total': len(entries),
+            'pages': (len(entries) + per_page - 1) // per_page,
+            'entries': entries[start:start + per_page]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error computing external sync diff: {e}")
         return jsonify({
             'success': False,
             'message': f'Error: {str(e)}'
@@ -1,12 +1,18 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, jsonify, session
 import pandas as pd
-import secrets
-import string
 import requests
 import logging
-from werkzeug.security import generate_password_hash
-from shared.models import db, User, Role, Timeframe, ExternalAPIConfig, assign_user_role_timeframe, user_role_timeframes  # ADDED IMPORTS
+from shared.models import db, User, Role, Timeframe, ExternalAPIConfig, ImportJob, user_role_timeframes  # ADDED IMPORTS
 from sqlalchemy import and_  # ADDED IMPORT
+from shared.service.external_api_client import ExternalAPIError, ExternalRosterResponse, get_session
+from shared.service.external_roles import ExternalRolePrefetcher
+from shared.service.roster_ingest import ROSTER_COLUMNS, RosterIngestor, role_cache
+from shared.utils.roster_file_reader import ROSTER_EXTENSIONS, RosterFileError, RosterFileReader
+from shared.utils.ttl_cache import TTLCache
+from shared.service.import_jobs import (
+    EXCEL_UPLOAD_JOB, EXTERNAL_SYNC_JOB, ImportJobError, checkpoint, enqueue_job, job_progress,
+    latest_active_job, register_job_handler, upload_idempotency_key
+)
 import io
 
 # Set up logging
@@ -16,78 +22,25 @@ logger = logging.getLogger(__name__)
 # Corrected: Add template_folder to tell Flask where to find templates
 load_data_bp = Blueprint('load_data', __name__, url_prefix='/load_data', template_folder='templates')
 
-ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+ALLOWED_EXTENSIONS = ROSTER_EXTENSIONS
+
+# Rows handed to the roster ingestor per batch
+UPLOAD_BATCH_SIZE = 2000
+
+# Error / skip messages kept on an import job for the summary shown afterwards
+MAX_STORED_DETAILS = 50
+
+# External roster responses cached for page renders, keyed by (school_id, academic_period)
+EXTERNAL_ROSTER_CACHE_TTL = 300  # seconds
+EXTERNAL_ROSTER_CACHE_SIZE = 64
+external_roster_cache = TTLCache(maxsize=EXTERNAL_ROSTER_CACHE_SIZE, ttl=EXTERNAL_ROSTER_CACHE_TTL)
 
 # Define all possible roles that can be selected
 ALL_POSSIBLE_ROLES = ['assessor', 'supervisor', 'student', 'academic coordinator', 'subject head']
 
-# 🔑 Global dictionary to temporarily hold passwords for new users
-# This is a security compromise to meet the workflow requirement.
-# Passwords are only stored here after upload and are cleared after sending emails.
-passwords_for_email = {}
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# This is the single, secure function for generating passwords.
-def generate_random_password(length=12):
-    characters = string.ascii_letters + string.digits + string.punctuation
-    return ''.join(secrets.choice(characters) for _ in range(length))
-
-def _get_or_create_role(role_name: str):
-    """Helper function to get or create a role - matches API controller"""
-    role = Role.query.filter_by(name=role_name).first()
-    if not role:
-        role = Role(name=role_name, description=role_name, is_active=True)
-        db.session.add(role)
-        db.session.flush()
-    return role
-
-def assign_user_role_timeframe(user, role_name: str, timeframe):
-    """
-    Ensure user has role `role_name` in `timeframe`. Also ensures legacy link in user_timeframes.
-    Accepts model instances or ids for user and timeframe.
-    This is the SAME function from the API controller - duplicated here to avoid circular imports.
-    """
-    user_id = user.id if hasattr(user, "id") else int(user)
-    timeframe_id = timeframe.id if hasattr(timeframe, "id") else int(timeframe)
-    role = _get_or_create_role(role_name)
-
-    logger.info(f"DEBUG: Excel - Assigning user_id={user_id}, role={role_name} (role_id={role.id}), timeframe_id={timeframe_id}")
-
-    # Insert into role-scoped table if missing
-    exists = db.session.query(user_role_timeframes).filter_by(
-        user_id=user_id, role_id=role.id, timeframe_id=timeframe_id
-    ).first()
-    
-    if not exists:
-        db.session.execute(
-            user_role_timeframes.insert().values(
-                user_id=user_id, role_id=role.id, timeframe_id=timeframe_id
-            )
-        )
-        logger.info(f"DEBUG: Excel - Inserted into user_role_timeframes - user_id={user_id}, role_id={role.id}, timeframe_id={timeframe_id}")
-        db.session.flush()
-        
-        # Verify the insert worked
-        verify = db.session.query(user_role_timeframes).filter_by(
-            user_id=user_id, role_id=role.id, timeframe_id=timeframe_id
-        ).first()
-        if verify:
-            logger.info(f"DEBUG: Excel - Verified insert successful in user_role_timeframes")
-        else:
-            logger.error(f"DEBUG: Excel - Insert failed - record not found after flush")
-    else:
-        logger.info(f"DEBUG: Excel - Record already exists in user_role_timeframes")
-
-def get_or_create_role(role_name):
-    role = Role.query.filter_by(name=role_name.lower()).first()
-    if not role:
-        role = Role(name=role_name.lower(), description=f"{role_name}")
-        db.session.add(role)
-        db.session.flush()
-    return role
-
 def remove_user_from_timeframe_with_role_cleanup(user, timeframe):
     """
     Remove user from timeframe and clean up role-scoped assignments
@@ -110,58 +63,39 @@ def remove_user_from_timeframe_with_role_cleanup(user, timeframe):
     if not user.timeframes:
         user.roles = []
 
-def get_user_roles_for_other_timeframes(user, current_timeframe_id, school_id):
+def get_user_roles_for_other_timeframes(user, current_timeframe_id, school_id, role_prefetcher=None):
     """
     Get the roles this user should have in timeframes OTHER than the current one being processed.
     This ensures we preserve their roles in other timeframes when updating roles for the current timeframe.
+    Pass one ExternalRolePrefetcher for a whole import so each academic period is fetched once
+    and every user's lookup is answered from its in-memory index.
     """
     try:
-        # Get API config for external data lookup
-        api_config = ExternalAPIConfig.query.filter_by(
-            school_id=school_id,
-            is_active=True
-        ).first()
-        
-        if not api_config:
-            # WITHOUT EXTERNAL API: We cannot determine timeframe-specific roles
-            # For Excel uploads, we should do a complete override for this timeframe
-            # and return empty list (this means Excel completely controls the user's roles)
-            logger.warning(f"No external API config found. Excel upload will completely override roles for user {user.email}")
-            return []  # Empty list means no roles preserved from other timeframes
+        if role_prefetcher is None:
+            # Get API config for external data lookup
+            api_config = ExternalAPIConfig.query.filter_by(
+                school_id=school_id,
+                is_active=True
+            ).first()
+            
+            if not api_config:
+                # WITHOUT EXTERNAL API: We cannot determine timeframe-specific roles
+                # For Excel uploads, we should do a complete override for this timeframe
+                # and return empty list (this means Excel completely controls the user's roles)
+                logger.warning(f"No external API config found. Excel upload will completely override roles for user {user.email}")
+                return []  # Empty list means no roles preserved from other timeframes
+            
+            role_prefetcher = ExternalRolePrefetcher(
+                api_config, get_field_mappings_from_config(api_config), fetch_external_data_via_api
+            )
         
         # If we have external API, preserve roles from other timeframes
-        field_mappings = get_field_mappings_from_config(api_config)
-        preserved_roles = set()
-        
-        # Check each of the user's other timeframes
-        other_timeframes = [tf for tf in user.timeframes if tf.id != current_timeframe_id]
-        
-        for timeframe in other_timeframes:
-            # Fetch external data for this other timeframe
-            external_data = fetch_external_data_via_api(api_config, timeframe.name)
-            
-            if external_data:
-                email_field = field_mappings.get('email', 'email')
-                role_field = field_mappings.get('role', 'role')
-                timeframe_field = field_mappings.get('timeframe', 'fyp_session')
-                
-                # Find this user's role in this specific timeframe
-                for external_user in external_data:
-                    if (email_field in external_user and 
-                        role_field in external_user and
-                        timeframe_field in external_user and
-                        external_user[email_field] and
-                        external_user[email_field].lower().strip() == user.email.lower() and
-                        external_user[timeframe_field] == timeframe.name):
-                        
-                        # Found the user's role for this timeframe
-                        role_name = external_user[role_field].lower().strip()
-                        role = Role.query.filter_by(name=role_name).first()
-                        if role:
-                            preserved_roles.add(role)
-                            logger.info(f"Preserving role '{role_name}' for user {user.email} in timeframe {timeframe.name}")
+        other_timeframes = [tf.name for tf in user.timeframes if tf.id != current_timeframe_id]
+        preserved_role_names = role_prefetcher.roles_in(user.email, other_timeframes)
+        for role_name in sorted(preserved_role_names):
+            logger.info(f"Preserving role '{role_name}' for user {user.email} in another timeframe")
         
-        return list(preserved_roles)
+        return role_prefetcher.role_objects(sorted(preserved_role_names))
         
     except Exception as e:
         logger.error(f"Error getting roles for other timeframes for user {user.email}: {e}")
@@ -220,24 +154,17 @@ def fetch_external_data_via_api(api_config, academic_period):
             'Content-Type': 'application/json'
         }
         
-        api_url = f"{base_url}/api/students/by-period/{academic_period}"
-        logger.info(f"Making API request to: {api_url}")
+        logger.info(f"Making API request to: {base_url} for {academic_period}")
         
-        response = requests.get(api_url, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                students = data.get('students', [])
-                logger.info(f"Successfully fetched {len(students)} students from external API")
-                return students
-            else:
-                logger.error(f"API returned success=False: {data}")
-                return []
-        else:
-            logger.error(f"API request failed with status {response.status_code}: {response.text}")
-            return []
+        # Shared client: pooled session, EXTERNAL_API_TIMEOUT_SECONDS, retries and every page
+        students = list(ExternalRosterResponse(base_url, headers, academic_period,
+                                               session=get_session(api_config.school_id)))
+        logger.info(f"Successfully fetched {len(students)} students from external API")
+        return students
         
+    except ExternalAPIError as e:
+        logger.error(str(e))
+        return []
     except requests.exceptions.RequestException as e:
         logger.error(f"Network error when calling external API: {e}")
         return []
@@ -245,6 +172,23 @@ def fetch_external_data_via_api(api_config, academic_period):
         logger.error(f"Unexpected error fetching from external API: {e}")
         return []
 
+def fetch_external_data_cached(api_config, academic_period):
+    """
+    fetch_external_data_via_api through external_roster_cache, so roster pages do not wait on the
+    external API on every load. Empty responses (which include failed calls) are not cached.
+    """
+    return external_roster_cache.get_or_load(
+        (api_config.school_id, academic_period),
+        lambda: fetch_external_data_via_api(api_config, academic_period),
+        cache_if=bool
+    )
+
+def invalidate_external_roster_cache(school_id, academic_period=None):
+    """Drop cached external rosters for a school (one academic period, or all of them)"""
+    return external_roster_cache.invalidate_where(
+        lambda key: key[0] == school_id and academic_period in (None, key[1])
+    )
+
 def get_users_with_timeframe_roles(timeframe_id, school_id):
     """
     Get users for a timeframe with their roles specific to that timeframe
@@ -266,9 +210,9 @@ def get_users_with_timeframe_roles(timeframe_id, school_id):
         users_with_roles = []
         
         if api_config and timeframe:
-            # Get field mappings and fetch external data for this timeframe
+            # Get field mappings and fetch external data for this timeframe (cached between page loads)
             field_mappings = get_field_mappings_from_config(api_config)
-            external_data = fetch_external_data_via_api(api_config, timeframe.name)
+            external_data = fetch_external_data_cached(api_config, timeframe.name)
             
             # Create a lookup dictionary for faster access
             external_user_roles = {}
@@ -392,15 +336,12 @@ def select_timeframe(timeframe_id):
         'loadData.html',
         timeframe=timeframe,
         users=users_with_timeframe_roles,
-        available_roles=ALL_POSSIBLE_ROLES
+        available_roles=ALL_POSSIBLE_ROLES,
+        active_job=latest_active_job(timeframe_id)
     )
 
 @load_data_bp.route('/upload/<int:timeframe_id>', methods=['POST'])
 def upload_excel(timeframe_id):
-    print(f"\n" + "="*50)
-    print(f"DEBUG: Starting upload for timeframe {timeframe_id}")
-    print(f"="*50)
-    
     current_user = get_current_user()
     if not current_user:
         flash('Please log in to access this page.', 'error')
@@ -413,19 +354,13 @@ def upload_excel(timeframe_id):
         flash('Access denied. You can only upload users for your school.', 'error')
         return redirect(url_for('load_data.index'))
     
-    # DEBUG: Check what the form actually sent
-    print(f"DEBUG: Raw form data: {dict(request.form)}")
-    print(f"DEBUG: Form lists: {request.form.lists()}")
-    
     selected_roles = request.form.getlist('allowed_roles')
-    print(f"DEBUG: Selected roles from form: {selected_roles}")
     
     if not selected_roles:
         flash('Please select at least one role to allow in the upload', 'error')
         return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
     
     allowed_roles = [role.lower().strip() for role in selected_roles]
-    print(f"DEBUG: Processed allowed_roles: {allowed_roles}")
     
     if 'file' not in request.files:
         flash('No file selected', 'error')
@@ -438,191 +373,157 @@ def upload_excel(timeframe_id):
     
     if file and allowed_file(file.filename):
         try:
-            # Read Excel file and ensure ID column is treated as string to avoid .0 issues
-            df = pd.read_excel(file, dtype={'ID': str})
-            
-            # DEBUG: Check Excel file contents
-            print(f"DEBUG: Excel columns: {list(df.columns)}")
-            if 'role' in df.columns:
-                unique_roles = df['role'].unique()
-                print(f"DEBUG: Unique roles in Excel file: {unique_roles}")
-                for i, role_val in enumerate(df['role'].head(10)):  # Check first 10 rows
-                    print(f"DEBUG: Row {i+2} role: '{role_val}' (type: {type(role_val)})")
-            
-            required_columns = ['ID', 'name', 'course studying', 'email', 'role']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                flash(f'Missing required columns: {", ".join(missing_columns)}', 'error')
-                return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
-            
-            success_count = 0
-            error_count = 0
-            error_details = []
-            role_skipped_count = 0
-            role_skip_details = []
-
-            # Clear any old passwords from the dictionary
-            passwords_for_email.clear()
-            
-            # DEBUG: Check existing roles in database before processing
-            existing_roles_before = Role.query.all()
-            print(f"DEBUG: Existing roles in DB before processing: {[r.name for r in existing_roles_before]}")
-            
-            for index, row in df.iterrows():
-                try:
-                    print(f"\nDEBUG: --- Processing row {index + 2} ---")
-                    
-                    student_staff_id = str(row['ID']).strip() if pd.notna(row['ID']) else ''
-                    name = str(row['name']).strip() if pd.notna(row['name']) else ''
-                    course = str(row['course studying']).strip() if pd.notna(row['course studying']) else ''
-                    email = str(row['email']).strip().lower() if pd.notna(row['email']) else ''
-                    
-                    # DEBUG: Detailed role processing
-                    raw_role = row['role']
-                    print(f"DEBUG: Raw role from Excel: '{raw_role}' (type: {type(raw_role)}, pd.notna: {pd.notna(raw_role)})")
-                    
-                    role_name = str(row['role']).strip().lower() if pd.notna(row['role']) else ''
-                    print(f"DEBUG: Processed role_name: '{role_name}'")
-                    print(f"DEBUG: Email: {email}")
-                    print(f"DEBUG: Allowed roles: {allowed_roles}")
-                    print(f"DEBUG: Is role_name in allowed_roles? {role_name in allowed_roles}")
-                    
-                    if not email or '@' not in email:
-                        error_details.append(f'Row {index + 2}: Invalid email')
-                        error_count += 1
-                        continue
-                    
-                    if role_name not in allowed_roles:
-                        role_skip_details.append(f'Row {index + 2}: Skipped role "{role_name}" for {email} (not in allowed roles)')
-                        role_skipped_count += 1
-                        print(f"DEBUG: SKIPPING row {index + 2} - role not allowed")
-                        continue
-                    
-                    print(f"DEBUG: PROCESSING row {index + 2} - role is allowed")
-                    
-                    existing_user = User.query.filter_by(email=email).first()
-                    if existing_user:
-                        print(f"DEBUG: Updating existing user: {email}")
-                        # Update existing user info
-                        existing_user.name = name
-                        existing_user.course = course
-                        existing_user.student_staff_id = student_staff_id
-                        
-                        # IMPORTANT: Assign user to the educational admin's school if not already assigned
-                        if not existing_user.school_id:
-                            existing_user.school_id = current_user.school_id
-                        
-                        # FIXED: Add role-scoped assignment for Excel upload
-                        assign_user_role_timeframe(existing_user, role_name, timeframe)
-                        print(f"DEBUG: Excel - Created role-scoped assignment: {email} as {role_name} in {timeframe.name}")
-                        
-                        # Add user to timeframe if not already there (legacy)
-                        if timeframe not in existing_user.timeframes:
-                            existing_user.timeframes.append(timeframe)
-                            print(f"DEBUG: Excel - Added user to timeframe: {email} in {timeframe.name}")
-                        
-                        # Get the new role from the Excel file
-                        new_role = get_or_create_role(role_name)
-                        
-                        # Add the new role if the user doesn't already have it
-                        if new_role not in existing_user.roles:
-                            existing_user.roles.append(new_role)
-                            print(f"DEBUG: Excel - ADDED new role '{new_role.name}' to existing user {email}.")
-                        else:
-                            print(f"DEBUG: Excel - User {email} already has role '{new_role.name}'. No change needed.")
-                            
-                    else:
-                        print(f"DEBUG: Creating new user: {email}")
-                        # Generate password ONCE and store it
-                        temp_password = generate_random_password()
-                        passwords_for_email[email] = temp_password
-                        
-                        password_hash = generate_password_hash(temp_password)
-                        new_user = User(
-                            name=name,
-                            email=email,
-                            course=course,
-                            student_staff_id=student_staff_id,
-                            password_hash=password_hash,
-                            school_id=current_user.school_id,# ASSIGN TO ADMIN'S SCHOOL
-                            email_sent=False
-                        )
-                        db.session.add(new_user)
-                        db.session.flush()
-                        
-                        # FIXED: Add role-scoped assignment for Excel upload
-                        print(f"DEBUG: Excel - About to get_or_create_role for new user with: '{role_name}'")
-                        role = get_or_create_role(role_name)
-                        print(f"DEBUG: Excel - Got role: {role.name} (ID: {role.id})")
-                        
-                        # Create role-scoped assignment FIRST
-                        assign_user_role_timeframe(new_user, role_name, timeframe)
-                        print(f"DEBUG: Excel - Created role-scoped assignment: {email} as {role_name} in {timeframe.name}")
-                        
-                        # Add user to timeframe (legacy)
-                        new_user.timeframes.append(timeframe)
-                        print(f"DEBUG: Excel - Added new user to timeframe: {email} in {timeframe.name}")
-                        
-                        # Also add the role to user.roles for general queries
-                        new_user.roles.append(role)
-                        print(f"DEBUG: Excel - Added role '{role.name}' to new user {email}")
-                    
-                    success_count += 1
-                    
-                    # DEBUG: Check roles after each user
-                    all_roles_now = Role.query.all()
-                    print(f"DEBUG: All roles in DB after processing user: {[r.name for r in all_roles_now]}")
-                    
-                except Exception as e:
-                    print(f"DEBUG: Error processing row {index + 2}: {str(e)}")
-                    error_details.append(f'Row {index + 2}: {str(e)}')
-                    error_count += 1
-            
-            # DEBUG: Final role check before commit
-            final_roles = Role.query.all()
-            print(f"DEBUG: Final roles in DB before commit: {[r.name for r in final_roles]}")
-            
-            # Check what's in the user_role_timeframes table before commit
-            role_assignments_count = db.session.query(user_role_timeframes).count()
-            print(f"DEBUG: Excel - Total role assignments in user_role_timeframes table before commit: {role_assignments_count}")
-            
-            db.session.commit()
-            
-            # DEBUG: Final role check after commit
-            committed_roles = Role.query.all()
-            print(f"DEBUG: Final roles in DB after commit: {[r.name for r in committed_roles]}")
-            
-            # Check what's in the table after commit
-            role_assignments_count_after = db.session.query(user_role_timeframes).count()
-            print(f"DEBUG: Excel - Role assignments in user_role_timeframes after commit: {role_assignments_count_after}")
-            
-            flash(f'Successfully processed {success_count} users for {current_user.school.name} with roles: {", ".join(selected_roles)}', 'success')
-            
-            if role_skipped_count > 0:
-                flash(f'{role_skipped_count} role assignments were skipped (roles not allowed)', 'warning')
-                for skip in role_skip_details[:5]:
-                    flash(skip, 'warning')
-                if len(role_skip_details) > 5:
-                    flash(f'... and {len(role_skip_details) - 5} more roles skipped', 'warning')
+            # Parsing and loading happen in a background job; the page polls its progress
+            payload = file.read()
+            idempotency_key = upload_idempotency_key(
+                EXCEL_UPLOAD_JOB, timeframe_id, payload, {'allowed_roles': sorted(allowed_roles)}
+            )
+            job, created = enqueue_job(
+                EXCEL_UPLOAD_JOB, timeframe_id, current_user.school_id, current_user.id,
+                payload=payload,
+                options={'allowed_roles': allowed_roles, 'selected_roles': selected_roles, 'filename': file.filename},
+                idempotency_key=idempotency_key
+            )
+            logger.info(f"Excel upload for timeframe {timeframe_id} queued as import job {job.id} (new={created}, roles={allowed_roles})")
             
-            if error_count > 0:
-                flash(f'{error_count} rows had errors and were not processed', 'error')
-                for err in error_details[:5]:
-                    flash(err, 'error')
-                if len(error_details) > 5:
-                    flash(f'... and {len(error_details) - 5} more errors', 'error')
+            if created or job.status == 'queued':
+                flash(f'"{file.filename}" is being processed in the background. Progress is shown below.', 'info')
+            elif job.status == 'running':
+                flash(f'This file is already being processed for {timeframe.name}.', 'info')
+            else:
+                flash(f'This file was already imported into {timeframe.name}; no changes were made.', 'info')
             
         except Exception as e:
             db.session.rollback()
-            print(f"DEBUG: File processing error: {str(e)}")
+            logger.error(f"Error queueing upload for timeframe {timeframe_id}: {e}")
             flash(f'Error processing file: {str(e)}', 'error')
     else:
-        flash('Invalid file type. Please upload an Excel file (.xlsx or .xls)', 'error')
+        flash('Invalid file type. Please upload an Excel or CSV file (.xlsx, .xls or .csv)', 'error')
     
-    print(f"DEBUG: Upload process completed")
-    print(f"="*50 + "\n")
     return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
 
+def process_excel_upload_job(job):
+    """
+    Background handler for queued Excel / CSV uploads.
+    Rows are streamed from the file in batches, so the first batch is loaded before the rest is
+    parsed. Each batch commits together with the rows_processed checkpoint, so a job restarted
+    after a crash resumes where it stopped instead of loading rows twice.
+    """
+    options = job.get_options()
+    try:
+        reader = RosterFileReader(io.BytesIO(job.payload), options.get('filename', ''),
+                                  required_columns=ROSTER_COLUMNS.values())
+    except RosterFileError as e:
+        raise ImportJobError(str(e))
+    
+    details = job.get_result()
+    error_details = details.get('error_details', [])
+    role_skip_details = details.get('role_skip_details', [])
+    base = {'created_count': job.created_count, 'updated_count': job.updated_count,
+            'error_count': job.error_count, 'skipped_count': job.skipped_count}
+    
+    checkpoint(job, rows_total=reader.estimated_rows)
+    
+    # Set-based load: a fixed number of statements per batch instead of per row
+    ingestor = RosterIngestor(job.timeframe_id, job.school_id, options.get('allowed_roles', []))
+    try:
+        for batch in reader.batches(UPLOAD_BATCH_SIZE, skip=job.rows_processed):
+            ingestor.ingest(batch)
+            
+            job.set_result({
+                'error_details': (error_details + ingestor.error_details)[:MAX_STORED_DETAILS],
+                'role_skip_details': (role_skip_details + ingestor.role_skip_details)[:MAX_STORED_DETAILS],
+            })
+            checkpoint(
+                job,
+                rows_processed=job.rows_processed + len(batch),
+                rows_total=max(job.rows_total or 0, job.rows_processed + len(batch)),
+                created_count=base['created_count'] + ingestor.created_count,
+                updated_count=base['updated_count'] + ingestor.updated_count,
+                error_count=base['error_count'] + ingestor.error_count,
+                skipped_count=base['skipped_count'] + ingestor.role_skipped_count,
+            )
+    except RosterFileError as e:
+        role_cache.clear()
+        raise ImportJobError(str(e))
+    except Exception:
+        role_cache.clear()
+        raise
+    checkpoint(job, rows_total=job.rows_processed)
+    
+    logger.info(f"Import job {job.id}: created {job.created_count}, updated {job.updated_count} users")
+    result = job.get_result()
+    result.update({
+        'success_count': job.rows_processed - job.error_count - job.skipped_count,
+        'error_count': job.error_count,
+        'role_skipped_count': job.skipped_count,
+        'selected_roles': options.get('selected_roles', options.get('allowed_roles', [])),
+        'filename': options.get('filename'),
+    })
+    return result
+
+def flash_import_summary(job, current_user):
+    """Flash the outcome of a finished import job, as the synchronous upload used to"""
+    result = job.get_result()
+    if job.status == 'failed':
+        flash(f'Error processing file: {job.error_message}', 'error')
+        return
+    
+    if job.job_type == EXTERNAL_SYNC_JOB:
+        flash(result.get('message', 'Sync completed'), 'warning' if result.get('errors') else 'success')
+        return
+    
+    selected_roles = result.get('selected_roles', [])
+    flash(f'Successfully processed {result.get("success_count", 0)} users for {current_user.school.name} with roles: {", ".join(selected_roles)}', 'success')
+    
+    role_skipped_count = result.get('role_skipped_count', 0)
+    role_skip_details = result.get('role_skip_details', [])
+    if role_skipped_count > 0:
+        flash(f'{role_skipped_count} role assignments were skipped (roles not allowed)', 'warning')
+        for skip in role_skip_details[:5]:
+            flash(skip, 'warning')
+        if role_skipped_count > 5:
+            flash(f'... and {role_skipped_count - 5} more roles skipped', 'warning')
+    
+    error_count = result.get('error_count', 0)
+    error_details = result.get('error_details', [])
+    if error_count > 0:
+        flash(f'{error_count} rows had errors and were not processed', 'error')
+        for err in error_details[:5]:
+            flash(err, 'error')
+        if error_count > 5:
+            flash(f'... and {error_count - 5} more errors', 'error')
+
+@load_data_bp.route('/import_jobs/<int:job_id>/status')
+def import_job_status(job_id):
+    """Progress of a background import, polled by the loadData page"""
+    current_user = get_current_user()
+    if not current_user:
+        return jsonify({'success': False, 'message': 'Please log in to continue.'}), 401
+    
+    job = ImportJob.query.get_or_404(job_id)
+    if job.school_id != current_user.school_id:
+        return jsonify({'success': False, 'message': 'Unauthorized access.'}), 403
+    
+    return jsonify({'success': True, 'job': job_progress(job)})
+
+@load_data_bp.route('/import_jobs/<int:job_id>/finish')
+def finish_import_job(job_id):
+    """Show a finished import's summary as flash messages and return to its course term"""
+    current_user = get_current_user()
+    if not current_user:
+        flash('Please log in to access this page.', 'error')
+        return redirect(url_for('login_bp.login'))
+    
+    job = ImportJob.query.get_or_404(job_id)
+    if job.school_id != current_user.school_id:
+        flash('Access denied. You can only view imports for your school.', 'error')
+        return redirect(url_for('load_data.index'))
+    
+    if job.is_finished:
+        flash_import_summary(job, current_user)
+    return redirect(url_for('load_data.select_timeframe', timeframe_id=job.timeframe_id))
+
 @load_data_bp.route('/view/<int:timeframe_id>')
 def view_users(timeframe_id):
     current_user = get_current_user()
@@ -674,4 +575,6 @@ def download_template():
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
         download_name='user_template.xlsx'
-    )
\ No newline at end of file
+    )
+
+register_job_handler(EXCEL_UPLOAD_JOB, process_excel_upload_job)
@@ -1,58 +1,64 @@
-from flask import Blueprint, request, redirect, url_for, flash
+from flask import Blueprint, request, redirect, url_for, flash, jsonify, session
 from shared.models import db, Timeframe, User
-from shared.service.email_service import send_welcome_emails
-from werkzeug.security import generate_password_hash
-# Import the passwords dictionary at module level for better performance
-from features.educationAdmin.load_data.loadDataController import passwords_for_email, generate_random_password
+from shared.service.email_outbox import enqueue_welcome_emails, outbox_summary, retry_dead_letters
 # Create blueprint for email functionality
 send_welcome_email_bp = Blueprint('send_welcome_email', __name__, url_prefix='/load_data')
 
 @send_welcome_email_bp.route('/send_welcome_emails/<int:timeframe_id>', methods=['POST'])
 def send_welcome_notifications(timeframe_id):
-    """Send welcome emails to all users in the specified timeframe using the pre-generated passwords."""
+    """
+    Queue welcome emails to all users in the specified timeframe who do not already have one waiting.
+    Only the outbox rows are written here; its workers render each email (with the first-login
+    password of users who never received one), send it and mark the user's email_sent once delivered.
+    """
     try:
         timeframe = Timeframe.query.get_or_404(timeframe_id)
-        users_in_timeframe = timeframe.users
         
-        # Build the passwords dictionary for first-time users
-        updated_passwords_for_email = {}
+        result = enqueue_welcome_emails(timeframe)
         
-        for user in users_in_timeframe:
-            # Check if this user has never received a welcome email
-            if not user.email_sent:
-                # If this is their first time, we need a password
-                if user.email in passwords_for_email:
-                    # Use the password that was generated during user creation
-                    updated_passwords_for_email[user.email] = passwords_for_email[user.email]
-                else:
-                    # This shouldn't happen for newly created users, but as fallback:
-                    # Generate a new password and update their hash in the database
-                    new_password = generate_random_password()
-                    updated_passwords_for_email[user.email] = new_password
-                    user.password_hash = generate_password_hash(new_password)
-                    
-        # Call the email service with the passwords for first-time users only
-        result = send_welcome_emails(users_in_timeframe, timeframe, passwords=updated_passwords_for_email)
-        
-        if result['success']:
-            # Mark users as having received their welcome email
-            for user in users_in_timeframe:
-                if user.email in updated_passwords_for_email:
-                    user.email_sent = True
-            
-            db.session.commit()
-            
-            flash(f'Successfully sent welcome emails to {result["sent_count"]} users!', 'success')
-            if result['failed_count'] > 0:
-                flash(f'{result["failed_count"]} emails failed to send. Check logs for details.', 'warning')
-        else:
-            flash(f'Failed to send emails: {result["error"]}', 'error')
-        
-        # Clear the passwords from memory after sending emails
-        passwords_for_email.clear()
+        flash(f'Queued welcome emails for {result["queued"]} users. They are being sent in the background.', 'success')
+        if result['already_queued'] > 0:
+            flash(f'{result["already_queued"]} users already had a welcome email waiting to be sent.', 'info')
         
     except Exception as e:
         db.session.rollback()
         flash(f'Error sending emails: {str(e)}', 'error')
     
-    return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
\ No newline at end of file
+    return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
+
+@send_welcome_email_bp.route('/welcome_emails/<int:timeframe_id>/status', methods=['GET'])
+def welcome_email_status(timeframe_id):
+    """Welcome email delivery progress for a timeframe: counts per status and the dead letters"""
+    current_user_id = session.get('user_id')
+    if not current_user_id:
+        return jsonify({'success': False, 'message': 'Please log in to continue.'}), 401
+    
+    current_user = User.query.get(current_user_id)
+    timeframe = Timeframe.query.get_or_404(timeframe_id)
+    if not current_user or timeframe.school_id != current_user.school_id:
+        return jsonify({'success': False, 'message': 'Unauthorized access.'}), 403
+    
+    return jsonify({'success': True, **outbox_summary(timeframe_id)})
+
+@send_welcome_email_bp.route('/welcome_emails/<int:timeframe_id>/retry', methods=['POST'])
+def retry_failed_welcome_emails(timeframe_id):
+    """Queue the timeframe's dead-lettered welcome emails again"""
+    current_user_id = session.get('user_id')
+    if not current_user_id:
+        flash('Please log in to continue.', 'error')
+        return redirect(url_for('login_bp.login'))
+    
+    current_user = User.query.get(current_user_id)
+    timeframe = Timeframe.query.get_or_404(timeframe_id)
+    if not current_user or timeframe.school_id != current_user.school_id:
+        flash('Unauthorized access to timeframe.', 'error')
+        return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
+    
+    try:
+        retried = retry_dead_letters(timeframe_id)
+        flash(f'Retrying {retried} failed welcome emails.', 'success' if retried else 'info')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error retrying emails: {str(e)}', 'error')
+    
+    return redirect(url_for('load_data.select_timeframe', timeframe_id=timeframe_id))
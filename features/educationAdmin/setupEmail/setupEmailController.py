@@ -1,7 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session
 from database import db
 from shared.models import EmailConfig, School, User
-from shared.service.email_service import EmailService
+from shared.service.email_service import EmailService, invalidate_email_config
 from functools import wraps
 
 setup_email_bp = Blueprint('setup_email_bp', __name__, 
@@ -108,6 +108,8 @@ def save_email_config():
             action = 'saved'
         
         db.session.commit()
+        # Senders read the config through a cache
+        invalidate_email_config(user.school_id)
         flash(f'Email configuration {action} successfully!', 'success')
         
     except ValueError:
@@ -207,6 +209,7 @@ def delete_email_config():
             # Soft delete - just mark as inactive
             email_config.is_active = False
             db.session.commit()
+            invalidate_email_config(user.school_id)
             flash('Email configuration deleted successfully.', 'success')
         else:
             flash('No email configuration found to delete.', 'warning')
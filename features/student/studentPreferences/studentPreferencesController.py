@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
 from shared.models import User, Timeframe, Project, Wishlist, Preference, db
+from shared.service.incremental_allocation import repair_allocation_after_change
 from datetime import datetime
 import logging
 
@@ -184,6 +185,9 @@ def submit_preferences():
         
         db.session.commit()
         
+        # Late submission: move only this student (and whoever their path displaces)
+        repair_allocation_after_change(timeframe_id, changed_user_ids=[user_id])
+        
         return jsonify({
             'success': True,
             'message': f'Successfully submitted {len(preferences_data)} preferences!'
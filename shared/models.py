@@ -8,9 +8,11 @@ if sys.platform == "win32":
     sys.stdout = codecs.getwriter('utf-8')(sys.stdout.buffer, 'strict')
     sys.stderr = codecs.getwriter('utf-8')(sys.stderr.buffer, 'strict')
 
+import json
 from datetime import datetime, date
 from werkzeug.security import generate_password_hash
 from sqlalchemy import and_, Index, UniqueConstraint
+from sqlalchemy.dialects.mysql import LONGBLOB
 from database import db
 
 # ------------------------
@@ -348,6 +350,227 @@ class ExternalAPIConfig(db.Model):
         self.role_field = mappings.get('role', 'role')
         self.timeframe_field = mappings.get('timeframe', 'fyp_session')
 
+class ImportJob(db.Model):
+    """Roster import (Excel upload or external API sync) or allocation repair processed by the background job workers"""
+    __tablename__ = 'import_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+
+    job_type = db.Column(db.String(50), nullable=False)  # excel_upload, external_sync, allocation_repair
+    timeframe_id = db.Column(db.Integer, db.ForeignKey('timeframes.id'), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    # Same upload submitted twice maps to the same job; NULL for jobs that are not deduplicated
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=True)
+
+    status = db.Column(db.Enum('queued', 'running', 'completed', 'failed', name='import_job_status_enum'),
+                       default='queued', nullable=False)
+    payload = db.Column(db.LargeBinary().with_variant(LONGBLOB, 'mysql'), nullable=True)
+    options = db.Column(db.Text, nullable=True)  # JSON
+    result = db.Column(db.Text, nullable=True)  # JSON summary / error details
+    error_message = db.Column(db.Text, nullable=True)
+
+    # Progress; rows_processed is also the resume checkpoint after a restart
+    rows_total = db.Column(db.Integer, nullable=True)
+    rows_processed = db.Column(db.Integer, default=0, nullable=False)
+    created_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_count = db.Column(db.Integer, default=0, nullable=False)
+    error_count = db.Column(db.Integer, default=0, nullable=False)
+    skipped_count = db.Column(db.Integer, default=0, nullable=False)
+
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Not claimed before this time (scheduled syncs are spread over a window)
+    run_after = db.Column(db.DateTime, nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_import_job_status', 'status', 'id'),
+        Index('idx_import_job_timeframe', 'timeframe_id', 'status'),
+    )
+
+    timeframe = db.relationship('Timeframe', backref=db.backref('import_jobs', lazy='dynamic'))
+
+    def get_options(self):
+        return json.loads(self.options) if self.options else {}
+
+    def set_options(self, options: dict):
+        self.options = json.dumps(options)
+
+    def get_result(self):
+        return json.loads(self.result) if self.result else {}
+
+    def set_result(self, result: dict):
+        self.result = json.dumps(result)
+
+    @property
+    def is_finished(self):
+        return self.status in ('completed', 'failed')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'job_type': self.job_type,
+            'timeframe_id': self.timeframe_id,
+            'status': self.status,
+            'rows_total': self.rows_total,
+            'rows_processed': self.rows_processed,
+            'created': self.created_count,
+            'updated': self.updated_count,
+            'errors': self.error_count,
+            'skipped': self.skipped_count,
+            'attempts': self.attempts,
+            'error_message': self.error_message,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<ImportJob {self.id} {self.job_type} {self.status}>"
+
+class ExternalSyncState(db.Model):
+    """High-water mark of the external API sync for one timeframe, used by delta syncs"""
+    __tablename__ = 'external_sync_states'
+    id = db.Column(db.Integer, primary_key=True)
+
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    timeframe_id = db.Column(db.Integer, db.ForeignKey('timeframes.id'), nullable=False, unique=True)
+
+    # sync_timestamp of the last applied response, as returned by the external API (its clock)
+    high_water_mark = db.Column(db.String(64), nullable=True)
+    last_full_sync_at = db.Column(db.DateTime, nullable=True)
+    last_delta_sync_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    timeframe = db.relationship('Timeframe', backref=db.backref('external_sync_state', uselist=False))
+
+    def __repr__(self):
+        return f"<ExternalSyncState timeframe={self.timeframe_id} mark={self.high_water_mark}>"
+
+class SyncRunLog(db.Model):
+    """One attempt of an external API sync for a timeframe, manual or scheduled"""
+    __tablename__ = 'sync_run_logs'
+    id = db.Column(db.Integer, primary_key=True)
+
+    import_job_id = db.Column(db.Integer, db.ForeignKey('import_jobs.id'), nullable=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=False)
+    timeframe_id = db.Column(db.Integer, db.ForeignKey('timeframes.id'), nullable=False)
+
+    trigger = db.Column(db.String(20), nullable=False, default='manual')  # manual, scheduled
+    mode = db.Column(db.String(10), nullable=True)  # full, delta
+    status = db.Column(db.Enum('completed', 'failed', name='sync_run_status_enum'), nullable=False)
+
+    started_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=False)
+    duration_seconds = db.Column(db.Float, nullable=False)
+
+    records_fetched = db.Column(db.Integer, default=0, nullable=False)
+    created_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_count = db.Column(db.Integer, default=0, nullable=False)
+    removed_count = db.Column(db.Integer, default=0, nullable=False)
+    skipped_count = db.Column(db.Integer, default=0, nullable=False)
+    error_count = db.Column(db.Integer, default=0, nullable=False)
+    error_message = db.Column(db.Text, nullable=True)
+
+    __table_args__ = (
+        Index('idx_sync_run_school_started', 'school_id', 'started_at'),
+    )
+
+    timeframe = db.relationship('Timeframe', backref=db.backref('sync_runs', lazy='dynamic'))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'import_job_id': self.import_job_id,
+            'timeframe_id': self.timeframe_id,
+            'timeframe_name': self.timeframe.name if self.timeframe else None,
+            'trigger': self.trigger,
+            'mode': self.mode,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(),
+            'finished_at': self.finished_at.isoformat(),
+            'duration_seconds': round(self.duration_seconds, 3),
+            'records_fetched': self.records_fetched,
+            'created': self.created_count,
+            'updated': self.updated_count,
+            'removed': self.removed_count,
+            'skipped': self.skipped_count,
+            'errors': self.error_count,
+            'error_message': self.error_message,
+        }
+
+    def __repr__(self):
+        return f"<SyncRunLog timeframe={self.timeframe_id} {self.trigger} {self.status}>"
+
+class EmailOutbox(db.Model):
+    """Email waiting for, or done with, delivery by the outbox workers; welcome emails are rendered when first claimed"""
+    __tablename__ = 'email_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+
+    kind = db.Column(db.String(30), nullable=False, default='welcome')
+    school_id = db.Column(db.Integer, db.ForeignKey('schools.id'), nullable=True)  # whose EmailConfig sends it
+    timeframe_id = db.Column(db.Integer, db.ForeignKey('timeframes.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body_text = db.Column(db.Text, nullable=True)  # may hold a first-login password; cleared once sent or dead
+    body_html = db.Column(db.Text, nullable=True)
+
+    status = db.Column(db.Enum('pending', 'sending', 'sent', 'dead', name='email_outbox_status_enum'),
+                       default='pending', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)  # claim lease of a 'sending' row
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('idx_email_outbox_due', 'status', 'next_attempt_at'),
+        Index('idx_email_outbox_timeframe', 'timeframe_id', 'kind', 'status'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'to_email': self.to_email,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'sent_at': self.sent_at.isoformat() if self.sent_at else None,
+        }
+
+    def __repr__(self):
+        return f"<EmailOutbox {self.id} {self.to_email} {self.status}>"
+
+class UserSyncFingerprint(db.Model):
+    """Hash of the external fields last applied to a user in a timeframe; unchanged users are skipped"""
+    __tablename__ = 'user_sync_fingerprints'
+    id = db.Column(db.Integer, primary_key=True)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    timeframe_id = db.Column(db.Integer, db.ForeignKey('timeframes.id', ondelete='CASCADE'), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 hex
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'timeframe_id', name='uq_user_sync_fingerprint'),
+        Index('idx_user_sync_fingerprint_timeframe', 'timeframe_id'),
+    )
+
+    def __repr__(self):
+        return f"<UserSyncFingerprint user={self.user_id} timeframe={self.timeframe_id}>"
+
 # ------------------------
 # Helpers for role-scoped assignments
 # ------------------------
@@ -0,0 +1,178 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+from shared.models import Timeframe
+from shared.service.allocation_service import load_open_allocation_matrix, solve_student_allocation
+from shared.service.password_hashing import POOL_START_METHOD
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MAX_SCENARIOS = 50
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _scenario_metrics(ranks_fulfilled: np.ndarray, n_students: int) -> Dict[str, Any]:
+    allocated = ranks_fulfilled > 0
+    allocated_count = int(allocated.sum())
+    distribution = np.bincount(ranks_fulfilled[allocated])
+    return {
+        'allocated': allocated_count,
+        'unallocated': n_students - allocated_count,
+        'first_choice': int((ranks_fulfilled == 1).sum()),
+        'first_choice_rate': round(float((ranks_fulfilled == 1).sum()) / n_students, 4) if n_students else 0.0,
+        'mean_rank': round(float(ranks_fulfilled[allocated].mean()), 3) if allocated_count else None,
+        'rank_distribution': {str(rank): int(count) for rank, count in enumerate(distribution) if rank and count},
+    }
+
+
+def _solve_edges(edges: np.ndarray, n_students: int, capacities: np.ndarray,
+                 preference_limit: Optional[int], cost_exponent: float) -> Dict[str, Any]:
+    rows, cols, ranks = edges[0], edges[1], edges[2]
+    if preference_limit:
+        keep = ranks <= preference_limit
+        rows, cols, ranks = rows[keep], cols[keep], ranks[keep]
+
+    assignment = solve_student_allocation(rows, cols, ranks, capacities, n_students,
+                                          cost_exponent=cost_exponent)
+    ranks_fulfilled = np.zeros(n_students, dtype=np.int64)
+    hit = assignment[rows] == cols
+    ranks_fulfilled[rows[hit]] = ranks[hit]
+
+    metrics = _scenario_metrics(ranks_fulfilled, n_students)
+    metrics['total_capacity'] = int(capacities.sum())
+    return metrics
+
+
+def _solve_scenario(shm_name: str, n_preferences: int, n_students: int, capacities: np.ndarray,
+                    preference_limit: Optional[int], cost_exponent: float) -> Dict[str, Any]:
+    """
+    Worker entry point: attach to the shared (rows, cols, ranks) block, solve one variant and
+    return only its metrics so nothing large crosses the process boundary.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        # The array view must be gone before close(), so it only lives inside _solve_edges
+        return _solve_edges(np.ndarray((3, n_preferences), dtype=np.int64, buffer=shm.buf),
+                            n_students, capacities, preference_limit, cost_exponent)
+    finally:
+        shm.close()
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    # One long-lived pool per process, started with the same method as the password hashing pool
+    # so solver workers never fork the web process; rebuilt only if the requested size changes
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context(POOL_START_METHOD))
+            _executor_workers = workers
+        return _executor
+
+
+@atexit.register
+def shutdown_scenario_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def run_allocation_scenarios(timeframe_id: int, scenarios: List[Dict[str, Any]],
+                             max_workers: Optional[int] = None,
+                             cost_exponent: float = 1.0) -> Dict[str, Any]:
+    """
+    Solve what-if allocation variants for a timeframe in parallel without writing anything.
+
+    Each scenario is a dict with an optional 'name', 'student_capacity' ({project_id: capacity}
+    overrides) and 'preference_limit' (only ranks up to this limit are honoured). The current
+    settings are always solved first as the 'current' baseline, and every scenario reports its
+    deltas against it. The preference edges are placed once in shared memory; workers only
+    receive the block name and their own capacity vector.
+    """
+    timeframe = Timeframe.query.get(timeframe_id)
+    if not timeframe:
+        raise ValueError(f"Timeframe {timeframe_id} not found")
+    if len(scenarios) > MAX_SCENARIOS:
+        raise ValueError(f"At most {MAX_SCENARIOS} scenarios can be compared at once")
+
+    matrix, seats_taken, locked_count = load_open_allocation_matrix(timeframe_id)
+    base_capacities = matrix.capacities
+
+    variants = [{'name': 'current', 'student_capacity': {}, 'preference_limit': timeframe.preference_limit}]
+    for i, scenario in enumerate(scenarios, 1):
+        variants.append({
+            'name': scenario.get('name') or f'Scenario {i}',
+            'student_capacity': scenario.get('student_capacity') or {},
+            'preference_limit': scenario.get('preference_limit') or timeframe.preference_limit,
+        })
+
+    capacity_vectors = []
+    for variant in variants:
+        capacities = base_capacities.copy()
+        overrides = {int(pid): int(cap) for pid, cap in variant['student_capacity'].items()}
+        if overrides:
+            positions = matrix.project_positions(list(overrides.keys()))
+            unknown = [pid for pid, pos in zip(overrides, positions) if pos < 0]
+            if unknown:
+                raise ValueError(f"Projects {unknown} do not belong to this timeframe")
+            capacities[positions] = list(overrides.values())
+        capacity_vectors.append(np.clip(capacities - seats_taken, 0, None))
+
+    n_preferences = matrix.n_preferences
+    shm = shared_memory.SharedMemory(create=True, size=max(3 * n_preferences * 8, 8))
+    try:
+        edges = np.ndarray((3, n_preferences), dtype=np.int64, buffer=shm.buf)
+        edges[0], edges[1], edges[2] = matrix.rows, matrix.cols, matrix.ranks
+        del edges
+
+        workers = max_workers or os.cpu_count() or 1
+        executor = _get_executor(workers)
+        futures = [
+            executor.submit(_solve_scenario, shm.name, n_preferences, matrix.n_users,
+                            capacities, variant['preference_limit'], cost_exponent)
+            for variant, capacities in zip(variants, capacity_vectors)
+        ]
+        results = [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
+
+    baseline = results[0]
+    comparison = []
+    for variant, metrics in zip(variants, results):
+        metrics.update({
+            'name': variant['name'],
+            'preference_limit': variant['preference_limit'],
+            'capacity_overrides': variant['student_capacity'],
+            'delta_allocated': metrics['allocated'] - baseline['allocated'],
+            'delta_unallocated': metrics['unallocated'] - baseline['unallocated'],
+            'delta_first_choice_rate': round(metrics['first_choice_rate'] - baseline['first_choice_rate'], 4),
+        })
+        comparison.append(metrics)
+
+    logger.info(f"Solved {len(variants)} allocation scenarios for timeframe {timeframe_id} with {workers} workers")
+
+    return {
+        'success': True,
+        'timeframe_id': timeframe_id,
+        'students_considered': matrix.n_users,
+        'locked_allocations': locked_count,
+        'scenarios': comparison,
+    }
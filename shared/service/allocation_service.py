@@ -0,0 +1,205 @@
+import logging
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+
+from database import db
+from shared.models import AllocationResult, UnallocatedUser
+from shared.service.preference_matrix import load_preference_matrix
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Allocation rows written by the engine. Anything else (manual, override) is left alone.
+AUTOMATIC_METHOD = 'automatic'
+
+
+def new_allocation_batch_id(timeframe_id: int) -> str:
+    """Build a unique, sortable batch id for one allocation run"""
+    return f"tf{timeframe_id}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def solve_student_allocation(student_idx, project_idx, ranks, capacities, n_students: int,
+                             cost_exponent: float = 1.0) -> np.ndarray:
+    """
+    Solve the rank-weighted student -> project assignment optimally.
+
+    Inputs are parallel arrays describing preference edges (student index, project index, rank)
+    plus the per-project capacity vector. Every project is expanded into `capacity` identical
+    slots and each student gets a private "unallocated" slot whose cost is higher than any set of
+    ranked choices, so the min-cost full matching first maximises the number of allocated
+    students and then minimises the total rank cost.
+
+    Returns an array of length n_students holding the project index per student, or -1.
+    """
+    assignment = np.full(n_students, -1, dtype=np.int64)
+    if n_students == 0:
+        return assignment
+
+    student_idx = np.asarray(student_idx, dtype=np.int64)
+    project_idx = np.asarray(project_idx, dtype=np.int64)
+    ranks = np.asarray(ranks, dtype=np.float64)
+    capacities = np.clip(np.asarray(capacities, dtype=np.int64), 0, None)
+
+    # Drop edges into projects that have no room at all
+    usable = capacities[project_idx] > 0
+    student_idx, project_idx, ranks = student_idx[usable], project_idx[usable], ranks[usable]
+
+    edge_costs = ranks ** cost_exponent
+    max_cost = edge_costs.max() if edge_costs.size else 1.0
+    unallocated_cost = max_cost * n_students + 1.0
+
+    # Expand each preference edge into one edge per slot of the target project
+    slot_offsets = np.concatenate(([0], np.cumsum(capacities)))
+    total_slots = int(slot_offsets[-1])
+    per_edge = capacities[project_idx]
+    edge_starts = np.cumsum(per_edge) - per_edge
+    within = np.arange(per_edge.sum()) - np.repeat(edge_starts, per_edge)
+
+    rows = np.concatenate((np.repeat(student_idx, per_edge), np.arange(n_students)))
+    cols = np.concatenate((np.repeat(slot_offsets[project_idx], per_edge) + within,
+                           total_slots + np.arange(n_students)))
+    costs = np.concatenate((np.repeat(edge_costs, per_edge), np.full(n_students, unallocated_cost)))
+
+    graph = csr_matrix((costs, (rows, cols)), shape=(n_students, total_slots + n_students))
+    matched_rows, matched_cols = min_weight_full_bipartite_matching(graph)
+
+    allocated = matched_cols < total_slots
+    slot_project = np.repeat(np.arange(len(capacities)), capacities)
+    assignment[matched_rows[allocated]] = slot_project[matched_cols[allocated]]
+    return assignment
+
+
+def load_open_allocation_matrix(timeframe_id: int):
+    """
+    Student preference matrix restricted to students that are still open for allocation.
+
+    Allocations other than pending automatic ones (manual, override, confirmed...) lock their
+    student out of the run, and the pending/confirmed ones occupy a seat. Returns the matrix
+    with the projects' full capacities, the per-project seats already taken and the number of
+    locked allocations.
+    """
+    matrix = load_preference_matrix(timeframe_id, 'student')
+
+    kept = db.session.query(
+        AllocationResult.user_id, AllocationResult.project_id, AllocationResult.status
+    ).filter(
+        AllocationResult.timeframe_id == timeframe_id,
+        AllocationResult.role_type == 'student',
+        db.or_(AllocationResult.allocation_method != AUTOMATIC_METHOD,
+               AllocationResult.status != 'pending')
+    ).all()
+    locked_users = np.array([row.user_id for row in kept], dtype=np.int64)
+    seat_projects = matrix.project_positions(
+        [row.project_id for row in kept if row.status in ('pending', 'confirmed')]
+    )
+    seats_taken = np.bincount(seat_projects[seat_projects >= 0], minlength=matrix.n_projects)
+
+    matrix = matrix.select_users(~np.isin(matrix.user_ids, locked_users))
+    return matrix, seats_taken, len(kept)
+
+
+def _unallocated_reason(has_preferences: bool, has_open_choice: bool) -> str:
+    if not has_preferences:
+        return 'no_preferences'
+    if not has_open_choice:
+        return 'insufficient_projects'
+    return 'all_preferences_full'
+
+
+def run_student_allocation(timeframe_id: int, allocated_by: Optional[int] = None,
+                           cost_exponent: float = 1.0) -> Dict[str, Any]:
+    """
+    Compute and store a new automatic student allocation batch for a timeframe.
+
+    Pending automatic rows from earlier runs are replaced. Manual, override and confirmed
+    allocations are kept: their students are skipped and their seats count against capacity.
+    Writes one AllocationResult batch and one set of UnallocatedUser rows; the caller commits.
+    """
+    # Replace the previous automatic proposal and its unresolved leftovers
+    AllocationResult.query.filter_by(
+        timeframe_id=timeframe_id, role_type='student',
+        allocation_method=AUTOMATIC_METHOD, status='pending'
+    ).delete(synchronize_session=False)
+    UnallocatedUser.query.filter_by(
+        timeframe_id=timeframe_id, expected_role='student', resolved=False
+    ).delete(synchronize_session=False)
+
+    matrix, seats_taken, locked_count = load_open_allocation_matrix(timeframe_id)
+    matrix.capacities = np.clip(matrix.capacities - seats_taken, 0, None)
+
+    assignment = solve_student_allocation(
+        matrix.rows, matrix.cols, matrix.ranks, matrix.capacities, matrix.n_users,
+        cost_exponent=cost_exponent
+    )
+    fulfilled = matrix.ranks_for_assignment(assignment)
+
+    batch_id = new_allocation_batch_id(timeframe_id)
+    now = datetime.utcnow()
+
+    has_preferences = matrix.preferences_per_user() > 0
+    has_open_choice = np.zeros(matrix.n_users, dtype=bool)
+    has_open_choice[matrix.rows[matrix.capacities[matrix.cols] > 0]] = True
+
+    allocation_rows = []
+    unallocated_rows = []
+    rank_counts = {}
+    for s, user_id in enumerate(matrix.user_ids.tolist()):
+        p = int(assignment[s])
+        if p >= 0:
+            rank = int(fulfilled[s])
+            rank_counts[rank] = rank_counts.get(rank, 0) + 1
+            allocation_rows.append({
+                'user_id': user_id,
+                'project_id': int(matrix.project_ids[p]),
+                'timeframe_id': timeframe_id,
+                'role_type': 'student',
+                'preference_rank_fulfilled': rank,
+                'allocation_batch_id': batch_id,
+                'allocation_method': AUTOMATIC_METHOD,
+                'status': 'pending',
+                'allocated_at': now,
+                'allocated_by': allocated_by,
+            })
+        else:
+            reason = _unallocated_reason(bool(has_preferences[s]), bool(has_open_choice[s]))
+            unallocated_rows.append({
+                'user_id': user_id,
+                'timeframe_id': timeframe_id,
+                'allocation_batch_id': batch_id,
+                'expected_role': 'student',
+                'reason': reason,
+                'details': f'Automatic allocation batch {batch_id}',
+                'manual_intervention_required': True,
+                'resolved': False,
+                'created_at': now,
+            })
+
+    if allocation_rows:
+        db.session.execute(AllocationResult.__table__.insert(), allocation_rows)
+    if unallocated_rows:
+        db.session.execute(UnallocatedUser.__table__.insert(), unallocated_rows)
+
+    allocated_count = len(allocation_rows)
+    total_rank = sum(rank * count for rank, count in rank_counts.items())
+    logger.info(
+        f"Allocation batch {batch_id} for timeframe {timeframe_id}: "
+        f"{allocated_count} allocated, {len(unallocated_rows)} unallocated"
+    )
+
+    return {
+        'success': True,
+        'batch_id': batch_id,
+        'students_considered': matrix.n_users,
+        'locked_allocations': locked_count,
+        'allocated': allocated_count,
+        'unallocated': len(unallocated_rows),
+        'first_choice': rank_counts.get(1, 0),
+        'mean_rank': round(total_rank / allocated_count, 3) if allocated_count else None,
+        'rank_distribution': {str(rank): rank_counts[rank] for rank in sorted(rank_counts)},
+    }
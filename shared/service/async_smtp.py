@@ -0,0 +1,347 @@
+import asyncio
+import base64
+import logging
+import re
+import smtplib
+import socket
+import ssl
+from email import policy
+from email.message import Message
+from email.utils import getaddresses
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+from shared.service.smtp_pool import (
+    SEND_RETRIES_ON_DISCONNECT, RateLimiter, get_rate_limiter, remember_capabilities, smtp_setting
+)
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CRLF = b'\r\n'
+# Lines of the message that start with a dot get a second one (RFC 5321 section 4.5.2)
+_LEADING_DOT = re.compile(rb'^\.', re.MULTILINE)
+
+# StreamWriter.start_tls is Python 3.11+; without it the asyncio sender only talks to plain servers
+STARTTLS_SUPPORTED = hasattr(asyncio.StreamWriter, 'start_tls')
+
+
+def _message_bytes(msg: Message) -> bytes:
+    data = msg.as_bytes(policy=policy.SMTP)
+    data = _LEADING_DOT.sub(b'..', data)
+    if not data.endswith(CRLF):
+        data += CRLF
+    return data + b'.' + CRLF
+
+
+def _envelope(msg: Message) -> Tuple[str, List[str]]:
+    """Envelope sender and recipients of a message, as smtplib.send_message derives them"""
+    sender = getaddresses([msg['Sender'] or msg['From'] or ''])
+    recipients = [address for _, address in getaddresses(
+        [value for header in ('To', 'Cc', 'Bcc') for value in msg.get_all(header, [])]
+    ) if address]
+    return (sender[0][1] if sender else ''), recipients
+
+
+class AsyncSMTPConnection:
+    """
+    One SMTP session on asyncio streams, the coroutine counterpart of an smtplib.SMTP object that
+    EmailService.open_connection has connected and logged in. When the server advertises
+    PIPELINING, MAIL, RCPT and DATA go out in one write, so a message costs two round trips
+    instead of four. Errors are raised as the smtplib exception the blocking client would raise.
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.esmtp_features: Dict[str, str] = {}
+        self.sent = 0
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def connect(self, username: str, password: str, use_tls: bool = False,
+                      local_hostname: Optional[str] = None):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise smtplib.SMTPConnectError(421, f'Could not connect to {self.host}:{self.port}: {e}'.encode())
+        try:
+            code, reply = await self._read_reply()
+            if code != 220:
+                raise smtplib.SMTPConnectError(code, reply)
+            hostname = local_hostname or socket.getfqdn()
+            await self.ehlo(hostname)
+            # Only offered before the upgrade
+            starttls = self.has_extn('starttls')
+            if use_tls:
+                await self.starttls()
+                await self.ehlo(hostname)
+            await self.login(username, password)
+            remember_capabilities((self.host, self.port), self.esmtp_features, starttls)
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    async def _read_reply(self) -> Tuple[int, bytes]:
+        lines = []
+        while True:
+            try:
+                line = await asyncio.wait_for(self._reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                raise smtplib.SMTPServerDisconnected('Timed out waiting for the SMTP server')
+            except OSError as e:
+                raise smtplib.SMTPServerDisconnected(str(e))
+            if not line:
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            lines.append(line[4:].strip())
+            if line[3:4] != b'-':
+                try:
+                    return int(line[:3]), b'\n'.join(lines)
+                except ValueError:
+                    raise smtplib.SMTPServerDisconnected(f'Malformed SMTP reply {line!r}')
+
+    async def _write(self, data: bytes):
+        try:
+            self._writer.write(data)
+            await asyncio.wait_for(self._writer.drain(), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise smtplib.SMTPServerDisconnected(str(e) or 'Timed out sending to the SMTP server')
+
+    async def command(self, line: str) -> Tuple[int, bytes]:
+        await self._write(line.encode('ascii') + CRLF)
+        return await self._read_reply()
+
+    async def ehlo(self, hostname: str):
+        code, reply = await self.command(f'EHLO {hostname}')
+        if code != 250:
+            raise smtplib.SMTPHeloError(code, reply)
+        self.esmtp_features = {}
+        for line in reply.decode('latin-1').split('\n')[1:]:
+            keyword, _, params = line.partition(' ')
+            self.esmtp_features[keyword.lower()] = params.strip()
+
+    def has_extn(self, name: str) -> bool:
+        return name.lower() in self.esmtp_features
+
+    async def starttls(self):
+        if not self.has_extn('starttls'):
+            raise smtplib.SMTPNotSupportedError('STARTTLS extension not supported by server.')
+        if not STARTTLS_SUPPORTED:
+            raise smtplib.SMTPNotSupportedError('STARTTLS from the asyncio sender needs Python 3.11+')
+        code, reply = await self.command('STARTTLS')
+        if code != 220:
+            raise smtplib.SMTPResponseException(code, reply)
+        await self._writer.start_tls(ssl.create_default_context(), server_hostname=self.host)
+
+    async def login(self, username: str, password: str):
+        mechanisms = self.esmtp_features.get('auth', '').upper().split()
+        if 'PLAIN' in mechanisms:
+            token = base64.b64encode(f'\0{username}\0{password}'.encode()).decode('ascii')
+            code, reply = await self.command(f'AUTH PLAIN {token}')
+        elif 'LOGIN' in mechanisms:
+            code, reply = await self.command('AUTH LOGIN')
+            if code == 334:
+                code, reply = await self.command(base64.b64encode(username.encode()).decode('ascii'))
+            if code == 334:
+                code, reply = await self.command(base64.b64encode(password.encode()).decode('ascii'))
+        else:
+            raise smtplib.SMTPNotSupportedError('No suitable authentication method found.')
+        if code not in (235, 503):  # 503: already authenticated
+            raise smtplib.SMTPAuthenticationError(code, reply)
+
+    async def _reset(self):
+        try:
+            await self.command('RSET')
+        except smtplib.SMTPServerDisconnected:
+            pass
+
+    async def send_message(self, msg: Message) -> Dict[str, Tuple[int, bytes]]:
+        """Send one message; returns the refused recipients when some (not all) were refused"""
+        sender, recipients = _envelope(msg)
+        if not recipients:
+            raise smtplib.SMTPRecipientsRefused({})
+        data = _message_bytes(msg)
+        mail = f'MAIL FROM:<{sender}>'
+        if self.has_extn('size'):
+            # Declared like smtplib does, so the server can refuse an oversized message up front
+            limit = self.esmtp_features['size']
+            if limit.isdigit() and 0 < int(limit) < len(data):
+                raise smtplib.SMTPSenderRefused(552, b'Message size exceeds fixed maximum message size', sender)
+            mail += f' SIZE={len(data)}'
+        commands = [mail] + [f'RCPT TO:<{address}>' for address in recipients] + ['DATA']
+        if self.has_extn('pipelining'):
+            await self._write(b''.join(line.encode('ascii') + CRLF for line in commands))
+            replies = [await self._read_reply() for _ in commands]
+        else:
+            # Without pipelining a refused sender ends the transaction before the recipients
+            replies = [await self.command(commands[0])]
+            if replies[0][0] == 250:
+                replies += [await self.command(line) for line in commands[1:-1]]
+                accepted = any(code in (250, 251) for code, _ in replies[1:])
+                replies.append(await self.command('DATA') if accepted else (503, b'No valid recipients'))
+
+        (mail_code, mail_reply), data_reply = replies[0], replies[-1]
+        if mail_code != 250:
+            if data_reply[0] == 354:
+                await self._write(b'.' + CRLF)
+                await self._read_reply()
+            await self._reset()
+            raise smtplib.SMTPSenderRefused(mail_code, mail_reply, sender)
+        refused = {address: reply for address, reply in zip(recipients, replies[1:-1]) if reply[0] not in (250, 251)}
+        if len(refused) == len(recipients):
+            if data_reply[0] == 354:
+                # Some servers answer DATA before checking recipients; end the empty message
+                await self._write(b'.' + CRLF)
+                await self._read_reply()
+            await self._reset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+        if data_reply[0] != 354:
+            await self._reset()
+            raise smtplib.SMTPDataError(*data_reply)
+
+        await self._write(data)
+        code, reply = await self._read_reply()
+        if code != 250:
+            await self._reset()
+            raise smtplib.SMTPDataError(code, reply)
+        self.sent += 1
+        return refused
+
+    async def quit(self):
+        try:
+            await self.command('QUIT')
+        except smtplib.SMTPException:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+class AsyncSMTPSender:
+    """
+    Sends many messages through the server of one EmailService from a single event loop. Up to
+    `concurrency` sends are in flight at once, each on its own session; sessions are reused until
+    `messages_per_connection`, so concurrency costs sockets, not threads, and round trips overlap
+    instead of adding up. Sends share the server's rate limiter with the threaded pool, and a
+    dropped session is re-opened and the message sent again, as in SMTPConnectionPool.
+    """
+
+    def __init__(self, email_service, concurrency: Optional[int] = None, messages_per_connection: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None, timeout: Optional[float] = None):
+        self.email_service = email_service
+        self.concurrency = max(1, int(concurrency or smtp_setting('SMTP_ASYNC_CONCURRENCY')))
+        self.messages_per_connection = int(messages_per_connection or smtp_setting('SMTP_MESSAGES_PER_CONNECTION'))
+        self.timeout = float(timeout or smtp_setting('SMTP_TIMEOUT_SECONDS'))
+        self.rate_limiter = rate_limiter or get_rate_limiter((email_service.smtp_server, email_service.smtp_port))
+        self._idle: List[AsyncSMTPConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.connections_opened = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Created lazily so it belongs to the loop that runs the sends
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        return self._slots
+
+    async def _connect(self) -> AsyncSMTPConnection:
+        service = self.email_service
+        connection = AsyncSMTPConnection(service.smtp_server, service.smtp_port, self.timeout)
+        await connection.connect(service.smtp_username, service.smtp_password,
+                                 use_tls=bool(service.use_ssl or service.use_tls))
+        self.connections_opened += 1
+        return connection
+
+    async def _release(self, connection: Optional[AsyncSMTPConnection]):
+        if connection is None:
+            return
+        if connection.sent >= self.messages_per_connection:
+            await connection.quit()
+        else:
+            self._idle.append(connection)
+
+    async def warm(self):
+        """Open one session now, so an unreachable server or a bad login is raised before any send"""
+        async with self.slots:
+            await self._release(self._idle.pop() if self._idle else await self._connect())
+
+    async def send_message(self, msg: Message):
+        """Send one message on an idle or new session; raises smtplib errors the server reports"""
+        async with self.slots:
+            connection = self._idle.pop() if self._idle else await self._connect()
+            try:
+                wait = self.rate_limiter.try_acquire()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = self.rate_limiter.try_acquire()
+                for attempt in range(SEND_RETRIES_ON_DISCONNECT + 1):
+                    try:
+                        await connection.send_message(msg)
+                        return
+                    except smtplib.SMTPServerDisconnected:
+                        if attempt == SEND_RETRIES_ON_DISCONNECT:
+                            raise
+                        logger.info(f"SMTP connection to {self.email_service.smtp_server} dropped; reconnecting")
+                        connection.close()
+                        connection = None
+                        connection = await self._connect()
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                # The transaction was reset; the session is still good
+                raise
+            except BaseException:
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                raise
+            finally:
+                await self._release(connection)
+
+    async def send_many(self, messages: Iterable[Tuple[Hashable, Message]]) -> Tuple[int, Dict[Hashable, Exception]]:
+        """
+        Send (key, message) pairs, `concurrency` at a time; the key identifies the message in the
+        result. Returns (sent_count, {failed key: exception}), like SMTPConnectionPool.send_many.
+        """
+        failed: Dict[Hashable, Exception] = {}
+        sent = 0
+        # Bounded submission keeps at most a few messages per session rendered ahead
+        in_flight = asyncio.Semaphore(self.concurrency * 4)
+
+        async def send(key, msg):
+            nonlocal sent
+            try:
+                await self.send_message(msg)
+                sent += 1
+            except Exception as e:
+                logger.error(f"Failed to send email {key}: {str(e)}")
+                failed[key] = e
+            finally:
+                in_flight.release()
+
+        tasks = set()
+        for key, msg in messages:
+            await in_flight.acquire()
+            task = asyncio.ensure_future(send(key, msg))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return sent, failed
+
+    async def close(self):
+        """Quit every idle session"""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(connection.quit() for connection in idle))
@@ -0,0 +1,413 @@
+import asyncio
+import logging
+import os
+import smtplib
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app, has_app_context
+from sqlalchemy import exists, insert, literal, select, update
+
+from database import db
+from shared.models import EmailOutbox, Timeframe, User, user_timeframes
+from shared.service.async_smtp import AsyncSMTPSender
+from shared.service.email_service import EmailService, WelcomeEmailTemplate, render_welcome_emails, resolve_send_mode
+from shared.service.password_hashing import generate_credentials
+from shared.service.smtp_pool import SMTPConnectionPool
+from shared.utils.bulk_helpers import chunked
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WELCOME_EMAIL = 'welcome'
+
+ACTIVE_STATUSES = ('pending', 'sending')
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_OUTBOX_SETTINGS = {
+    'EMAIL_OUTBOX_WORKERS': 1,
+    'EMAIL_OUTBOX_BATCH_SIZE': 200,
+    'EMAIL_OUTBOX_POLL_SECONDS': 5.0,
+    'EMAIL_OUTBOX_MAX_ATTEMPTS': 5,
+    'EMAIL_OUTBOX_BACKOFF_SECONDS': 60.0,  # doubled after every failed attempt
+    'EMAIL_OUTBOX_MAX_BACKOFF_SECONDS': 6 * 3600.0,
+    'EMAIL_OUTBOX_LEASE_SECONDS': 600.0,  # a 'sending' row older than this is handed out again
+}
+
+# Set when messages are queued so idle workers send them without waiting for the next poll
+_wake = threading.Event()
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def outbox_setting(key):
+    source = current_app.config if has_app_context() else {}
+    value = source.get(key)
+    return DEFAULT_OUTBOX_SETTINGS[key] if value is None else value
+
+
+def enqueue_welcome_emails(timeframe, school_id: Optional[int] = None) -> dict:
+    """
+    Queue a welcome email for every user of the timeframe who does not already have one waiting,
+    with one INSERT ... SELECT, and commit. Nothing is rendered here and no password is generated:
+    the worker that first claims a message does both (see render_welcome_messages), so the request
+    costs the same for ten users or ten thousand.
+    Returns {'queued': n, 'already_queued': n}.
+    """
+    waiting = db.session.query(db.func.count(EmailOutbox.id)).filter(
+        EmailOutbox.kind == WELCOME_EMAIL,
+        EmailOutbox.timeframe_id == timeframe.id,
+        EmailOutbox.status.in_(ACTIVE_STATUSES)
+    ).scalar()
+    active = select(EmailOutbox.id).where(
+        EmailOutbox.kind == WELCOME_EMAIL,
+        EmailOutbox.timeframe_id == timeframe.id,
+        EmailOutbox.status.in_(ACTIVE_STATUSES),
+        EmailOutbox.user_id == User.id
+    )
+    now = datetime.utcnow()
+    members = select(
+        literal(WELCOME_EMAIL), literal(school_id or timeframe.school_id), literal(timeframe.id), User.id, User.email,
+        literal(WelcomeEmailTemplate(timeframe).subject), literal('pending'), literal(0), literal(now), literal(now)
+    ).join(user_timeframes, user_timeframes.c.user_id == User.id).where(
+        user_timeframes.c.timeframe_id == timeframe.id,
+        ~exists(active)
+    )
+    queued = db.session.execute(insert(EmailOutbox).from_select([
+        'kind', 'school_id', 'timeframe_id', 'user_id', 'to_email', 'subject', 'status', 'attempts',
+        'next_attempt_at', 'created_at'
+    ], members)).rowcount
+    db.session.commit()
+
+    logger.info(f"Queued {queued} welcome emails for timeframe {timeframe.id} ({waiting} already queued)")
+    if queued:
+        _wake.set()
+    return {'queued': queued, 'already_queued': waiting}
+
+
+def render_welcome_messages(messages: List[EmailOutbox]) -> List[EmailOutbox]:
+    """
+    Render the claimed welcome messages that were queued without a body, and commit them before
+    anything is sent. Users who never received a welcome email are issued their first-login
+    password here (imports create accounts with an unusable hash); its hash is committed together
+    with the body, so the password in a message is always the one the account accepts and no
+    plain-text password is stored anywhere else. A user who already has another rendered welcome
+    email waiting keeps that password and gets none here.
+    Returns the messages to send; those whose user no longer exists are dead-lettered.
+    """
+    unrendered = [message for message in messages if message.kind == WELCOME_EMAIL and message.body_text is None]
+    if not unrendered:
+        return messages
+
+    users = {}
+    for chunk in chunked([message.user_id for message in unrendered if message.user_id]):
+        users.update((user.id, user) for user in User.query.filter(User.id.in_(chunk)))
+
+    first_login = [user_id for user_id, user in users.items() if not user.email_sent]
+    carried = set()
+    claimed_ids = [message.id for message in unrendered]
+    for chunk in chunked(first_login):
+        carried.update(user_id for (user_id,) in db.session.query(EmailOutbox.user_id).filter(
+            EmailOutbox.kind == WELCOME_EMAIL,
+            EmailOutbox.status.in_(ACTIVE_STATUSES),
+            EmailOutbox.body_text.isnot(None),
+            EmailOutbox.user_id.in_(chunk),
+            EmailOutbox.id.notin_(claimed_ids)
+        ))
+    issued = [user_id for user_id in first_login if user_id not in carried]
+    passwords = {}
+    if issued:
+        # Generated and hashed in the shared process pool
+        credentials = generate_credentials(len(issued))
+        db.session.execute(update(User), [
+            {'id': user_id, 'password_hash': password_hash}
+            for user_id, (_, password_hash) in zip(issued, credentials)
+        ])
+        passwords = {user_id: password for user_id, (password, _) in zip(issued, credentials)}
+
+    by_timeframe: Dict[Optional[int], List[EmailOutbox]] = {}
+    for message in unrendered:
+        if message.user_id not in users:
+            message.status = 'dead'
+            message.last_error = 'User no longer exists'
+            message.worker_id = None
+            message.locked_at = None
+            continue
+        by_timeframe.setdefault(message.timeframe_id, []).append(message)
+
+    for timeframe_id, timeframe_messages in by_timeframe.items():
+        timeframe = db.session.get(Timeframe, timeframe_id)
+        contents = render_welcome_emails(
+            [users[message.user_id] for message in timeframe_messages], timeframe,
+            {users[user_id].email: password for user_id, password in passwords.items()}
+        )
+        for message, (_, email_content) in zip(timeframe_messages, contents):
+            message.subject = email_content['subject']
+            message.body_text = email_content['text_body']
+    db.session.commit()
+
+    rendered = len(unrendered) - sum(message.status == 'dead' for message in unrendered)
+    logger.info(f"Rendered {rendered} welcome emails ({len(issued)} passwords issued)")
+    return [message for message in messages if message.status == 'sending']
+
+
+def outbox_summary(timeframe_id: int, kind: str = WELCOME_EMAIL) -> dict:
+    """Message counts per status for a timeframe, with the dead letters' recipients and errors"""
+    counts = dict.fromkeys(('pending', 'sending', 'sent', 'dead'), 0)
+    counts.update(db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id)).filter(
+        EmailOutbox.timeframe_id == timeframe_id, EmailOutbox.kind == kind
+    ).group_by(EmailOutbox.status))
+    dead = EmailOutbox.query.filter_by(timeframe_id=timeframe_id, kind=kind, status='dead') \
+        .order_by(EmailOutbox.id).limit(100).all()
+    return {'counts': counts, 'dead': [message.to_dict() for message in dead]}
+
+
+def retry_dead_letters(timeframe_id: int, kind: str = WELCOME_EMAIL) -> int:
+    """
+    Give every dead-lettered message of a timeframe a fresh set of attempts; commits. Welcome emails
+    lost their body when they were dead-lettered and are rendered again when next claimed.
+    """
+    retried = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.timeframe_id == timeframe_id, EmailOutbox.kind == kind, EmailOutbox.status == 'dead')
+        .values(status='pending', attempts=0, next_attempt_at=datetime.utcnow(), worker_id=None, locked_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if retried:
+        _wake.set()
+    return retried
+
+
+def recover_stale_sends() -> int:
+    """
+    Hand out again messages whose worker stopped before recording the outcome (crash or restart).
+    Delivery is at-least-once: such a message may have been sent just before the worker stopped.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=float(outbox_setting('EMAIL_OUTBOX_LEASE_SECONDS')))
+    recovered = db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.status == 'sending', EmailOutbox.locked_at < cutoff)
+        .values(status='pending', worker_id=None, locked_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    if recovered:
+        logger.warning(f"Recovered {recovered} outbox messages from stopped workers")
+    return recovered
+
+
+def claim_batch(worker_id: str, batch_size: Optional[int] = None) -> List[EmailOutbox]:
+    """Atomically move up to `batch_size` due pending messages to sending for this worker"""
+    batch_size = int(batch_size or outbox_setting('EMAIL_OUTBOX_BATCH_SIZE'))
+    now = datetime.utcnow()
+    ids = [message_id for (message_id,) in db.session.query(EmailOutbox.id).filter(
+        EmailOutbox.status == 'pending',
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(batch_size)]
+    if not ids:
+        return []
+    # Rows another worker claimed in the meantime no longer match status='pending'
+    db.session.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(ids), EmailOutbox.status == 'pending')
+        .values(status='sending', worker_id=worker_id, locked_at=now, attempts=EmailOutbox.attempts + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return EmailOutbox.query.filter(
+        EmailOutbox.id.in_(ids), EmailOutbox.status == 'sending', EmailOutbox.worker_id == worker_id
+    ).populate_existing().order_by(EmailOutbox.id).all()
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Refused recipients and 5xx replies will not succeed on a retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+def _record_failure(message: EmailOutbox, error: Exception, now: datetime):
+    message.last_error = str(error) or error.__class__.__name__
+    message.worker_id = None
+    message.locked_at = None
+    if is_permanent_failure(error) or message.attempts >= int(outbox_setting('EMAIL_OUTBOX_MAX_ATTEMPTS')):
+        message.status = 'dead'
+        # The body may hold a first-login password that was never delivered; a retried welcome
+        # email is rendered again, with a new password
+        message.body_text = None
+        message.body_html = None
+        logger.error(f"Outbox message {message.id} to {message.to_email} dead-lettered after "
+                     f"{message.attempts} attempts: {message.last_error}")
+        return
+    delay = min(float(outbox_setting('EMAIL_OUTBOX_BACKOFF_SECONDS')) * 2 ** (message.attempts - 1),
+                float(outbox_setting('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS')))
+    message.status = 'pending'
+    message.next_attempt_at = now + timedelta(seconds=delay)
+
+
+def _built_messages(email_service: EmailService, messages: List[EmailOutbox]):
+    for message in messages:
+        yield message.id, email_service.build_message(
+            message.to_email, message.subject, message.body_text or '', message.body_html
+        )
+
+
+def _deliver_async(email_service: EmailService, messages: List[EmailOutbox]) -> Dict[int, Exception]:
+    sender = AsyncSMTPSender(email_service)
+
+    async def deliver():
+        async with sender:
+            await sender.warm()
+            return await sender.send_many(_built_messages(email_service, messages))
+
+    _, failures = asyncio.run(deliver())
+    return failures
+
+
+def _deliver_pooled(email_service: EmailService, messages: List[EmailOutbox]) -> Dict[int, Exception]:
+    pool = SMTPConnectionPool(email_service)
+    try:
+        pool.warm()
+    except Exception:
+        pool.close()
+        raise
+    with pool:
+        _, failures = pool.send_many(_built_messages(email_service, messages))
+    return failures
+
+
+def _deliver_school(school_id: Optional[int], messages: List[EmailOutbox]) -> Dict[int, Exception]:
+    """
+    Send one school's messages with the SMTP_SEND_MODE sender; returns {message id: error} for failures.
+    The asyncio sender is used when that mode resolves to async, the connection pool otherwise
+    (threaded and single only apply to direct send_welcome_emails calls)
+    """
+    email_service = EmailService.get_service_with_config(school_id)
+    if not email_service.smtp_username or not email_service.smtp_password:
+        error = RuntimeError('Email service not configured. Please configure email settings in the dashboard.')
+        return {message.id: error for message in messages}
+
+    mode = resolve_send_mode(email_service)
+    deliver = _deliver_async if mode == 'async' else _deliver_pooled
+    try:
+        return deliver(email_service, messages)
+    except Exception as e:
+        # The server or login is unusable (warm failed); every message is retried later
+        logger.error(f"SMTP connection failed for school {school_id} ({mode} sending): {str(e)}")
+        return {message.id: e for message in messages}
+
+
+def deliver_batch(messages: List[EmailOutbox]) -> int:
+    """Render and send claimed messages and record every outcome in one commit; returns the number sent"""
+    messages = render_welcome_messages(messages)
+    by_school: Dict[Optional[int], List[EmailOutbox]] = {}
+    for message in messages:
+        by_school.setdefault(message.school_id, []).append(message)
+
+    failures: Dict[int, Exception] = {}
+    for school_id, school_messages in by_school.items():
+        failures.update(_deliver_school(school_id, school_messages))
+
+    now = datetime.utcnow()
+    welcomed_users = []
+    for message in messages:
+        error = failures.get(message.id)
+        if error is not None:
+            _record_failure(message, error, now)
+            continue
+        message.status = 'sent'
+        message.sent_at = now
+        message.last_error = None
+        message.worker_id = None
+        message.locked_at = None
+        # The body may hold a first-login password; it is not kept once delivered
+        message.body_text = None
+        message.body_html = None
+        if message.kind == WELCOME_EMAIL and message.user_id:
+            welcomed_users.append(message.user_id)
+
+    for chunk in chunked(welcomed_users):
+        db.session.execute(
+            update(User).where(User.id.in_(chunk)).values(email_sent=True)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    sent = len(messages) - len(failures)
+    logger.info(f"Outbox batch: {sent} sent, {len(failures)} failed")
+    return sent
+
+
+def drain_outbox(worker_id: Optional[str] = None, max_batches: Optional[int] = None) -> int:
+    """Deliver due messages in batches until none are left; returns the number of messages handled"""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:inline'
+    handled = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        messages = claim_batch(worker_id)
+        if not messages:
+            break
+        deliver_batch(messages)
+        handled += len(messages)
+        batches += 1
+    return handled
+
+
+class EmailOutboxWorker(threading.Thread):
+    """Daemon thread that drains the outbox; any number of workers across processes may run"""
+
+    def __init__(self, app, index: int = 0):
+        super().__init__(name=f'email-outbox-worker-{index}', daemon=True)
+        self.app = app
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:outbox-{index}'
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        _wake.set()
+
+    def run(self):
+        logger.info(f"Email outbox worker {self.worker_id} started")
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                poll_seconds = float(outbox_setting('EMAIL_OUTBOX_POLL_SECONDS'))
+                try:
+                    recover_stale_sends()
+                    # One batch per loop so a stop request is noticed between batches
+                    handled = drain_outbox(self.worker_id, max_batches=1)
+                except Exception as e:
+                    # Typically the database being unavailable or not created yet
+                    db.session.rollback()
+                    logger.error(f"Email outbox worker {self.worker_id} error: {e}")
+                    handled = 0
+            if not handled:
+                _wake.wait(poll_seconds)
+                _wake.clear()
+
+
+def start_outbox_workers(app, count: Optional[int] = None):
+    """Start the outbox workers once per process; EMAIL_OUTBOX_WORKERS=0 disables them"""
+    with _workers_lock:
+        if _workers:
+            return list(_workers)
+        if count is None:
+            count = app.config.get('EMAIL_OUTBOX_WORKERS', DEFAULT_OUTBOX_SETTINGS['EMAIL_OUTBOX_WORKERS'])
+        for index in range(int(count)):
+            worker = EmailOutboxWorker(app, index)
+            worker.start()
+            _workers.append(worker)
+        return list(_workers)
+
+
+def stop_outbox_workers():
+    with _workers_lock:
+        for worker in _workers:
+            worker.stop()
+        for worker in _workers:
+            worker.join(timeout=5)
+        _workers.clear()
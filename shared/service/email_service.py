@@ -4,13 +4,44 @@ from email.mime.multipart import MIMEMultipart
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import threading
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
+import asyncio
 import os
+from types import SimpleNamespace
+
+from shared.service.async_smtp import STARTTLS_SUPPORTED, AsyncSMTPSender
+from shared.service.smtp_pool import (
+    SMTPConnectionPool, remember_capabilities, smtp_capabilities_cache, smtp_setting
+)
+from shared.utils.bulk_helpers import DEFAULT_CHUNK_SIZE, chunked
+from shared.utils.ttl_cache import TTLCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Active EmailConfig per school (key None: the first active one) as detached copies, so senders do
+# not query it for every batch. The setup page invalidates a school's entry when it saves or deletes
+# the config; other processes pick the change up within the TTL.
+EMAIL_CONFIG_CACHE_TTL = 300  # seconds
+email_config_cache = TTLCache(maxsize=256, ttl=EMAIL_CONFIG_CACHE_TTL)
+
+def _load_email_config(school_id=None):
+    from shared.models import EmailConfig
+    
+    if school_id:
+        config = EmailConfig.query.filter_by(school_id=school_id, is_active=True).first()
+    else:
+        config = EmailConfig.query.filter_by(is_active=True).first()
+    if config is None:
+        return None
+    return SimpleNamespace(**{column.name: getattr(config, column.name) for column in EmailConfig.__table__.columns})
+
+def invalidate_email_config(school_id=None):
+    """Forget the cached config of a school, and the school-less lookup that may have returned it"""
+    email_config_cache.invalidate(school_id or None)
+    email_config_cache.invalidate(None)
+
 class EmailService:
     """Service for sending emails with dynamic configuration"""
     
@@ -41,14 +72,9 @@ class EmailService:
     
     @classmethod
     def get_service_with_config(cls, school_id=None):
-        """Get EmailService instance with current database configuration"""
-        from shared.models import EmailConfig
-        
+        """Get EmailService instance with current database configuration (cached per school)"""
         try:
-            if school_id:
-                config = EmailConfig.query.filter_by(school_id=school_id, is_active=True).first()
-            else:
-                config = EmailConfig.query.filter_by(is_active=True).first()
+            config = email_config_cache.get_or_load(school_id or None, lambda: _load_email_config(school_id))
                 
             if config:
                 return cls(config)
@@ -62,19 +88,15 @@ class EmailService:
             return cls()
     
     def test_connection(self) -> Dict[str, Any]:
-        """Test SMTP connection and return result"""
+        """Test SMTP connection and return result, with the server capabilities it recorded"""
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                if self.use_ssl:
-                    server.starttls()
-                elif self.use_tls:
-                    server.starttls()
-                
-                server.login(self.smtp_username, self.smtp_password)
+            server = self.open_connection(timeout=smtp_setting('SMTP_TIMEOUT_SECONDS'))
+            server.quit()
                 
             return {
                 'success': True,
-                'message': 'SMTP connection successful'
+                'message': 'SMTP connection successful',
+                'capabilities': self.get_capabilities(probe=False)
             }
             
         except smtplib.SMTPAuthenticationError:
@@ -104,32 +126,85 @@ class EmailService:
             try:
                 from database import db
                 from datetime import datetime
+                from shared.models import EmailConfig
                 
-                self.config.last_test_at = datetime.utcnow()
-                self.config.last_test_success = test_result['success']
-                self.config.last_test_error = None if test_result['success'] else test_result['message']
+                # self.config may be a cached copy; update the row itself
+                config = db.session.get(EmailConfig, self.config.id)
+                config.last_test_at = datetime.utcnow()
+                config.last_test_success = test_result['success']
+                config.last_test_error = None if test_result['success'] else test_result['message']
                 
                 db.session.commit()
             except Exception as e:
                 logger.error(f"Could not update config test result: {e}")
+    
+    def open_connection(self, timeout: Optional[float] = None) -> smtplib.SMTP:
+        """
+        Connected, TLS-upgraded and logged-in SMTP session; the caller must quit() it
+        The server's EHLO capabilities are recorded for get_capabilities
+        """
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=timeout) if timeout else \
+            smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            server.ehlo()
+            # Only offered before the upgrade
+            starttls = server.has_extn('starttls')
+            if self.use_ssl:
+                server.starttls()
+            elif self.use_tls:
+                server.starttls()
+            
+            # login() repeats EHLO after STARTTLS, so these are the features of this session
+            server.login(self.smtp_username, self.smtp_password)
+            remember_capabilities((self.smtp_server, self.smtp_port), server.esmtp_features, starttls)
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def get_capabilities(self, probe: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        EHLO capabilities of this service's server (pipelining, size, starttls, auth) as seen by the
+        last connection to it. Without one, a bare EHLO (no TLS or login) is sent when `probe` is set.
+        None if unknown or the server is unreachable.
+        """
+        def probe_server():
+            try:
+                with smtplib.SMTP(self.smtp_server, self.smtp_port,
+                                  timeout=smtp_setting('SMTP_TIMEOUT_SECONDS')) as server:
+                    server.ehlo()
+                    return remember_capabilities((self.smtp_server, self.smtp_port), server.esmtp_features)
+            except (OSError, smtplib.SMTPException) as e:
+                logger.warning(f"Could not probe SMTP server {self.smtp_server}:{self.smtp_port}: {e}")
+                return None
+        
+        server = (self.smtp_server, self.smtp_port)
+        if not probe:
+            return smtp_capabilities_cache.get(server)
+        return smtp_capabilities_cache.get_or_load(server, probe_server, cache_if=lambda capabilities: capabilities is not None)
+    
+    def build_message(self, to_email: str, subject: str, body_text: str, body_html: str = None) -> MIMEMultipart:
+        """MIME message from this service's sender to `to_email`"""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.from_name} <{self.from_email}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        # Add text part
+        text_part = MIMEText(body_text, 'plain')
+        msg.attach(text_part)
+        
+        # Add HTML part if provided
+        if body_html:
+            html_part = MIMEText(body_html, 'html')
+            msg.attach(html_part)
+        return msg
         
     def send_email(self, to_email: str, subject: str, body_text: str, body_html: str = None) -> bool:
         """Send a single email"""
         try:
             # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Add text part
-            text_part = MIMEText(body_text, 'plain')
-            msg.attach(text_part)
-            
-            # Add HTML part if provided
-            if body_html:
-                html_part = MIMEText(body_html, 'html')
-                msg.attach(html_part)
+            msg = self.build_message(to_email, subject, body_text, body_html)
             
             # Send email
             with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
@@ -152,19 +227,7 @@ class EmailService:
         """Send email using existing SMTP connection (much faster)"""
         try:
             # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Add text part
-            text_part = MIMEText(body_text, 'plain')
-            msg.attach(text_part)
-            
-            # Add HTML part if provided
-            if body_html:
-                html_part = MIMEText(body_html, 'html')
-                msg.attach(html_part)
+            msg = self.build_message(to_email, subject, body_text, body_html)
             
             # Send using existing connection
             server.send_message(msg)
@@ -175,37 +238,44 @@ class EmailService:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
 
-def generate_welcome_email_content(user, timeframe, password=None) -> Dict[str, str]:
-    """Generate welcome email content for a user"""
-    
-    # Get user's roles
-    roles = ", ".join([role.name.title() for role in user.roles])
-    
-    subject = f"Welcome! You are invited for the {timeframe.name} Final Year Project"
+def _format_literal(text: str) -> str:
+    """Escape a value so str.format leaves it as is"""
+    return text.replace('{', '{{').replace('}', '}}')
+
+class WelcomeEmailTemplate:
+    """
+    Welcome email of one timeframe. The subject and the timeframe's parts of the body are filled
+    in once, so rendering a recipient is a single str.format of their own fields.
+    """
     
-    # Text version
-    text_body = f"""
-Hello {user.name or user.email},
+    def __init__(self, timeframe):
+        name = _format_literal(timeframe.name)
+        period = _format_literal(
+            f"{timeframe.start_date.strftime('%B %d, %Y')} - {timeframe.end_date.strftime('%B %d, %Y')}"
+        )
+        self.subject = f"Welcome! You are invited for the {timeframe.name} Final Year Project"
+        
+        # Text version
+        self._body = f"""
+Hello {{greeting}},
 
-Welcome to ProjectFlow! You are eligible for Final Year Project for {timeframe.name}
+Welcome to ProjectFlow! You are eligible for Final Year Project for {name}
 
 Your Account Details:
-- Email: {user.email}*
-- Name: {user.name or 'Not specified'}
-- Student/Staff ID: {user.student_staff_id or 'Not specified'}
-- Course: {user.course or 'Not specified'}
-- Role(s): {roles}
-- Course Term: {timeframe.name}
-- Period: {timeframe.start_date.strftime('%B %d, %Y')} - {timeframe.end_date.strftime('%B %d, %Y')}
+- Email: {{email}}*
+- Name: {{name}}
+- Student/Staff ID: {{student_staff_id}}
+- Course: {{course}}
+- Role(s): {{roles}}
+- Course Term: {name}
+- Period: {period}
 
 *use email to login to ProjectFlow
 
 This is an auto-generated email, please do not reply to this email.
 
 """
-    
-    if password:
-        text_body += f"""
+        self._password_footer = """
 Your login password is: {password}
 
 
@@ -215,8 +285,7 @@ Best regards,
 ProjectFlow Team
 
 """
-    else:
-        text_body += f"""
+        self._footer = """
 
 
 Best regards,
@@ -224,10 +293,57 @@ ProjectFlow Team
 
 """
     
-    return {
-        'subject': subject,
-        'text_body': text_body,
-    }
+    def render(self, user, roles: str, password=None) -> Dict[str, str]:
+        """Content for one user; `roles` is their role names as shown in the email"""
+        text_body = self._body.format(
+            greeting=user.name or user.email,
+            email=user.email,
+            name=user.name or 'Not specified',
+            student_staff_id=user.student_staff_id or 'Not specified',
+            course=user.course or 'Not specified',
+            roles=roles,
+        )
+        if password:
+            text_body += self._password_footer.format(password=password)
+        else:
+            text_body += self._footer
+        
+        return {
+            'subject': self.subject,
+            'text_body': text_body,
+        }
+
+def format_roles(role_names: Iterable[str]) -> str:
+    return ", ".join([name.title() for name in role_names])
+
+def generate_welcome_email_content(user, timeframe, password=None) -> Dict[str, str]:
+    """Generate welcome email content for a user (see render_welcome_emails for many users)"""
+    
+    # Get user's roles
+    roles = format_roles(role.name for role in user.roles)
+    return WelcomeEmailTemplate(timeframe).render(user, roles, password)
+
+def render_welcome_emails(users: Iterable, timeframe, passwords: Dict = None,
+                          chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[Any, Dict[str, str]]]:
+    """
+    Yield (user, content) for every user, as generate_welcome_email_content renders it
+    The template is prepared once for the timeframe and the users are read in chunks, with the
+    roles of a whole chunk loaded in one query, so memory stays flat however large the cohort
+    """
+    from database import db
+    from shared.models import Role, user_roles
+    
+    template = WelcomeEmailTemplate(timeframe)
+    for chunk in chunked(users, chunk_size):
+        roles_by_user = {}
+        for user_id, role_name in db.session.query(user_roles.c.user_id, Role.name).join(
+            Role, Role.id == user_roles.c.role_id
+        ).filter(user_roles.c.user_id.in_([user.id for user in chunk])):
+            roles_by_user.setdefault(user_id, []).append(role_name)
+        
+        for user in chunk:
+            password = passwords.get(user.email) if passwords else None
+            yield user, template.render(user, format_roles(roles_by_user.get(user.id, ())), password)
 
 def send_welcome_emails_bulk_fast(users: List, timeframe, passwords: Dict = None, school_id=None) -> Dict[str, Any]:
     """
@@ -265,14 +381,9 @@ def send_welcome_emails_bulk_fast(users: List, timeframe, passwords: Dict = None
             
             logger.info(f"Starting to send {len(users)} emails...")
             
-            for user in users:
+            # Emails are rendered as they are sent, with the roles loaded a chunk of users at a time
+            for user, email_content in render_welcome_emails(users, timeframe, passwords):
                 try:
-                    # Get password if provided
-                    password = passwords.get(user.email) if passwords else None
-                    
-                    # Generate email content
-                    email_content = generate_welcome_email_content(user, timeframe, password)
-                    
                     # Send email using existing connection
                     success = email_service.send_email_with_connection(
                         server=server,
@@ -339,14 +450,11 @@ def send_welcome_emails_threaded(users: List, timeframe, passwords: Dict = None,
     # Get the current Flask app context to pass to threads
     app = current_app._get_current_object()
     
-    def send_single_email(user):
+    def send_single_email(user, email_content):
         """Send email to single user - runs in separate thread"""
         # Push app context for this thread
         with app.app_context():
             try:
-                password = passwords.get(user.email) if passwords else None
-                email_content = generate_welcome_email_content(user, timeframe, password)
-                
                 success = email_service.send_email(
                     to_email=user.email,
                     subject=email_content['subject'],
@@ -364,8 +472,11 @@ def send_welcome_emails_threaded(users: List, timeframe, passwords: Dict = None,
     logger.info(f"Starting to send {len(users)} emails with {max_workers} threads...")
     
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all email tasks
-        future_to_user = {executor.submit(send_single_email, user): user for user in users}
+        # Submit all email tasks, rendered here so only this thread queries the database
+        future_to_user = {
+            executor.submit(send_single_email, user, email_content): user
+            for user, email_content in render_welcome_emails(users, timeframe, passwords)
+        }
         
         # Collect results as they complete
         for future in as_completed(future_to_user):
@@ -385,16 +496,163 @@ def send_welcome_emails_threaded(users: List, timeframe, passwords: Dict = None,
         'failed_emails': failed_emails
     }
 
+def send_welcome_emails_pooled(users: List, timeframe, passwords: Dict = None, school_id=None,
+                               pool_size: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Send welcome emails over a small pool of reused, authenticated SMTP connections
+    Messages are rendered here (one thread touches the database) and sent by one thread per
+    connection, within the server's SMTP_RATE_LIMIT_PER_SECOND
+    """
+    # Use school-specific config or get from database
+    if school_id:
+        email_service = EmailService.get_service_with_config(school_id)
+    else:
+        email_service = EmailService.get_service_with_config()
+    
+    # Check if email is configured
+    if not email_service.smtp_username or not email_service.smtp_password:
+        return {
+            'success': False,
+            'error': 'Email service not configured. Please configure email settings in the dashboard.',
+            'sent_count': 0,
+            'failed_count': 0
+        }
+    
+    def messages():
+        for user, email_content in render_welcome_emails(users, timeframe, passwords):
+            yield user.email, email_service.build_message(
+                user.email, email_content['subject'], email_content['text_body']
+            )
+    
+    pool = SMTPConnectionPool(email_service, size=pool_size)
+    logger.info(f"Starting to send {len(users)} emails over up to {pool.size} pooled connections...")
+    try:
+        # Fail fast (like the single-connection sender) when the server or login is unusable
+        pool.warm()
+    except Exception as e:
+        pool.close()
+        logger.error(f"SMTP connection failed: {str(e)}")
+        return {
+            'success': False,
+            'error': f'SMTP connection failed: {str(e)}',
+            'sent_count': 0,
+            'failed_count': 0
+        }
+    
+    with pool:
+        sent_count, failures = pool.send_many(messages())
+    failed_emails = list(failures)
+    
+    logger.info(f"Email sending completed. Sent: {sent_count}, Failed: {len(failed_emails)} "
+                f"({pool.connections_opened} SMTP connections)")
+    
+    return {
+        'success': True,
+        'sent_count': sent_count,
+        'failed_count': len(failed_emails),
+        'failed_emails': failed_emails
+    }
+
+def send_welcome_emails_async(users: List, timeframe, passwords: Dict = None, school_id=None,
+                              concurrency: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Send welcome emails from an asyncio event loop, SMTP_ASYNC_CONCURRENCY at a time
+    Each send holds its own reused session and pipelines its commands, so network round trips
+    overlap without a thread per connection; messages are rendered in the calling thread
+    """
+    # Use school-specific config or get from database
+    if school_id:
+        email_service = EmailService.get_service_with_config(school_id)
+    else:
+        email_service = EmailService.get_service_with_config()
+    
+    # Check if email is configured
+    if not email_service.smtp_username or not email_service.smtp_password:
+        return {
+            'success': False,
+            'error': 'Email service not configured. Please configure email settings in the dashboard.',
+            'sent_count': 0,
+            'failed_count': 0
+        }
+    
+    def messages():
+        for user, email_content in render_welcome_emails(users, timeframe, passwords):
+            yield user.email, email_service.build_message(
+                user.email, email_content['subject'], email_content['text_body']
+            )
+    
+    sender = AsyncSMTPSender(email_service, concurrency=concurrency)
+    
+    async def deliver():
+        async with sender:
+            # Fail fast (like the single-connection sender) when the server or login is unusable
+            await sender.warm()
+            return await sender.send_many(messages())
+    
+    logger.info(f"Starting to send {len(users)} emails, {sender.concurrency} at a time...")
+    try:
+        sent_count, failures = asyncio.run(deliver())
+    except Exception as e:
+        logger.error(f"SMTP connection failed: {str(e)}")
+        return {
+            'success': False,
+            'error': f'SMTP connection failed: {str(e)}',
+            'sent_count': 0,
+            'failed_count': 0
+        }
+    failed_emails = list(failures)
+    
+    logger.info(f"Email sending completed. Sent: {sent_count}, Failed: {len(failed_emails)} "
+                f"({sender.connections_opened} SMTP connections)")
+    
+    return {
+        'success': True,
+        'sent_count': sent_count,
+        'failed_count': len(failed_emails),
+        'failed_emails': failed_emails
+    }
+
+# SMTP_SEND_MODE -> sender used by send_welcome_emails
+SEND_MODES = {
+    'pooled': send_welcome_emails_pooled,
+    'async': send_welcome_emails_async,
+    'threaded': send_welcome_emails_threaded,
+    'single': send_welcome_emails_bulk_fast,
+}
+
+def choose_send_mode(email_service) -> str:
+    """
+    Fastest safe sender for a server, from its cached (or probed) capabilities: async when it
+    pipelines and, if TLS is configured, offers STARTTLS the asyncio client can use; else pooled
+    """
+    capabilities = email_service.get_capabilities()
+    if not capabilities or not capabilities['pipelining']:
+        return 'pooled'
+    if (email_service.use_tls or email_service.use_ssl) and not (capabilities['starttls'] and STARTTLS_SUPPORTED):
+        return 'pooled'
+    return 'async'
+
+def resolve_send_mode(email_service) -> str:
+    """SMTP_SEND_MODE for a school's server, with 'auto' resolved by choose_send_mode"""
+    mode = smtp_setting('SMTP_SEND_MODE')
+    if mode == 'auto':
+        return choose_send_mode(email_service)
+    if mode not in SEND_MODES:
+        logger.warning(f"Unknown SMTP_SEND_MODE {mode!r}, using pooled")
+        return 'pooled'
+    return mode
+
 def send_welcome_emails(users: List, timeframe, passwords: Dict = None, school_id=None) -> Dict[str, Any]:
     """
-    Main function - uses bulk connection method for best performance without threading complexity
+    Main function - sends with the SMTP_SEND_MODE method; 'auto' (the default) picks the asyncio
+    sender for servers that support pipelining and the pool of reused connections otherwise
     """
     if not users:
         return {'success': True, 'sent_count': 0, 'failed_count': 0}
     
-    # Always use bulk connection method - fast and reliable
-    logger.info(f"Using bulk connection approach for {len(users)} users")
-    return send_welcome_emails_bulk_fast(users, timeframe, passwords, school_id)
+    mode = resolve_send_mode(EmailService.get_service_with_config(school_id))
+    logger.info(f"Using {mode} sending for {len(users)} users")
+    return SEND_MODES[mode](users, timeframe, passwords, school_id)
 
 def send_test_email(to_email: str, school_id=None) -> Dict[str, Any]:
     """Send a test email to verify configuration"""
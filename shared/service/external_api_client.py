@@ -0,0 +1,208 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Iterable, Iterator, Optional
+
+import requests
+from flask import current_app, has_app_context
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_CLIENT_SETTINGS = {
+    'EXTERNAL_API_PAGE_SIZE': 1000,
+    'EXTERNAL_API_STREAM': False,  # NDJSON stream instead of cursor pages
+    'EXTERNAL_API_TIMEOUT_SECONDS': 30,
+    'EXTERNAL_API_POOL_SIZE': 10,  # keep-alive connections per school
+    'EXTERNAL_API_RETRIES': 3,
+    'EXTERNAL_API_BACKOFF_SECONDS': 0.5,  # doubled on each retry
+    'EXTERNAL_API_MAX_CONCURRENCY': 4,  # academic periods fetched in parallel
+}
+
+# Transient answers worth retrying; anything else is reported to the caller as is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions: Dict[Hashable, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+class ExternalAPIError(Exception):
+    """The external school API rejected a request or sent a response we cannot read"""
+
+
+def client_setting(key):
+    source = current_app.config if has_app_context() else {}
+    value = source.get(key)
+    return DEFAULT_CLIENT_SETTINGS[key] if value is None else value
+
+
+def get_session(school_id: Hashable) -> requests.Session:
+    """
+    The shared HTTP session for one school's external API. Its connection pool keeps connections
+    alive between calls, and idempotent GETs are retried with exponential backoff on connection
+    errors and transient statuses. Sessions are safe to share between fetch threads.
+    """
+    with _sessions_lock:
+        session = _sessions.get(school_id)
+        if session is None:
+            pool_size = int(client_setting('EXTERNAL_API_POOL_SIZE'))
+            retry = Retry(
+                total=int(client_setting('EXTERNAL_API_RETRIES')),
+                backoff_factor=float(client_setting('EXTERNAL_API_BACKOFF_SECONDS')),
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({'GET'}),
+                # Hand the last response back so callers report its status instead of a RetryError
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Connection'] = 'keep-alive'
+            _sessions[school_id] = session
+        return session
+
+
+def close_sessions():
+    """Close every pooled session (their connections are dropped; new ones are made on next use)"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
+def fetch_concurrently(fetch: Callable[[Hashable], object], keys: Iterable[Hashable],
+                       max_workers: Optional[int] = None) -> Dict[Hashable, object]:
+    """
+    {key: fetch(key)} with at most `max_workers` (EXTERNAL_API_MAX_CONCURRENCY) calls in flight,
+    so several academic periods take about as long as the slowest one. Calls run inside the
+    caller's app context; they must not use the caller's database session. The first exception
+    raised by a call is re-raised once all calls have finished.
+    """
+    keys = list(dict.fromkeys(keys))
+    workers = min(max_workers or int(client_setting('EXTERNAL_API_MAX_CONCURRENCY')), len(keys))
+    if workers <= 1:
+        return {key: fetch(key) for key in keys}
+
+    app = current_app._get_current_object() if has_app_context() else None
+
+    def call(key):
+        if app is None:
+            return fetch(key)
+        with app.app_context():
+            return fetch(key)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='external-api') as executor:
+        futures = {key: executor.submit(call, key) for key in keys}
+    return {key: future.result() for key, future in futures.items()}
+
+
+class ExternalRosterResponse:
+    """
+    Records of one academic period, read lazily from the external API.
+
+    The first page (or the NDJSON stream's headers) is requested on construction, so connection
+    errors and the response metadata (`sync_timestamp`, `delta`) are known before any record is
+    consumed. Later pages are requested, and stream lines parsed, only as the caller iterates, so
+    at most one page of records is held here at a time. Iterate once; `records_read` counts the
+    records yielded so far. APIs without pagination or streaming answer with a single page.
+    """
+
+    def __init__(self, base_url: str, headers: dict, academic_period: str, since: Optional[str] = None,
+                 page_size: Optional[int] = None, stream: Optional[bool] = None, timeout: Optional[float] = None,
+                 session=None):
+        self.url = f"{base_url}/api/students/by-period/{academic_period}"
+        self.headers = headers
+        self.since = since
+        self.page_size = page_size or int(client_setting('EXTERNAL_API_PAGE_SIZE'))
+        self.timeout = timeout or float(client_setting('EXTERNAL_API_TIMEOUT_SECONDS'))
+        self.http = session or requests
+        self.records_read = 0
+        self.sync_timestamp = None
+        self.delta = False
+        self._page = []
+        self._next_cursor = None
+        self._stream = None
+        self._consumed = False
+
+        if client_setting('EXTERNAL_API_STREAM') if stream is None else stream:
+            self._open_stream()
+        else:
+            self._read_page(self._get(limit=self.page_size))
+
+    def _params(self, **params):
+        if self.since:
+            params['since'] = self.since
+        return params
+
+    def _get(self, stream=False, **params):
+        response = self.http.get(self.url, headers=self.headers, params=self._params(**params),
+                                 timeout=self.timeout, stream=stream)
+        if response.status_code != 200:
+            text = response.text
+            response.close()
+            raise ExternalAPIError(f"API request failed with status {response.status_code}: {text}")
+        return response
+
+    def _read_page(self, response):
+        data = response.json()
+        if not data.get('success'):
+            raise ExternalAPIError(f"API returned success=False: {data}")
+        if self.sync_timestamp is None:
+            # The first page's timestamp is the earliest, so the next delta overlaps rather than skips
+            self.sync_timestamp = data.get('sync_timestamp')
+            self.delta = bool(self.since) and data.get('since') is not None
+        self._page = data.get('students', [])
+        self._next_cursor = data.get('next_cursor')
+
+    def _open_stream(self):
+        response = self._get(stream=True, format='ndjson')
+        if not response.headers.get('Content-Type', '').startswith(NDJSON_MIMETYPE):
+            # The API does not stream; it answered with an ordinary JSON document
+            self._read_page(response)
+            return
+        self._stream = response
+        self.sync_timestamp = response.headers.get('X-Sync-Timestamp')
+        self.delta = bool(self.since) and response.headers.get('X-Since') is not None
+
+    def _stream_records(self) -> Iterator[dict]:
+        try:
+            for line in self._stream.iter_lines():
+                if not line:
+                    continue
+                record = json.loads(line)
+                if 'error' in record:
+                    raise ExternalAPIError(record['error'])
+                yield record
+        finally:
+            self._stream.close()
+
+    def _paged_records(self) -> Iterator[dict]:
+        while True:
+            page, self._page = self._page, []
+            yield from page
+            if not self._next_cursor:
+                return
+            self._read_page(self._get(limit=self.page_size, cursor=self._next_cursor))
+
+    def __iter__(self) -> Iterator[dict]:
+        if self._consumed:
+            raise ExternalAPIError('External roster responses can only be read once')
+        self._consumed = True
+        records = self._stream_records() if self._stream is not None else self._paged_records()
+        for record in records:
+            self.records_read += 1
+            yield record
+        logger.info(f"Read {self.records_read} records from {self.url}")
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
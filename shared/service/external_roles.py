@@ -0,0 +1,129 @@
+import logging
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from shared.models import Role
+from shared.service.external_api_client import fetch_concurrently
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def parse_roles(roles_data) -> List[str]:
+    """Role names from an external record's role field: comma-separated string, list or scalar"""
+    if not roles_data:
+        return []
+    if isinstance(roles_data, str):
+        roles = roles_data.split(',')
+    elif isinstance(roles_data, list):
+        roles = roles_data
+    else:
+        roles = [roles_data]
+    parsed = []
+    for role in roles:
+        role = str(role).strip().lower()
+        if role and role not in parsed:
+            parsed.append(role)
+    return parsed
+
+
+class ExternalRoleIndex:
+    """
+    email -> {timeframe name -> [roles]} over external API records.
+
+    Emails are normalised (stripped, lower-case) and role fields parsed once while indexing, so
+    every lookup afterwards is a dict access instead of a scan of the external data.
+    """
+
+    def __init__(self, field_mappings: Optional[dict] = None):
+        mappings = field_mappings or {}
+        self.email_field = mappings.get('email', 'email')
+        self.roles_field = mappings.get('roles', 'roles')
+        self.role_field = mappings.get('role', 'role')
+        self.timeframe_field = mappings.get('timeframe', 'fyp_session')
+        self._roles: Dict[str, Dict[str, List[str]]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], field_mappings: Optional[dict] = None) -> 'ExternalRoleIndex':
+        index = cls(field_mappings)
+        index.add_records(records)
+        return index
+
+    def add_records(self, records: Iterable[dict]):
+        for record in records:
+            self.add_record(record)
+
+    def add_record(self, record: dict):
+        email = record.get(self.email_field)
+        timeframe_name = record.get(self.timeframe_field)
+        if not email or not timeframe_name:
+            return
+        roles = self._roles.setdefault(str(email).strip().lower(), {}).setdefault(timeframe_name, [])
+        for role in parse_roles(record.get(self.roles_field) or record.get(self.role_field)):
+            if role not in roles:
+                roles.append(role)
+
+    def __contains__(self, email: str) -> bool:
+        return email.strip().lower() in self._roles
+
+    def roles_for(self, email: str, timeframe_name: str) -> List[str]:
+        """Roles held by `email` in one timeframe ([] if absent)"""
+        return list(self._roles.get(email.strip().lower(), {}).get(timeframe_name, ()))
+
+    def roles_in(self, email: str, timeframe_names: Iterable[str]) -> Set[str]:
+        """Union of the roles held by `email` across several timeframes"""
+        by_timeframe = self._roles.get(email.strip().lower(), {})
+        return {role for name in timeframe_names for role in by_timeframe.get(name, ())}
+
+    def timeframes_for(self, email: str) -> Dict[str, List[str]]:
+        return {name: list(roles) for name, roles in self._roles.get(email.strip().lower(), {}).items()}
+
+
+class ExternalRolePrefetcher:
+    """
+    Per-import cache of other academic periods' external rosters.
+
+    Each distinct period is fetched at most once through `fetch(api_config, period)` and merged
+    into one ExternalRoleIndex, so resolving other-timeframe roles for every user in an import
+    costs one API call per period rather than one per user per timeframe. Periods requested
+    together are fetched in parallel.
+    """
+
+    def __init__(self, api_config, field_mappings: dict, fetch: Callable):
+        # Fetch threads read this copy of the config's columns, never the session-bound row
+        self.api_config = SimpleNamespace(**{
+            column.key: getattr(api_config, column.key) for column in api_config.__table__.columns
+        })
+        self.index = ExternalRoleIndex(field_mappings)
+        self._fetch = fetch
+        self._fetched: Set[str] = set()
+        self._roles_by_name: Optional[Dict[str, Optional[Role]]] = None
+
+    def prefetch(self, periods: Iterable[str]):
+        periods = sorted(set(periods) - self._fetched)
+        if not periods:
+            return
+        self._fetched.update(periods)
+        responses = fetch_concurrently(lambda period: self._fetch(self.api_config, period), periods)
+        for period in periods:
+            records = responses[period] or []
+            self.index.add_records(records)
+            logger.info(f"Prefetched {len(records)} external records for period {period}")
+
+    def roles_in(self, email: str, timeframe_names: Iterable[str]) -> Set[str]:
+        timeframe_names = list(timeframe_names)
+        self.prefetch(timeframe_names)
+        return self.index.roles_in(email, timeframe_names)
+
+    def role_objects(self, role_names: Iterable[str]) -> List[Role]:
+        """Role rows for the given names (unknown names are skipped), loaded once per import"""
+        role_names = list(role_names)
+        if self._roles_by_name is None:
+            self._roles_by_name = {role.name: role for role in Role.query.all()}
+        missing = [name for name in role_names if name not in self._roles_by_name]
+        if missing:
+            # Roles created since the first load; names that still do not exist are cached as None
+            self._roles_by_name.update(dict.fromkeys(missing))
+            self._roles_by_name.update((role.name, role) for role in Role.query.filter(Role.name.in_(missing)))
+        return [self._roles_by_name[name] for name in role_names if self._roles_by_name[name] is not None]
@@ -0,0 +1,154 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_
+
+from database import db
+from shared.models import Role, User, user_role_timeframes, user_timeframes
+from shared.service.external_roles import ExternalRoleIndex
+from shared.utils.bulk_helpers import chunked
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# create: new account; assign: existing account joins the timeframe; update: member whose profile
+# fields and/or timeframe roles change; remove: member missing from the external roster
+DIFF_ACTIONS = ('create', 'assign', 'update', 'remove')
+
+# User column -> field mapping key, for the profile fields a sync overwrites
+PROFILE_FIELDS = (('name', 'name'), ('course', 'course'), ('student_staff_id', 'id'))
+
+
+def _external_profile(record: dict, field_mappings: dict) -> Dict[str, str]:
+    """Profile fields as create_or_update_user_multi_role would write them (empty values are left alone)"""
+    profile = {}
+    for column, key in PROFILE_FIELDS:
+        value = record.get(field_mappings.get(key, key))
+        if value:
+            profile[column] = str(value).strip()
+    return profile
+
+
+def _field_changes(current: dict, profile: Dict[str, str], school_id: int) -> Dict[str, dict]:
+    changes = {
+        column: {'old': current.get(column), 'new': value}
+        for column, value in profile.items() if (current.get(column) or '') != value
+    }
+    if current.get('school_id') != school_id:
+        changes['school_id'] = {'old': current.get('school_id'), 'new': school_id}
+    return changes
+
+
+def compute_external_sync_diff(external_data: Iterable[dict], school_id: int, timeframe,
+                               field_mappings: Optional[dict] = None) -> dict:
+    """
+    Dry run of a full external sync of `timeframe`: exactly which users it would create, assign,
+    update (profile fields and/or timeframe roles) and remove. Nothing is written.
+
+    external_data is read once. The timeframe's current members and their role-scoped
+    assignments come from one query, and the decision for every user is a set operation
+    over those two indexes; existing accounts of non-members are looked up in chunks.
+    Returns {'entries': [...] ordered by action then email, 'counts': {...}}.
+    """
+    mappings = field_mappings or {}
+    email_field = mappings.get('email', 'email')
+    timeframe_field = mappings.get('timeframe', 'fyp_session')
+
+    external_index = ExternalRoleIndex(mappings)
+    profiles: Dict[str, Dict[str, str]] = {}
+    records_read = 0
+    for record in external_data:
+        records_read += 1
+        if record.get('deleted'):
+            continue
+        external_index.add_record(record)
+        email = record.get(email_field)
+        if email and record.get(timeframe_field) == timeframe.name:
+            profiles.setdefault(str(email).strip().lower(), _external_profile(record, mappings))
+    external_roles = {email: set(external_index.roles_for(email, timeframe.name)) for email in profiles}
+    # The sync rejects records without a role; they would count as errors, not changes
+    invalid = sorted(email for email, roles in external_roles.items() if not roles)
+    external_emails = set(profiles) - set(invalid)
+
+    # Current members with their roles in this timeframe, in one query
+    rows = db.session.query(
+        User.id, User.email, User.name, User.course, User.student_staff_id, User.school_id, Role.name
+    ).join(
+        user_timeframes, and_(user_timeframes.c.user_id == User.id, user_timeframes.c.timeframe_id == timeframe.id)
+    ).outerjoin(
+        user_role_timeframes, and_(
+            user_role_timeframes.c.user_id == User.id, user_role_timeframes.c.timeframe_id == timeframe.id
+        )
+    ).outerjoin(Role, Role.id == user_role_timeframes.c.role_id).filter(User.school_id == school_id)
+
+    members: Dict[str, dict] = {}
+    member_roles: Dict[str, set] = {}
+    for user_id, email, name, course, staff_id, user_school_id, role_name in rows:
+        email = email.lower()
+        members.setdefault(email, {
+            'id': user_id, 'name': name, 'course': course, 'student_staff_id': staff_id, 'school_id': user_school_id
+        })
+        roles = member_roles.setdefault(email, set())
+        if role_name:
+            roles.add(role_name)
+    member_emails = set(members)
+
+    joining = external_emails - member_emails
+    existing_accounts: Dict[str, dict] = {}
+    for chunk in chunked(sorted(joining)):
+        for email, name, course, staff_id, user_school_id in db.session.query(
+            User.email, User.name, User.course, User.student_staff_id, User.school_id
+        ).filter(User.email.in_(chunk)):
+            existing_accounts[email.lower()] = {
+                'name': name, 'course': course, 'student_staff_id': staff_id, 'school_id': user_school_id
+            }
+
+    entries: List[dict] = []
+    for email in sorted(joining - set(existing_accounts)):
+        entries.append({'email': email, 'action': 'create', 'fields': profiles[email],
+                        'roles': {'current': [], 'external': sorted(external_roles[email]),
+                                  'added': sorted(external_roles[email]), 'removed': []}})
+    for email in sorted(joining & set(existing_accounts)):
+        entries.append({'email': email, 'action': 'assign',
+                        'fields': _field_changes(existing_accounts[email], profiles[email], school_id),
+                        'roles': {'current': [], 'external': sorted(external_roles[email]),
+                                  'added': sorted(external_roles[email]), 'removed': []}})
+
+    # The sync only adds timeframe roles to members who stay; ones the roster no longer lists are
+    # reported as kept rather than removed
+    unchanged = 0
+    re_roled = 0
+    for email in sorted(external_emails & member_emails):
+        current_roles, new_roles = member_roles[email], external_roles[email]
+        fields = _field_changes(members[email], profiles[email], school_id)
+        added = new_roles - current_roles
+        if not fields and not added:
+            unchanged += 1
+            continue
+        if added:
+            re_roled += 1
+        entries.append({'email': email, 'action': 'update', 'fields': fields,
+                        'roles': {'current': sorted(current_roles), 'external': sorted(new_roles),
+                                  'added': sorted(added), 'removed': [],
+                                  'kept': sorted(current_roles - new_roles)}})
+
+    # Members whose records lack a role are kept by the sync (the record fails instead)
+    for email in sorted(member_emails - set(profiles)):
+        entries.append({'email': email, 'action': 'remove', 'fields': {},
+                        'roles': {'current': sorted(member_roles[email]), 'external': [],
+                                  'added': [], 'removed': sorted(member_roles[email])}})
+
+    counts = {action: 0 for action in DIFF_ACTIONS}
+    for entry in entries:
+        counts[entry['action']] += 1
+    counts.update({
+        're_roled': re_roled,
+        'unchanged': unchanged,
+        'invalid': len(invalid),
+        'external_records': records_read,
+        'external_users': len(external_emails),
+        'current_members': len(member_emails),
+    })
+    logger.info(f"Sync diff for timeframe {timeframe.name}: {counts}")
+    return {'entries': entries, 'counts': counts, 'invalid_emails': invalid}
@@ -0,0 +1,385 @@
+import hashlib
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import current_app, has_app_context
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from shared.models import ImportJob
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job types
+EXCEL_UPLOAD_JOB = 'excel_upload'
+EXTERNAL_SYNC_JOB = 'external_sync'
+ALLOCATION_REPAIR_JOB = 'allocation_repair'  # shared/service/incremental_allocation.py
+
+# Jobs that change a timeframe's roster, shown on the load data page
+ROSTER_JOB_TYPES = (EXCEL_UPLOAD_JOB, EXTERNAL_SYNC_JOB)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_JOB_SETTINGS = {
+    'IMPORT_JOB_WORKERS': 2,
+    'IMPORT_JOB_POLL_SECONDS': 2.0,
+    'IMPORT_JOB_HEARTBEAT_SECONDS': 15.0,
+    'IMPORT_JOB_STALE_SECONDS': 120.0,
+    'IMPORT_JOB_MAX_ATTEMPTS': 3,
+    'IMPORT_JOB_MAX_PER_SCHOOL': 2,
+}
+
+
+class ImportJobError(Exception):
+    """Raised by a job handler for input that will never succeed (the job fails without retry)"""
+
+
+_handlers: Dict[str, Callable[[ImportJob], dict]] = {}
+
+# Counters reported between checkpoints, overlaid on the stored row by job_progress()
+_live_progress: Dict[int, dict] = {}
+_live_lock = threading.Lock()
+
+# Set when a job is enqueued so idle workers pick it up without waiting for the next poll
+_wake = threading.Event()
+
+_workers = []
+_workers_lock = threading.Lock()
+
+
+def job_setting(key):
+    source = current_app.config if has_app_context() else {}
+    value = source.get(key)
+    return DEFAULT_JOB_SETTINGS[key] if value is None else value
+
+
+def register_job_handler(job_type: str, handler: Callable[[ImportJob], dict]):
+    """
+    Register the function that processes jobs of `job_type`.
+
+    The handler receives the claimed ImportJob inside an app context, may call checkpoint() to
+    commit progress, and returns a JSON-serialisable summary stored on the job. It must be safe to
+    call again for the same job: after a crash the job is re-queued and resumes from rows_processed.
+    """
+    _handlers[job_type] = handler
+
+
+def upload_idempotency_key(job_type: str, timeframe_id: int, payload: bytes, options: Optional[dict] = None) -> str:
+    """Key that identifies one upload: the same file, timeframe and options map to the same job"""
+    digest = hashlib.sha256()
+    digest.update(f'{job_type}:{timeframe_id}:'.encode())
+    for key, value in sorted((options or {}).items()):
+        digest.update(f'{key}={value!r};'.encode())
+    digest.update(payload or b'')
+    return digest.hexdigest()
+
+
+def enqueue_job(job_type: str, timeframe_id: int, school_id: int, created_by: Optional[int] = None,
+                payload: Optional[bytes] = None, options: Optional[dict] = None,
+                idempotency_key: Optional[str] = None, dedupe_active: bool = False,
+                run_after: Optional[datetime] = None) -> Tuple[ImportJob, bool]:
+    """
+    Persist a job and wake the workers; returns (job, created) and commits.
+    A job with `run_after` is not claimed before that time.
+
+    With an idempotency key, a job already submitted under that key is returned instead (a failed
+    one is re-queued). With dedupe_active, an active job of the same type for the timeframe is
+    returned instead of queuing a second one.
+    """
+    if idempotency_key:
+        existing = ImportJob.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            if existing.status == 'failed':
+                _requeue(existing, payload)
+            return existing, False
+    if dedupe_active:
+        existing = ImportJob.query.filter(
+            ImportJob.job_type == job_type,
+            ImportJob.timeframe_id == timeframe_id,
+            ImportJob.status.in_(ACTIVE_STATUSES)
+        ).order_by(ImportJob.id.desc()).first()
+        if existing:
+            return existing, False
+
+    job = ImportJob(job_type=job_type, timeframe_id=timeframe_id, school_id=school_id, created_by=created_by,
+                    idempotency_key=idempotency_key, payload=payload, status='queued', run_after=run_after)
+    job.set_options(options or {})
+    db.session.add(job)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Same upload submitted concurrently; the other request's job wins
+        db.session.rollback()
+        return ImportJob.query.filter_by(idempotency_key=idempotency_key).one(), False
+
+    logger.info(f"Queued import job {job.id} ({job_type}) for timeframe {timeframe_id}")
+    _wake.set()
+    return job, True
+
+
+def _requeue(job: ImportJob, payload: Optional[bytes]):
+    # The payload was dropped when the job failed; the resubmission carries the same bytes
+    job.status = 'queued'
+    job.payload = payload
+    job.attempts = 0
+    job.error_message = None
+    job.finished_at = None
+    db.session.commit()
+    logger.info(f"Re-queued failed import job {job.id}")
+    _wake.set()
+
+
+def latest_active_job(timeframe_id: int, job_types=ROSTER_JOB_TYPES) -> Optional[ImportJob]:
+    return ImportJob.query.filter(
+        ImportJob.timeframe_id == timeframe_id,
+        ImportJob.job_type.in_(job_types),
+        ImportJob.status.in_(ACTIVE_STATUSES)
+    ).order_by(ImportJob.id.desc()).first()
+
+
+def report_progress(job: ImportJob, **counters):
+    """Publish progress without committing; visible to job_progress() in this process"""
+    with _live_lock:
+        _live_progress.setdefault(job.id, {}).update(counters)
+
+
+def checkpoint(job: ImportJob, **fields):
+    """Store progress fields on the job and commit together with the handler's pending work"""
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+    with _live_lock:
+        _live_progress.pop(job.id, None)
+
+
+def job_progress(job: ImportJob) -> dict:
+    """Job state for the status endpoint, including counters reported since the last checkpoint"""
+    data = job.to_dict()
+    with _live_lock:
+        live = dict(_live_progress.get(job.id, {}))
+    if job.status == 'running':
+        data.update(live)
+    if data['rows_total']:
+        data['percent'] = min(100, int(100 * data['rows_processed'] / data['rows_total']))
+    else:
+        data['percent'] = 100 if job.status == 'completed' else 0
+    data['finished'] = job.is_finished
+    data['result'] = job.get_result() if job.is_finished else None
+    return data
+
+
+def _finish(job: ImportJob, status: str):
+    """Move a job to a terminal status; the uploaded payload is no longer needed"""
+    job.status = status
+    job.finished_at = datetime.utcnow()
+    job.payload = None
+
+
+def recover_stale_jobs() -> int:
+    """
+    Re-queue running jobs whose worker stopped heartbeating (crash or restart).
+    Jobs that already used IMPORT_JOB_MAX_ATTEMPTS attempts are failed instead.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=float(job_setting('IMPORT_JOB_STALE_SECONDS')))
+    max_attempts = int(job_setting('IMPORT_JOB_MAX_ATTEMPTS'))
+    query = ImportJob.query.filter(
+        ImportJob.status == 'running',
+        db.or_(ImportJob.heartbeat_at < cutoff, ImportJob.heartbeat_at.is_(None))
+    )
+    # Jobs held by this process's own live workers are still running, whatever their heartbeat says
+    local_workers = [worker.worker_id for worker in _workers if worker.is_alive()]
+    if local_workers:
+        query = query.filter(db.or_(ImportJob.worker_id.is_(None), ImportJob.worker_id.notin_(local_workers)))
+    stale = query.all()
+    for job in stale:
+        if job.attempts >= max_attempts:
+            _finish(job, 'failed')
+            job.error_message = f'Worker stopped responding after {job.attempts} attempts'
+        else:
+            job.status = 'queued'
+        logger.warning(f"Recovered stale import job {job.id} from {job.worker_id}: now {job.status}")
+    if stale:
+        db.session.commit()
+    return len(stale)
+
+
+def claim_next_job(worker_id: str, exclude=()) -> Optional[ImportJob]:
+    """
+    Atomically move the next due queued job (not in `exclude`) to running for this worker.
+    Jobs started by a user go before scheduled ones, and a school already running
+    IMPORT_JOB_MAX_PER_SCHOOL jobs is skipped so one large school cannot hold every worker
+    (best effort: two workers claiming at the same moment can exceed it by one).
+    """
+    now = datetime.utcnow()
+    busy_schools = db.session.query(ImportJob.school_id).filter(
+        ImportJob.status == 'running'
+    ).group_by(ImportJob.school_id).having(
+        db.func.count(ImportJob.id) >= int(job_setting('IMPORT_JOB_MAX_PER_SCHOOL'))
+    )
+    query = db.session.query(ImportJob.id).filter(
+        ImportJob.status == 'queued',
+        db.or_(ImportJob.run_after.is_(None), ImportJob.run_after <= now),
+        ImportJob.school_id.notin_(busy_schools)
+    )
+    if exclude:
+        query = query.filter(ImportJob.id.notin_(list(exclude)))
+    candidates = [job_id for (job_id,) in query.order_by(ImportJob.created_by.is_(None), ImportJob.id).limit(5)]
+    for job_id in candidates:
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(ImportJob)
+            .where(ImportJob.id == job_id, ImportJob.status == 'queued')
+            .values(status='running', worker_id=worker_id, attempts=ImportJob.attempts + 1,
+                    started_at=now, heartbeat_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(ImportJob, job_id, populate_existing=True)
+    return None
+
+
+class _Heartbeat:
+    """Keeps heartbeat_at fresh on its own connection while a handler holds a long transaction"""
+
+    def __init__(self, app, job_id: int):
+        self.app = app
+        self.job_id = job_id
+        self.interval = float(job_setting('IMPORT_JOB_HEARTBEAT_SECONDS'))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _beat(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.interval):
+                try:
+                    with db.engine.begin() as connection:
+                        connection.execute(
+                            update(ImportJob.__table__)
+                            .where(ImportJob.__table__.c.id == self.job_id)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+                except Exception as e:
+                    logger.warning(f"Heartbeat failed for import job {self.job_id}: {e}")
+
+    def __enter__(self):
+        # SQLite serialises writers, so a second connection would block on the handler's transaction
+        if db.engine.dialect.name != 'sqlite':
+            self._thread = threading.Thread(target=self._beat, name=f'import-job-{self.job_id}-heartbeat',
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def run_job(job: ImportJob):
+    """Run a claimed job's handler and record the outcome; failures are retried up to the attempt limit"""
+    job_id = job.id
+    handler = _handlers.get(job.job_type)
+    try:
+        if handler is None:
+            raise ImportJobError(f"No handler registered for job type '{job.job_type}'")
+        with _Heartbeat(current_app._get_current_object(), job_id):
+            result = handler(job)
+        job.set_result(result or {})
+        _finish(job, 'completed')
+        job.error_message = None
+        db.session.commit()
+        logger.info(f"Import job {job_id} completed")
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id, populate_existing=True)
+        retry = not isinstance(e, ImportJobError) and job.attempts < int(job_setting('IMPORT_JOB_MAX_ATTEMPTS'))
+        if retry:
+            job.status = 'queued'
+            job.finished_at = None
+        else:
+            _finish(job, 'failed')
+        job.error_message = str(e)
+        db.session.commit()
+        logger.error(f"Import job {job_id} attempt {job.attempts} failed ({'will retry' if retry else 'giving up'}): {e}")
+    finally:
+        with _live_lock:
+            _live_progress.pop(job_id, None)
+
+
+def drain_jobs(worker_id: Optional[str] = None) -> int:
+    """
+    Process queued jobs in the current app context until none are left; returns the number run.
+    A job re-queued for retry is left for the next call rather than retried immediately.
+    """
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:inline'
+    seen = set()
+    while True:
+        job = claim_next_job(worker_id, exclude=seen)
+        if job is None:
+            return len(seen)
+        seen.add(job.id)
+        run_job(job)
+
+
+class ImportJobWorker(threading.Thread):
+    """Daemon thread that polls the jobs table; any number of workers across processes may run"""
+
+    def __init__(self, app, index: int = 0):
+        super().__init__(name=f'import-job-worker-{index}', daemon=True)
+        self.app = app
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{index}'
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        _wake.set()
+
+    def run(self):
+        logger.info(f"Import job worker {self.worker_id} started")
+        while not self._stop_event.is_set():
+            with self.app.app_context():
+                poll_seconds = float(job_setting('IMPORT_JOB_POLL_SECONDS'))
+                try:
+                    recover_stale_jobs()
+                    processed = drain_jobs(self.worker_id)
+                except Exception as e:
+                    # Typically the database being unavailable or not created yet
+                    db.session.rollback()
+                    logger.error(f"Import job worker {self.worker_id} error: {e}")
+                    processed = 0
+            if not processed:
+                _wake.wait(poll_seconds)
+                _wake.clear()
+
+
+def start_import_workers(app, count: Optional[int] = None):
+    """Start the background workers once per process; IMPORT_JOB_WORKERS=0 disables them"""
+    with _workers_lock:
+        if _workers:
+            return list(_workers)
+        if count is None:
+            count = app.config.get('IMPORT_JOB_WORKERS', DEFAULT_JOB_SETTINGS['IMPORT_JOB_WORKERS'])
+        for index in range(int(count)):
+            worker = ImportJobWorker(app, index)
+            worker.start()
+            _workers.append(worker)
+        return list(_workers)
+
+
+def stop_import_workers():
+    with _workers_lock:
+        for worker in _workers:
+            worker.stop()
+        for worker in _workers:
+            worker.join(timeout=5)
+        _workers.clear()
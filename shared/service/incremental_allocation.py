@@ -0,0 +1,465 @@
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, Optional
+
+import numpy as np
+from sqlalchemy import update
+
+from database import db
+from shared.models import AllocationResult, ImportJob, Timeframe, UnallocatedUser
+from shared.service.allocation_service import (
+    AUTOMATIC_METHOD, new_allocation_batch_id, _unallocated_reason
+)
+from shared.service.import_jobs import ALLOCATION_REPAIR_JOB, enqueue_job, register_job_handler
+from shared.service.preference_matrix import load_preference_matrix
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+UNALLOCATED = -1
+
+# Changes made within this many seconds of each other are repaired by one job
+REPAIR_DELAY_SECONDS = 5
+
+
+class IncrementalAllocator:
+    """
+    Warm-started repair of an existing student allocation.
+
+    The allocation is treated as a min-cost flow over project nodes plus one "pool" node for
+    unallocated students. An arc p -> q stands for moving one movable student from p to q and
+    costs c(student, q) - c(student, current seat). Changes are repaired with shortest paths
+    in this residual graph, found by a vectorised label-correcting search that only expands
+    the nodes improved in the previous pass, so the work follows the size of the change.
+    """
+
+    def __init__(self, matrix, assignment, capacities, locked, cost_exponent: float = 1.0):
+        self.n_users = matrix.n_users
+        self.n_projects = matrix.n_projects
+        self.pool = self.n_projects
+        self.assignment = np.asarray(assignment, dtype=np.int64).copy()
+        self.capacities = np.asarray(capacities, dtype=np.int64)
+
+        costs = matrix.ranks.astype(np.float64) ** cost_exponent
+        self.unallocated_cost = (costs.max() if costs.size else 1.0) * max(self.n_users, 1) + 1.0
+
+        # Preference edges grouped by student
+        order = np.lexsort((matrix.cols, matrix.rows))
+        self.e_students = matrix.rows[order]
+        self.e_projects = matrix.cols[order]
+        self.e_costs = costs[order]
+        self.s_ptr = np.searchsorted(self.e_students, np.arange(self.n_users + 1))
+
+        seated = self.assignment >= 0
+        self.load = np.bincount(self.assignment[seated], minlength=self.n_projects)
+
+        # Cost of each student's current seat: the unallocated cost in the pool, NaN on a
+        # project the student never ranked (such seats are treated as fixed)
+        self.current_cost = np.full(self.n_users, self.unallocated_cost)
+        self.current_cost[seated] = np.nan
+        hit = self.assignment[self.e_students] == self.e_projects
+        self.current_cost[self.e_students[hit]] = self.e_costs[hit]
+        self.locked = np.asarray(locked, dtype=bool)
+        self.movable = ~self.locked & ~np.isnan(self.current_cost)
+        # Students taken out by the change and not placed again yet; they stay out of the
+        # residual graph so it only describes an already-optimal allocation
+        self.waiting = np.zeros(self.n_users, dtype=bool)
+
+    # ------------------------
+    # State
+    # ------------------------
+
+    def _cost(self, s, p):
+        if p == UNALLOCATED:
+            return self.unallocated_cost
+        lo, hi = self.s_ptr[s], self.s_ptr[s + 1]
+        match = np.flatnonzero(self.e_projects[lo:hi] == p)
+        return float(self.e_costs[lo + match[0]]) if match.size else np.nan
+
+    def _move(self, s, p):
+        old = self.assignment[s]
+        if old != UNALLOCATED:
+            self.load[old] -= 1
+        if p != UNALLOCATED:
+            self.load[p] += 1
+        self.assignment[s] = p
+        self.current_cost[s] = self._cost(s, p)
+        self.movable[s] = not self.locked[s] and not np.isnan(self.current_cost[s])
+
+    def _apply(self, moves):
+        # A student appearing twice means the predecessor chain looped; leave the state untouched
+        if len({t for t, _ in moves}) != len(moves):
+            return False
+        for t, q in moves:
+            self._move(t, UNALLOCATED if q == self.pool else q)
+        return True
+
+    def unassign(self, s):
+        if not self.locked[s]:
+            if self.assignment[s] != UNALLOCATED:
+                self._move(s, UNALLOCATED)
+            self.waiting[s] = True
+
+    def evict_overflow(self, p):
+        """Unassign the worst-ranked movable students of an over-full project, returning them"""
+        overflow = int(self.load[p] - self.capacities[p])
+        if overflow <= 0:
+            return []
+        candidates = np.flatnonzero((self.assignment == p) & self.movable)
+        evicted = candidates[np.argsort(-self.current_cost[candidates], kind='stable')][:overflow]
+        for s in evicted.tolist():
+            self._move(s, UNALLOCATED)
+        self.waiting[evicted] = True
+        return evicted.tolist()
+
+    # ------------------------
+    # Shortest paths
+    # ------------------------
+
+    def _arcs(self):
+        """Residual arcs (src, dst, cost, student) for the current state"""
+        node = np.where(self.assignment < 0, self.pool, self.assignment)
+        e_s = self.e_students
+        open_ = self.movable & ~self.waiting
+        sel = open_[e_s] & (node[e_s] != self.e_projects)
+        moving = e_s[sel]
+
+        seated = np.flatnonzero(open_ & (self.assignment >= 0))
+
+        src = np.concatenate((node[moving], self.assignment[seated]))
+        dst = np.concatenate((self.e_projects[sel], np.full(len(seated), self.pool)))
+        cost = np.concatenate((self.e_costs[sel] - self.current_cost[moving],
+                               self.unallocated_cost - self.current_cost[seated]))
+        student = np.concatenate((moving, seated))
+        return src, dst, cost, student
+
+    def _shortest(self, heads, tails, cost, dist, active):
+        """
+        Label-correcting search along arcs heads -> tails from the nodes in `active`.
+
+        Each pass only expands the arcs leaving nodes whose label improved in the previous pass.
+        Returns the arc used to reach each node (-1 for the start nodes) and updates `dist`.
+        """
+        order = np.argsort(heads, kind='stable')
+        ptr = np.searchsorted(heads[order], np.arange(self.n_projects + 2))
+        pred = np.full(self.n_projects + 1, -1, dtype=np.int64)
+
+        for _ in range(self.n_projects + 1):
+            counts = ptr[active + 1] - ptr[active]
+            if not counts.sum():
+                break
+            starts = np.repeat(ptr[active] - np.cumsum(counts) + counts, counts)
+            arcs = order[starts + np.arange(counts.sum())]
+            candidate = dist[heads[arcs]] + cost[arcs]
+            better = candidate < dist[tails[arcs]] - 1e-9
+            if not better.any():
+                break
+            arcs, candidate = arcs[better], candidate[better]
+            np.minimum.at(dist, tails[arcs], candidate)
+            winners = arcs[candidate <= dist[tails[arcs]]]
+            pred[tails[winners]] = winners
+            active = np.unique(tails[arcs])
+        return pred
+
+    def insert(self, s):
+        """
+        Place an unallocated student along the cheapest augmenting path.
+
+        s enters one of its choices; a full project passes one of its students on along an arc,
+        and the path ends at a project with a free seat or in the pool (someone displaced).
+        """
+        if not self.movable[s] or self.assignment[s] != UNALLOCATED:
+            return False
+        self.waiting[s] = True
+        src, dst, cost, student = self._arcs()
+        self.waiting[s] = False
+        lo, hi = self.s_ptr[s], self.s_ptr[s + 1]
+        if lo == hi:
+            return False
+
+        dist = np.full(self.n_projects + 1, np.inf)
+        np.minimum.at(dist, self.e_projects[lo:hi], self.e_costs[lo:hi] - self.unallocated_cost)
+        pred = self._shortest(src, dst, cost, dist, np.unique(self.e_projects[lo:hi]))
+
+        ends = np.append(np.flatnonzero(self.load < self.capacities), self.pool)
+        end = int(ends[np.argmin(dist[ends])])
+        if not dist[end] < -1e-9:
+            return False
+
+        moves = []
+        node = end
+        while pred[node] >= 0 and len(moves) <= self.n_projects:
+            k = pred[node]
+            moves.append((int(student[k]), node))
+            node = int(src[k])
+        moves.append((s, node))
+        return self._apply(moves)
+
+    def fill(self, p):
+        """
+        Use free seats in project p for the best improving chains.
+
+        Searched backwards from p: a student who ranked p moves in, which frees a seat where
+        they were (or takes them out of the pool), and so on while that lowers the total cost.
+        """
+        improved = 0
+        while self.load[p] < self.capacities[p]:
+            src, dst, cost, student = self._arcs()
+            dist = np.full(self.n_projects + 1, np.inf)
+            dist[p] = 0.0
+            succ = self._shortest(dst, src, cost, dist, np.array([p]))
+
+            # A chain may start at any seated project (its seat is freed) or in the pool
+            starts = np.append(np.flatnonzero(self.load > 0), self.pool)
+            starts = starts[starts != p]
+            if not starts.size:
+                break
+            start = int(starts[np.argmin(dist[starts])])
+            if not dist[start] < -1e-9:
+                break
+
+            moves = []
+            node = start
+            while node != p and succ[node] >= 0 and len(moves) <= self.n_projects:
+                k = succ[node]
+                moves.append((int(student[k]), int(dst[k])))
+                node = int(dst[k])
+            if node != p or not self._apply(moves):
+                break
+            improved += 1
+        return improved
+
+
+def _current_allocations(timeframe_id):
+    return db.session.query(
+        AllocationResult.id, AllocationResult.user_id, AllocationResult.project_id,
+        AllocationResult.status, AllocationResult.allocation_method
+    ).filter(
+        AllocationResult.timeframe_id == timeframe_id,
+        AllocationResult.role_type == 'student'
+    ).all()
+
+
+def timeframe_has_student_allocation(timeframe_id: int) -> bool:
+    return db.session.query(AllocationResult.id).filter_by(
+        timeframe_id=timeframe_id, role_type='student'
+    ).first() is not None
+
+
+def incremental_reallocate(timeframe_id: int, changed_project_ids: Iterable[int] = (),
+                           changed_user_ids: Iterable[int] = (), allocated_by: Optional[int] = None,
+                           cost_exponent: float = 1.0) -> Dict[str, Any]:
+    """
+    Repair the stored student allocation after capacity edits or late preference changes.
+
+    Starts from the rows currently stored. Only pending automatic rows can move: manual and
+    override allocations, confirmed rows and rows on projects the student never ranked stay
+    fixed, as in run_student_allocation. Rows that do not change keep their batch. A student who
+    moved has their existing row updated in place and re-stamped with a new batch id, so it leaves
+    the batch it was written in; newly placed students get rows inserted under that new batch id.
+    Students who lost their seat get an UnallocatedUser row, and unallocated students that were
+    placed are marked resolved. The caller commits.
+    """
+    changed_project_ids = set(changed_project_ids)
+    changed_user_ids = set(changed_user_ids)
+
+    # Serialise repairs of one timeframe across workers (no-op on SQLite, which locks on write)
+    db.session.query(Timeframe.id).filter(Timeframe.id == timeframe_id).with_for_update().first()
+    rows = _current_allocations(timeframe_id)
+
+    matrix = load_preference_matrix(timeframe_id, 'student')
+    user_pos = matrix.user_positions([r.user_id for r in rows])
+    project_pos = matrix.project_positions([r.project_id for r in rows])
+
+    assignment = np.full(matrix.n_users, UNALLOCATED, dtype=np.int64)
+    locked = np.zeros(matrix.n_users, dtype=bool)
+    row_by_user = {}
+    orphaned = []
+    for row, s, p in zip(rows, user_pos, project_pos):
+        if s < 0 or p < 0:
+            # No longer a student in this timeframe, or the project is gone
+            if row.status == 'pending':
+                orphaned.append(row)
+            continue
+        row_by_user[int(s)] = row
+        if row.status in ('pending', 'confirmed'):
+            assignment[s] = p
+        locked[s] = row.allocation_method != AUTOMATIC_METHOD or row.status != 'pending'
+
+    allocator = IncrementalAllocator(matrix, assignment, matrix.capacities, locked, cost_exponent)
+    before = assignment
+
+    # Students with changed preferences leave first; refilling their seats restores an optimal
+    # allocation of everyone else before they are placed again
+    pending = []
+    for s in matrix.user_positions(list(changed_user_ids)):
+        if s >= 0 and not locked[s]:
+            allocator.unassign(int(s))
+            pending.append(int(s))
+    for s in pending:
+        if before[s] >= 0:
+            allocator.fill(int(before[s]))
+
+    for r in orphaned:
+        changed_project_ids.add(r.project_id)
+    changed_projects = [int(p) for p in matrix.project_positions(list(changed_project_ids)) if p >= 0]
+    for p in changed_projects:
+        pending.extend(allocator.evict_overflow(p))
+
+    for s in pending:
+        allocator.insert(s)
+    for p in changed_projects:
+        allocator.fill(p)
+
+    after = np.asarray(allocator.assignment, dtype=np.int64)
+    changed = np.flatnonzero(after != before)
+
+    batch_id = new_allocation_batch_id(timeframe_id)
+    now = datetime.utcnow()
+    note = "Incremental update"
+    fulfilled = matrix.ranks_for_assignment(after)
+    has_preferences = matrix.preferences_per_user() > 0
+    has_open_choice = np.zeros(matrix.n_users, dtype=bool)
+    has_open_choice[matrix.rows[matrix.capacities[matrix.cols] > 0]] = True
+
+    inserts, updates, released, placed_user_ids = [], [], [], []
+    for s in changed.tolist():
+        user_id = int(matrix.user_ids[s])
+        p = int(after[s])
+        existing = row_by_user.get(s)
+        if p == UNALLOCATED:
+            released.append(existing.id)
+            continue
+        values = {
+            'project_id': int(matrix.project_ids[p]),
+            'preference_rank_fulfilled': int(fulfilled[s]),
+            'allocation_batch_id': batch_id,
+            'allocation_method': AUTOMATIC_METHOD,
+            'status': 'pending',
+            'allocated_at': now,
+            'allocated_by': allocated_by,
+            'notes': note,
+        }
+        if existing is not None:
+            updates.append(dict(values, id=existing.id))
+        else:
+            inserts.append(dict(values, user_id=user_id, timeframe_id=timeframe_id, role_type='student'))
+            placed_user_ids.append(user_id)
+
+    released_ids = released + [r.id for r in orphaned]
+    if released_ids:
+        AllocationResult.query.filter(AllocationResult.id.in_(released_ids)).delete(synchronize_session=False)
+    if updates:
+        db.session.bulk_update_mappings(AllocationResult, updates)
+    if inserts:
+        db.session.execute(AllocationResult.__table__.insert(), inserts)
+    if placed_user_ids:
+        UnallocatedUser.query.filter(
+            UnallocatedUser.timeframe_id == timeframe_id,
+            UnallocatedUser.expected_role == 'student',
+            UnallocatedUser.resolved == False,  # noqa: E712
+            UnallocatedUser.user_id.in_(placed_user_ids)
+        ).update({'resolved': True, 'resolved_at': now, 'resolved_by': allocated_by,
+                  'resolution_notes': f'Placed by allocation batch {batch_id}'}, synchronize_session=False)
+
+    newly_unallocated = [s for s in changed.tolist() if after[s] == UNALLOCATED]
+    if newly_unallocated:
+        db.session.execute(UnallocatedUser.__table__.insert(), [{
+            'user_id': int(matrix.user_ids[s]),
+            'timeframe_id': timeframe_id,
+            'allocation_batch_id': batch_id,
+            'expected_role': 'student',
+            'reason': _unallocated_reason(bool(has_preferences[s]), bool(has_open_choice[s])),
+            'details': note,
+            'manual_intervention_required': True,
+            'resolved': False,
+            'created_at': now,
+        } for s in newly_unallocated])
+
+    logger.info(
+        f"Incremental allocation batch {batch_id} for timeframe {timeframe_id}: "
+        f"{len(updates)} moved, {len(inserts)} placed, {len(newly_unallocated)} released"
+    )
+
+    return {
+        'success': True,
+        'batch_id': batch_id,
+        'moved': len(updates),
+        'placed': len(inserts),
+        'released': len(newly_unallocated),
+        'orphaned_removed': len(orphaned),
+    }
+
+
+def repair_allocation_after_change(timeframe_id: int, changed_project_ids: Iterable[int] = (),
+                                   changed_user_ids: Iterable[int] = (),
+                                   allocated_by: Optional[int] = None) -> Optional[ImportJob]:
+    """
+    Hook for routes that have just committed a capacity or preference change.
+
+    Does nothing until the timeframe has a student allocation. Otherwise the change is added to
+    the timeframe's queued repair job, or a new one is queued REPAIR_DELAY_SECONDS ahead, and a
+    background worker runs incremental_reallocate; a burst of submissions costs one repair and
+    the request does not wait for it. Failures are logged without affecting the caller's change.
+    """
+    try:
+        if not timeframe_has_student_allocation(timeframe_id):
+            return None
+        changed_project_ids = {int(p) for p in changed_project_ids}
+        changed_user_ids = {int(u) for u in changed_user_ids}
+
+        # Merge into a job no worker has claimed yet; the conditional update loses to a claim
+        # or a concurrent merge, in which case the next candidate (or a new job) is used
+        for _ in range(3):
+            job = ImportJob.query.filter(
+                ImportJob.job_type == ALLOCATION_REPAIR_JOB,
+                ImportJob.timeframe_id == timeframe_id,
+                ImportJob.status == 'queued'
+            ).order_by(ImportJob.id.desc()).first()
+            if job is None:
+                break
+            options = job.get_options()
+            merged = {
+                'changed_project_ids': sorted(changed_project_ids | set(options.get('changed_project_ids', []))),
+                'changed_user_ids': sorted(changed_user_ids | set(options.get('changed_user_ids', []))),
+                'allocated_by': allocated_by or options.get('allocated_by'),
+            }
+            merged_into = db.session.execute(
+                update(ImportJob)
+                .where(ImportJob.id == job.id, ImportJob.status == 'queued', ImportJob.options == job.options)
+                .values(options=json.dumps(merged))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.session.commit()
+            if merged_into:
+                return job
+
+        timeframe = Timeframe.query.get(timeframe_id)
+        job, _ = enqueue_job(
+            ALLOCATION_REPAIR_JOB, timeframe_id, timeframe.school_id,
+            options={'changed_project_ids': sorted(changed_project_ids),
+                     'changed_user_ids': sorted(changed_user_ids),
+                     'allocated_by': allocated_by},
+            run_after=datetime.utcnow() + timedelta(seconds=REPAIR_DELAY_SECONDS),
+        )
+        return job
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not queue allocation repair for timeframe {timeframe_id}: {str(e)}")
+        return None
+
+
+def process_allocation_repair_job(job: ImportJob) -> dict:
+    """Import job handler: repair the allocation for the changes collected in the job's options"""
+    options = job.get_options()
+    return incremental_reallocate(
+        job.timeframe_id,
+        changed_project_ids=options.get('changed_project_ids', []),
+        changed_user_ids=options.get('changed_user_ids', []),
+        allocated_by=options.get('allocated_by'),
+    )
+
+
+register_job_handler(ALLOCATION_REPAIR_JOB, process_allocation_repair_job)
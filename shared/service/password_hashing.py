@@ -0,0 +1,136 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import secrets
+import string
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PASSWORD_CHARACTERS = string.ascii_letters + string.digits + string.punctuation
+
+# Below this many passwords the pool start-up and pickling cost more than they save
+PARALLEL_THRESHOLD = 8
+
+# Workers must not fork the web process: its threads, locks and open database connections would be
+# copied into them mid-use. forkserver forks from a clean server process; spawn where it is missing.
+POOL_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_HASH_SETTINGS = {
+    'PASSWORD_HASH_METHOD': 'scrypt',
+    'PASSWORD_HASH_SALT_LENGTH': 16,
+    'PASSWORD_HASH_WORKERS': 0,
+    'PASSWORD_HASH_CHUNK_SIZE': 32,
+}
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def generate_random_password(length=12):
+    return ''.join(secrets.choice(PASSWORD_CHARACTERS) for _ in range(length))
+
+
+def unusable_password_hash() -> str:
+    """
+    Placeholder hash for an account whose password has not been issued yet: no password matches it
+    (check_password_hash rejects a value without a method), and it costs nothing to compute
+    """
+    return '!' + secrets.token_hex(16)
+
+
+def hash_settings() -> dict:
+    """Hash parameters from the app config, falling back to the defaults outside an app context"""
+    source = current_app.config if has_app_context() else {}
+
+    def setting(key):
+        value = source.get(key)
+        return DEFAULT_HASH_SETTINGS[key] if value is None else value
+
+    return {
+        'method': setting('PASSWORD_HASH_METHOD'),
+        'salt_length': int(setting('PASSWORD_HASH_SALT_LENGTH')),
+        'workers': int(setting('PASSWORD_HASH_WORKERS')) or os.cpu_count() or 1,
+        'chunk_size': max(int(setting('PASSWORD_HASH_CHUNK_SIZE')), 1),
+    }
+
+
+def _hash_chunk(passwords: Optional[List[str]], count: int, method: str, salt_length: int) -> List[Tuple[str, str]]:
+    """Worker: hash the given passwords, or generate and hash `count` new ones"""
+    if passwords is None:
+        passwords = [generate_random_password() for _ in range(count)]
+    return [(password, generate_password_hash(password, method=method, salt_length=salt_length))
+            for password in passwords]
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    # One long-lived pool per process; rebuilt only if the configured size changes
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ProcessPoolExecutor(max_workers=workers,
+                                            mp_context=multiprocessing.get_context(POOL_START_METHOD))
+            _executor_workers = workers
+        return _executor
+
+
+@atexit.register
+def shutdown_hash_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _run(passwords: Optional[List[str]], count: int) -> List[Tuple[str, str]]:
+    settings = hash_settings()
+    method, salt_length = settings['method'], settings['salt_length']
+    if count < PARALLEL_THRESHOLD or settings['workers'] == 1:
+        return _hash_chunk(passwords, count, method, salt_length)
+
+    chunk_size = settings['chunk_size']
+    starts = range(0, count, chunk_size)
+    executor = _get_executor(settings['workers'])
+    futures = [
+        executor.submit(_hash_chunk,
+                        None if passwords is None else passwords[start:start + chunk_size],
+                        min(chunk_size, count - start), method, salt_length)
+        for start in starts
+    ]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    logger.info(f"Hashed {count} passwords with {method} across {settings['workers']} workers")
+    return results
+
+
+def generate_credentials(count: int) -> List[Tuple[str, str]]:
+    """
+    Generate `count` random passwords with their hashes as (password, hash) pairs.
+
+    Generation and hashing both run in a process pool, in chunks of PASSWORD_HASH_CHUNK_SIZE,
+    so a large import scales with PASSWORD_HASH_WORKERS instead of blocking on one core.
+    """
+    if count <= 0:
+        return []
+    return _run(None, count)
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    """Hash known passwords with the configured parameters, in order"""
+    if not passwords:
+        return []
+    return [password_hash for _, password_hash in _run(list(passwords), len(passwords))]
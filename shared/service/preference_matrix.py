@@ -0,0 +1,251 @@
+import itertools
+import logging
+from typing import Dict, Optional
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sqlalchemy import select
+
+from database import db
+from shared.models import Preference, Project, Role, user_role_timeframes
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CAPACITY_COLUMNS = {
+    'student': Project.student_capacity,
+    'supervisor': Project.supervisor_capacity,
+    'assessor': Project.assessor_capacity,
+}
+
+
+def _int_columns(statement, width: int) -> np.ndarray:
+    """
+    Run a column-only SELECT of integer columns and return an (n, width) int64 array.
+
+    Rows are read straight from the DBAPI cursor: integer columns need no SQLAlchemy result
+    processing, and skipping Row construction is most of the cost at 100k rows.
+    """
+    result = db.session.connection().execute(statement)
+    try:
+        rows = result.cursor.fetchall()
+    finally:
+        result.close()
+    flat = np.fromiter(
+        itertools.chain.from_iterable(rows), dtype=np.int64, count=len(rows) * width
+    )
+    return flat.reshape(-1, width)
+
+
+class PreferenceMatrix:
+    """
+    Dense/sparse NumPy view over the preferences of one timeframe.
+
+    Rows are users (sorted by user_id), columns are projects (sorted by project_id) and
+    cell values are preference ranks, 0 meaning "not ranked". The COO arrays `rows`, `cols`
+    and `ranks` are the canonical form; dense and CSR views are built on demand.
+    """
+
+    def __init__(self, user_ids, project_ids, rows, cols, ranks, capacities, timeframe_id=None):
+        self.timeframe_id = timeframe_id
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.project_ids = np.asarray(project_ids, dtype=np.int64)
+        self.rows = np.asarray(rows, dtype=np.int64)
+        self.cols = np.asarray(cols, dtype=np.int64)
+        self.ranks = np.asarray(ranks, dtype=np.int64)
+        self.capacities = np.asarray(capacities, dtype=np.int64)
+
+    @classmethod
+    def from_arrays(cls, pref_user_ids, pref_project_ids, pref_ranks,
+                    member_user_ids=None, project_ids=None, capacities=None, timeframe_id=None):
+        """
+        Build a matrix from raw id arrays. Preferences whose user is not in `member_user_ids`
+        or whose project is not in `project_ids` are dropped; omitted member/project lists are
+        taken from the preferences themselves.
+        """
+        pref_user_ids = np.asarray(pref_user_ids, dtype=np.int64)
+        pref_project_ids = np.asarray(pref_project_ids, dtype=np.int64)
+        pref_ranks = np.asarray(pref_ranks, dtype=np.int64)
+
+        users = np.unique(pref_user_ids if member_user_ids is None else np.asarray(member_user_ids, dtype=np.int64))
+        if project_ids is None:
+            projects = np.unique(pref_project_ids)
+            caps = np.zeros(len(projects), dtype=np.int64)
+        else:
+            project_ids = np.asarray(project_ids, dtype=np.int64)
+            order = np.argsort(project_ids, kind='stable')
+            projects = project_ids[order]
+            caps = np.zeros(len(projects), dtype=np.int64) if capacities is None \
+                else np.asarray(capacities, dtype=np.int64)[order]
+
+        rows = np.searchsorted(users, pref_user_ids)
+        cols = np.searchsorted(projects, pref_project_ids)
+        keep = (rows < len(users)) & (cols < len(projects))
+        keep[keep] = (users[rows[keep]] == pref_user_ids[keep]) & (projects[cols[keep]] == pref_project_ids[keep])
+
+        return cls(users, projects, rows[keep], cols[keep], pref_ranks[keep], caps, timeframe_id)
+
+    # ------------------------
+    # Shape and index maps
+    # ------------------------
+
+    @property
+    def n_users(self) -> int:
+        return len(self.user_ids)
+
+    @property
+    def n_projects(self) -> int:
+        return len(self.project_ids)
+
+    @property
+    def n_preferences(self) -> int:
+        return len(self.ranks)
+
+    @property
+    def user_index(self) -> Dict[int, int]:
+        return {int(uid): i for i, uid in enumerate(self.user_ids)}
+
+    @property
+    def project_index(self) -> Dict[int, int]:
+        return {int(pid): i for i, pid in enumerate(self.project_ids)}
+
+    def user_positions(self, user_ids) -> np.ndarray:
+        """Vectorised user_id -> row lookup, -1 for unknown ids"""
+        return self._positions(self.user_ids, user_ids)
+
+    def project_positions(self, project_ids) -> np.ndarray:
+        """Vectorised project_id -> column lookup, -1 for unknown ids"""
+        return self._positions(self.project_ids, project_ids)
+
+    @staticmethod
+    def _positions(sorted_ids, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(sorted_ids, ids)
+        found = pos < len(sorted_ids)
+        found[found] = sorted_ids[pos[found]] == ids[found]
+        return np.where(found, pos, -1)
+
+    # ------------------------
+    # Views
+    # ------------------------
+
+    def dense(self, dtype=np.int16) -> np.ndarray:
+        """users x projects rank matrix, 0 where the user did not rank the project"""
+        matrix = np.zeros((self.n_users, self.n_projects), dtype=dtype)
+        matrix[self.rows, self.cols] = self.ranks
+        return matrix
+
+    def sparse(self) -> csr_matrix:
+        """users x projects CSR rank matrix"""
+        return csr_matrix((self.ranks, (self.rows, self.cols)), shape=(self.n_users, self.n_projects))
+
+    def truncated(self, preference_limit: int) -> 'PreferenceMatrix':
+        """Copy keeping only ranks up to `preference_limit`"""
+        keep = self.ranks <= preference_limit
+        return PreferenceMatrix(self.user_ids, self.project_ids, self.rows[keep], self.cols[keep],
+                                self.ranks[keep], self.capacities, self.timeframe_id)
+
+    def select_users(self, mask, capacities=None) -> 'PreferenceMatrix':
+        """Copy keeping only the users where `mask` is true, optionally with new capacities"""
+        mask = np.asarray(mask, dtype=bool)
+        new_rows = np.cumsum(mask) - 1
+        keep = mask[self.rows]
+        return PreferenceMatrix(self.user_ids[mask], self.project_ids, new_rows[self.rows[keep]],
+                                self.cols[keep], self.ranks[keep],
+                                self.capacities if capacities is None else capacities, self.timeframe_id)
+
+    # ------------------------
+    # Analytics
+    # ------------------------
+
+    def demand(self, max_rank: Optional[int] = None) -> np.ndarray:
+        """Number of users ranking each project (optionally only ranks <= max_rank)"""
+        cols = self.cols if max_rank is None else self.cols[self.ranks <= max_rank]
+        return np.bincount(cols, minlength=self.n_projects)
+
+    def demand_by_rank(self) -> np.ndarray:
+        """projects x ranks count matrix (column r-1 holds rank r), the basis for demand heatmaps"""
+        max_rank = int(self.ranks.max()) if self.n_preferences else 0
+        heatmap = np.zeros((self.n_projects, max_rank), dtype=np.int64)
+        np.add.at(heatmap, (self.cols, self.ranks - 1), 1)
+        return heatmap
+
+    def oversubscription(self) -> np.ndarray:
+        """First-choice demand divided by capacity (inf for zero-capacity projects in demand)"""
+        first = self.demand(max_rank=1).astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = first / self.capacities
+        ratio[(first == 0) & (self.capacities == 0)] = 0.0
+        return ratio
+
+    def rank_distribution(self) -> np.ndarray:
+        """Count of submitted preferences per rank (index r holds rank r)"""
+        return np.bincount(self.ranks, minlength=1)
+
+    def preferences_per_user(self) -> np.ndarray:
+        return np.bincount(self.rows, minlength=self.n_users)
+
+    def ranks_for_assignment(self, assignment) -> np.ndarray:
+        """
+        Rank each user got under `assignment` (project column per user, -1 unallocated).
+        Returns 0 for unallocated users and for assignments to unranked projects.
+        """
+        assignment = np.asarray(assignment, dtype=np.int64)
+        fulfilled = np.zeros(self.n_users, dtype=np.int64)
+        hit = assignment[self.rows] == self.cols
+        fulfilled[self.rows[hit]] = self.ranks[hit]
+        return fulfilled
+
+    def satisfaction(self, assignment) -> Dict[str, float]:
+        """Summary metrics for an assignment vector"""
+        fulfilled = self.ranks_for_assignment(assignment)
+        allocated = fulfilled > 0
+        allocated_count = int(allocated.sum())
+        return {
+            'allocated': allocated_count,
+            'unallocated': int(self.n_users - allocated_count),
+            'first_choice': int((fulfilled == 1).sum()),
+            'first_choice_rate': round(float((fulfilled == 1).sum()) / self.n_users, 4) if self.n_users else 0.0,
+            'mean_rank': round(float(fulfilled[allocated].mean()), 3) if allocated_count else None,
+        }
+
+
+def load_preference_matrix(timeframe_id: int, role_name: str = 'student') -> PreferenceMatrix:
+    """
+    Load a timeframe's preferences for users holding `role_name` there.
+
+    Users come from user_role_timeframes (so members without preferences still get a row),
+    projects carry the capacity column matching the role. Every query selects plain integer
+    columns only, so no ORM objects are built. Preferences are read for the whole timeframe
+    on the (timeframe_id, preference_rank) index and rows of other roles are dropped in NumPy,
+    which is cheaper than a role subquery on the database side.
+    """
+    role_members = (
+        select(user_role_timeframes.c.user_id)
+        .join(Role, Role.id == user_role_timeframes.c.role_id)
+        .where(user_role_timeframes.c.timeframe_id == timeframe_id, Role.name == role_name)
+    )
+    members = _int_columns(role_members.distinct(), 1)[:, 0]
+
+    capacity_column = CAPACITY_COLUMNS.get(role_name, Project.student_capacity)
+    projects = _int_columns(
+        select(Project.id, db.func.coalesce(capacity_column, 0))
+        .where(Project.timeframe_id == timeframe_id), 2
+    )
+
+    prefs = _int_columns(
+        select(Preference.user_id, Preference.project_id, Preference.preference_rank)
+        .where(Preference.timeframe_id == timeframe_id), 3
+    )
+
+    matrix = PreferenceMatrix.from_arrays(
+        prefs[:, 0], prefs[:, 1], prefs[:, 2],
+        member_user_ids=members, project_ids=projects[:, 0], capacities=projects[:, 1],
+        timeframe_id=timeframe_id
+    )
+    logger.info(
+        f"Loaded preference matrix for timeframe {timeframe_id} ({role_name}): "
+        f"{matrix.n_users} users x {matrix.n_projects} projects, {matrix.n_preferences} preferences"
+    )
+    return matrix
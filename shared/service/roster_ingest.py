@@ -0,0 +1,225 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from database import db
+from shared.models import User, Role, user_roles, user_timeframes, user_role_timeframes
+from shared.service.password_hashing import unusable_password_hash
+from shared.utils.bulk_helpers import chunked, insert_ignore
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Excel template columns (see loadDataController.download_template)
+ROSTER_COLUMNS = {
+    'student_staff_id': 'ID',
+    'name': 'name',
+    'course': 'course studying',
+    'email': 'email',
+    'role': 'role',
+}
+
+# Emails per IN (...) lookup
+LOOKUP_CHUNK_SIZE = 1000
+
+
+def _clean(value) -> str:
+    # None and NaN (pandas' empty cell) both mean "no value"
+    if value is None or value != value:
+        return ''
+    return str(value).strip()
+
+
+class RoleCache:
+    """
+    Process-wide role name -> id map, loaded with one query per database and extended when
+    an upload introduces a new role. Call clear() after a rollback that may have dropped roles.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, Dict[str, int]] = {}
+
+    def clear(self):
+        self._ids.clear()
+
+    def ids_for(self, names: Iterable[str]) -> Dict[str, int]:
+        key = str(db.session.get_bind().url)
+        cache = self._ids.get(key)
+        if cache is None:
+            cache = dict((name, role_id) for role_id, name in db.session.execute(select(Role.id, Role.name)))
+            self._ids[key] = cache
+
+        missing = sorted(set(names) - set(cache))
+        if missing:
+            insert_ignore(Role, [{'name': name, 'description': name, 'is_active': True,
+                                  'created_at': datetime.utcnow()} for name in missing])
+            cache.update((name, role_id) for role_id, name in db.session.execute(
+                select(Role.id, Role.name).where(Role.name.in_(missing))
+            ))
+        return {name: cache[name] for name in names}
+
+
+role_cache = RoleCache()
+
+
+class RosterIngestor:
+    """
+    Set-based loader for roster rows into one timeframe.
+
+    Each call to ingest() handles a batch of (row_number, record) pairs with a fixed number of
+    statements: one IN lookup of the batch's emails, one bulk UPDATE of existing users, one
+    bulk INSERT of new users (plus an id lookup), and INSERT-ignore batches for user_roles,
+    user_timeframes and user_role_timeframes. The batch is written under a savepoint; if it
+    fails, it is rolled back and retried row by row so bad rows end up in error_details.
+    Counters accumulate across batches.
+    """
+
+    def __init__(self, timeframe_id: int, school_id: int, allowed_roles: Iterable[str]):
+        self.timeframe_id = timeframe_id
+        self.school_id = school_id
+        self.allowed_roles = {role.lower().strip() for role in allowed_roles}
+
+        self.success_count = 0
+        self.error_count = 0
+        self.error_details: List[str] = []
+        self.role_skipped_count = 0
+        self.role_skip_details: List[str] = []
+        self.created_count = 0
+        self.updated_count = 0
+
+    def _validate(self, rows) -> List[Tuple[int, Dict[str, str]]]:
+        valid = []
+        for row_number, record in rows:
+            values = {field: _clean(record.get(column)) for field, column in ROSTER_COLUMNS.items()}
+            values['email'] = values['email'].lower()
+            values['role'] = values['role'].lower()
+
+            if not values['email'] or '@' not in values['email']:
+                self.error_details.append(f'Row {row_number}: Invalid email')
+                self.error_count += 1
+                continue
+            if values['role'] not in self.allowed_roles:
+                self.role_skip_details.append(
+                    f'Row {row_number}: Skipped role "{values["role"]}" for {values["email"]} (not in allowed roles)'
+                )
+                self.role_skipped_count += 1
+                continue
+            valid.append((row_number, values))
+        return valid
+
+    def _lookup_users(self, emails) -> Dict[str, Tuple[int, Optional[int]]]:
+        found = {}
+        for chunk in chunked(emails, LOOKUP_CHUNK_SIZE):
+            for user_id, email, school_id in db.session.execute(
+                select(User.id, User.email, User.school_id).where(User.email.in_(chunk))
+            ):
+                found[email] = (user_id, school_id)
+        return found
+
+    def ingest(self, rows: Iterable[Tuple[int, dict]]) -> int:
+        """Validate and load one batch; returns the number of rows accepted"""
+        valid = self._validate(rows)
+        if not valid:
+            return 0
+
+        # Resolved outside the savepoints below so a rollback cannot leave stale ids in role_cache
+        role_ids = role_cache.ids_for({values['role'] for _, values in valid})
+        try:
+            with db.session.begin_nested():
+                loaded = self._load(valid, role_ids)
+        except Exception as e:
+            # One bad row (too long a value, a constraint) fails the set-based write; retry the
+            # batch row by row so only the offending rows are reported and the rest are kept
+            logger.warning(f"Roster batch of {len(valid)} rows failed ({e}); loading row by row")
+            accepted = 0
+            for row_number, values in valid:
+                try:
+                    with db.session.begin_nested():
+                        loaded = self._load([(row_number, values)], role_ids)
+                except Exception as row_error:
+                    self.error_details.append(f'Row {row_number}: {row_error.__class__.__name__}: {row_error}'[:500])
+                    self.error_count += 1
+                    continue
+                self._apply(loaded)
+                accepted += 1
+            self.success_count += accepted
+            return accepted
+
+        self._apply(loaded)
+        self.success_count += len(valid)
+        return len(valid)
+
+    def _apply(self, loaded: Tuple[int, int]):
+        """Count a write once its savepoint has been released"""
+        updated, created = loaded
+        self.updated_count += updated
+        self.created_count += created
+
+    def _load(self, valid, role_ids: Dict[str, int]) -> Tuple[int, int]:
+        """Write validated rows; returns the number of users updated and created"""
+        # Later rows win for profile fields; every (email, role) pair is kept
+        profiles = {}
+        email_roles = set()
+        for _, values in valid:
+            profiles[values['email']] = values
+            email_roles.add((values['email'], values['role']))
+
+        existing = self._lookup_users(list(profiles))
+        updated = len(existing)
+
+        if existing:
+            updates = []
+            for email, (user_id, school_id) in existing.items():
+                values = profiles[email]
+                change = {'id': user_id, 'name': values['name'], 'course': values['course'],
+                          'student_staff_id': values['student_staff_id']}
+                if not school_id:
+                    change['school_id'] = self.school_id
+                updates.append(change)
+            db.session.execute(update(User), updates)
+
+        new_emails = [email for email in profiles if email not in existing]
+        if new_emails:
+            # No password yet: the outbox worker issues one when it renders the welcome email
+            now = datetime.utcnow()
+            insert_ignore(User, [{
+                'name': profiles[email]['name'],
+                'email': email,
+                'course': profiles[email]['course'],
+                'student_staff_id': profiles[email]['student_staff_id'],
+                'password_hash': unusable_password_hash(),
+                'school_id': self.school_id,
+                'email_sent': False,
+                'created_at': now,
+            } for email in new_emails])
+            existing.update(self._lookup_users(new_emails))
+
+        now = datetime.utcnow()
+        insert_ignore(user_roles, [
+            {'user_id': existing[email][0], 'role_id': role_ids[role], 'assigned_at': now}
+            for email, role in email_roles
+        ])
+        insert_ignore(user_timeframes, [
+            {'user_id': existing[email][0], 'timeframe_id': self.timeframe_id, 'assigned_at': now}
+            for email in profiles
+        ])
+        insert_ignore(user_role_timeframes, [
+            {'user_id': existing[email][0], 'role_id': role_ids[role],
+             'timeframe_id': self.timeframe_id, 'assigned_at': now}
+            for email, role in email_roles
+        ])
+        return updated, len(new_emails)
+
+    def summary(self) -> Dict[str, object]:
+        return {
+            'success_count': self.success_count,
+            'error_count': self.error_count,
+            'error_details': self.error_details,
+            'role_skipped_count': self.role_skipped_count,
+            'role_skip_details': self.role_skip_details,
+            'created_count': self.created_count,
+            'updated_count': self.updated_count,
+        }
@@ -0,0 +1,265 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+from shared.utils.ttl_cache import TTLCache
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_SMTP_SETTINGS = {
+    'SMTP_POOL_SIZE': 8,  # authenticated connections per server, each used by one sender thread
+    'SMTP_RATE_LIMIT_PER_SECOND': 0,  # messages per second per server, 0 = unlimited
+    'SMTP_MESSAGES_PER_CONNECTION': 100,  # a connection is closed and replaced after this many
+    'SMTP_TIMEOUT_SECONDS': 30,
+    'SMTP_ASYNC_CONCURRENCY': 16,  # concurrent sends (one connection each) of the asyncio sender
+    'SMTP_SEND_MODE': 'auto',  # auto, pooled, async, threaded or single; the outbox uses async or pooled
+}
+
+# A dropped connection is re-opened and the message sent again this many times
+SEND_RETRIES_ON_DISCONNECT = 2
+
+_rate_limiters: Dict[Hashable, 'RateLimiter'] = {}
+_rate_limiters_lock = threading.Lock()
+
+# EHLO capabilities per (host, port), refreshed by every connection the senders open
+SMTP_CAPABILITIES_TTL = 24 * 3600  # seconds
+smtp_capabilities_cache = TTLCache(maxsize=256, ttl=SMTP_CAPABILITIES_TTL)
+
+
+def smtp_setting(key):
+    source = current_app.config if has_app_context() else {}
+    value = source.get(key)
+    return DEFAULT_SMTP_SETTINGS[key] if value is None else value
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every sender of one SMTP server: at most `rate` acquisitions per second
+    on average, with bursts of up to `burst`. A rate of 0 never waits.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, timer=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self._timer = timer
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = timer()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available and return 0, else return the seconds until one is"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = self._timer()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            self._sleep(wait)
+
+
+def get_rate_limiter(server: Hashable, rate: Optional[float] = None) -> RateLimiter:
+    """The process-wide limiter for one SMTP server, so concurrent bulk sends share its budget"""
+    rate = float(smtp_setting('SMTP_RATE_LIMIT_PER_SECOND') if rate is None else rate)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(server)
+        if limiter is None or limiter.rate != rate:
+            limiter = _rate_limiters[server] = RateLimiter(rate)
+        return limiter
+
+
+def parse_capabilities(esmtp_features: Dict[str, str], starttls: Optional[bool] = None) -> dict:
+    """
+    The capabilities the senders choose a strategy by, from EHLO keywords as smtplib stores them
+    (lowercase keyword -> parameters). STARTTLS is only offered before the upgrade, so pass
+    `starttls` when the features were read over TLS.
+    """
+    size = esmtp_features.get('size', '').strip()
+    return {
+        'pipelining': 'pipelining' in esmtp_features,
+        'size': int(size) if size.isdigit() and int(size) > 0 else None,  # SIZE 0 means no limit
+        'starttls': 'starttls' in esmtp_features if starttls is None else starttls,
+        'auth': esmtp_features.get('auth', '').upper().split(),
+    }
+
+
+def remember_capabilities(server: Hashable, esmtp_features: Dict[str, str], starttls: Optional[bool] = None) -> dict:
+    capabilities = parse_capabilities(esmtp_features, starttls)
+    smtp_capabilities_cache.set(server, capabilities)
+    return capabilities
+
+
+def cached_capabilities(server: Hashable) -> Optional[dict]:
+    """Capabilities last seen for a (host, port), or None if no connection was made recently"""
+    return smtp_capabilities_cache.get(server)
+
+
+class _PooledConnection:
+    __slots__ = ('smtp', 'sent')
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+
+
+class SMTPConnectionPool:
+    """
+    Up to `size` authenticated SMTP connections to the server of one EmailService, shared by
+    sender threads. A connection is handed to one thread at a time and returned for reuse, so
+    the TCP/TLS handshake and login are paid once per connection instead of once per message.
+
+    Sends wait on the server's rate limiter; a connection the server dropped is re-opened and the
+    message sent again, and every connection is replaced after `messages_per_connection` messages
+    (many providers cap messages per session).
+    """
+
+    def __init__(self, email_service, size: Optional[int] = None, messages_per_connection: Optional[int] = None,
+                 rate_limiter: Optional[RateLimiter] = None, timeout: Optional[float] = None):
+        self.email_service = email_service
+        self.size = max(1, int(size or smtp_setting('SMTP_POOL_SIZE')))
+        self.messages_per_connection = int(messages_per_connection or smtp_setting('SMTP_MESSAGES_PER_CONNECTION'))
+        self.timeout = float(timeout or smtp_setting('SMTP_TIMEOUT_SECONDS'))
+        self.rate_limiter = rate_limiter or get_rate_limiter((email_service.smtp_server, email_service.smtp_port))
+        self._idle: "queue.LifoQueue[_PooledConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.connections_opened = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self) -> _PooledConnection:
+        connection = _PooledConnection(self.email_service.open_connection(timeout=self.timeout))
+        with self._stats_lock:
+            self.connections_opened += 1
+        return connection
+
+    def _discard(self, connection: _PooledConnection):
+        try:
+            connection.smtp.quit()
+        except Exception:
+            # Already dropped by the server; just release the socket
+            connection.smtp.close()
+
+    def _acquire(self) -> _PooledConnection:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection: Optional[_PooledConnection]):
+        if connection is not None:
+            if self._closed or connection.sent >= self.messages_per_connection:
+                self._discard(connection)
+            else:
+                self._idle.put(connection)
+        self._slots.release()
+
+    def warm(self):
+        """Open one connection now, so an unreachable server or a bad login is raised before any send"""
+        self._release(self._acquire())
+
+    def send_message(self, msg: Message):
+        """Send one message over a pooled connection; raises smtplib errors the server reports"""
+        connection = self._acquire()
+        try:
+            self.rate_limiter.acquire()
+            for attempt in range(SEND_RETRIES_ON_DISCONNECT + 1):
+                try:
+                    connection.smtp.send_message(msg)
+                    connection.sent += 1
+                    return
+                except smtplib.SMTPServerDisconnected:
+                    if attempt == SEND_RETRIES_ON_DISCONNECT:
+                        raise
+                    logger.info(f"SMTP connection to {self.email_service.smtp_server} dropped; reconnecting")
+                    connection.smtp.close()
+                    connection = None
+                    connection = self._connect()
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The server refused this message and reset the transaction; the connection is still good
+            raise
+        except Exception:
+            if connection is not None:
+                self._discard(connection)
+                connection = None
+            raise
+        finally:
+            self._release(connection)
+
+    def send_many(self, messages: Iterable[Tuple[Hashable, Message]]) -> Tuple[int, Dict[Hashable, Exception]]:
+        """
+        Send (key, message) pairs with one sender thread per pooled connection; the key identifies
+        the message in the result (e.g. its recipient). Returns (sent_count, {failed key: exception}).
+        """
+        failed: Dict[Hashable, Exception] = {}
+        sent = 0
+        lock = threading.Lock()
+
+        def send(item):
+            nonlocal sent
+            key, msg = item
+            try:
+                self.send_message(msg)
+            except Exception as e:
+                logger.error(f"Failed to send email {key}: {str(e)}")
+                with lock:
+                    failed[key] = e
+                return
+            with lock:
+                sent += 1
+
+        with ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='smtp-pool') as executor:
+            # Bounded submission keeps at most a few messages per thread queued in memory
+            in_flight = threading.BoundedSemaphore(self.size * 4)
+
+            def run(item):
+                try:
+                    send(item)
+                finally:
+                    in_flight.release()
+
+            for item in messages:
+                in_flight.acquire()
+                executor.submit(run, item)
+        return sent, failed
+
+    def close(self):
+        """Quit every idle connection; connections in use are closed when they are returned"""
+        self._closed = True
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(connection)
@@ -0,0 +1,220 @@
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from database import db
+from shared.models import AllocationResult, UnallocatedUser
+from shared.service.allocation_service import AUTOMATIC_METHOD, new_allocation_batch_id
+from shared.service.preference_matrix import load_preference_matrix
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STAFF_ROLES = ('supervisor', 'assessor')
+
+# Cost of a slot the solver must never use; large enough to outweigh any set of real edges
+FORBIDDEN_COST = 1e9
+
+
+def _staff_costs(ranks: np.ndarray, cost_exponent: float) -> np.ndarray:
+    """
+    staff x projects cost matrix from a dense rank matrix (0 = not ranked).
+
+    Ranked projects cost rank ** exponent; unranked projects get a neutral cost just behind
+    the worst submitted rank, so staff without preferences are still placed where needed.
+    """
+    neutral = float(ranks.max()) + 1.0 if ranks.size else 1.0
+    return np.where(ranks > 0, ranks.astype(np.float64), neutral) ** cost_exponent
+
+
+def _solve_block(costs: np.ndarray, capacities: np.ndarray, blocked: np.ndarray) -> np.ndarray:
+    """
+    Assign staff rows to project slots; returns a project index per row, or -1.
+
+    Projects are expanded into `capacity` identical slot columns with one fancy-indexing step,
+    and blocked (row, project) pairs are priced out rather than removed so the matrix stays
+    rectangular for linear_sum_assignment.
+    """
+    assignment = np.full(costs.shape[0], -1, dtype=np.int64)
+    slot_project = np.repeat(np.arange(len(capacities)), np.clip(capacities, 0, None))
+    if not costs.shape[0] or not slot_project.size:
+        return assignment
+
+    slot_costs = np.where(blocked, FORBIDDEN_COST, costs)[:, slot_project]
+    rows, cols = linear_sum_assignment(slot_costs)
+    usable = slot_costs[rows, cols] < FORBIDDEN_COST
+    assignment[rows[usable]] = slot_project[cols[usable]]
+    return assignment
+
+
+def solve_staff_allocation(supervisor_ranks, supervisor_capacity, supervisor_ids,
+                           assessor_ranks, assessor_capacity, assessor_ids,
+                           supervisor_blocked=None, assessor_blocked=None,
+                           cost_exponent: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assign supervisors and assessors to projects together.
+
+    Rank matrices are staff x projects (0 = not ranked) with the staff user ids of each row;
+    capacities are per project. Apart from one coupling the problem is block diagonal, since a
+    supervisor row can only take a supervisor slot and an assessor row an assessor slot. The
+    coupling is that a person holding both roles may not supervise and assess the same project.
+    Supervision is solved first; each dual-role person's supervised project is then priced out
+    of their assessor row, so the assessor solve cannot produce a clash.
+
+    Returns (supervisor_assignment, assessor_assignment) as project indices per row, -1 if unassigned.
+    """
+    supervisor_ranks = np.asarray(supervisor_ranks, dtype=np.int64)
+    assessor_ranks = np.asarray(assessor_ranks, dtype=np.int64)
+    supervisor_ids = np.asarray(supervisor_ids, dtype=np.int64)
+    assessor_ids = np.asarray(assessor_ids, dtype=np.int64)
+
+    if supervisor_blocked is None:
+        supervisor_blocked = np.zeros(supervisor_ranks.shape, dtype=bool)
+    assessor_blocked = np.zeros(assessor_ranks.shape, dtype=bool) if assessor_blocked is None \
+        else np.asarray(assessor_blocked, dtype=bool).copy()
+
+    supervisors = _solve_block(_staff_costs(supervisor_ranks, cost_exponent),
+                               np.asarray(supervisor_capacity), supervisor_blocked)
+
+    # Project supervised by the owner of each assessor row (-1 if none)
+    supervised = np.full(len(assessor_ids), -1, dtype=np.int64)
+    if len(supervisor_ids):
+        order = np.argsort(supervisor_ids)
+        pos = np.minimum(np.searchsorted(supervisor_ids, assessor_ids, sorter=order), len(order) - 1)
+        dual = supervisor_ids[order[pos]] == assessor_ids
+        supervised[dual] = supervisors[order[pos[dual]]]
+
+    has_project = np.flatnonzero(supervised >= 0)
+    assessor_blocked[has_project, supervised[has_project]] = True
+    assessors = _solve_block(_staff_costs(assessor_ranks, cost_exponent),
+                             np.asarray(assessor_capacity), assessor_blocked)
+    return supervisors, assessors
+
+
+def _kept_staff_rows(timeframe_id: int):
+    """Supervisor/assessor allocations that are not pending automatic ones (never replaced)"""
+    return db.session.query(
+        AllocationResult.user_id, AllocationResult.project_id,
+        AllocationResult.role_type, AllocationResult.status
+    ).filter(
+        AllocationResult.timeframe_id == timeframe_id,
+        AllocationResult.role_type.in_(STAFF_ROLES),
+        db.or_(AllocationResult.allocation_method != AUTOMATIC_METHOD,
+               AllocationResult.status != 'pending')
+    ).all()
+
+
+def run_staff_allocation(timeframe_id: int, allocated_by: Optional[int] = None,
+                         cost_exponent: float = 1.0) -> Dict[str, Any]:
+    """
+    Compute and store a new automatic supervisor + assessor allocation batch for a timeframe.
+
+    Candidates are the users holding each role in the timeframe; supervisors' submitted
+    project rankings drive the cost (a person's ranking is reused when they assess).
+    Pending automatic rows are replaced; manual, override and confirmed rows are kept, take
+    their seat, and block that person from the other role on the same project. The caller commits.
+    """
+    AllocationResult.query.filter(
+        AllocationResult.timeframe_id == timeframe_id,
+        AllocationResult.role_type.in_(STAFF_ROLES),
+        AllocationResult.allocation_method == AUTOMATIC_METHOD,
+        AllocationResult.status == 'pending'
+    ).delete(synchronize_session=False)
+    UnallocatedUser.query.filter(
+        UnallocatedUser.timeframe_id == timeframe_id,
+        UnallocatedUser.expected_role.in_(STAFF_ROLES),
+        UnallocatedUser.resolved == False  # noqa: E712
+    ).delete(synchronize_session=False)
+
+    kept = _kept_staff_rows(timeframe_id)
+    matrices = {}
+    blocked = {}
+    for role in STAFF_ROLES:
+        matrix = load_preference_matrix(timeframe_id, role)
+        role_rows = [row for row in kept if row.role_type == role]
+        locked_users = np.array([row.user_id for row in role_rows], dtype=np.int64)
+
+        seat_projects = matrix.project_positions(
+            [row.project_id for row in role_rows if row.status in ('pending', 'confirmed')]
+        )
+        seats_taken = np.bincount(seat_projects[seat_projects >= 0], minlength=matrix.n_projects)
+        matrix = matrix.select_users(~np.isin(matrix.user_ids, locked_users),
+                                     capacities=np.clip(matrix.capacities - seats_taken, 0, None))
+
+        # A kept allocation in the other role blocks the same project for this person
+        other = [row for row in kept if row.role_type != role and row.status in ('pending', 'confirmed')]
+        role_blocked = np.zeros((matrix.n_users, matrix.n_projects), dtype=bool)
+        users = matrix.user_positions([row.user_id for row in other])
+        projects = matrix.project_positions([row.project_id for row in other])
+        hit = (users >= 0) & (projects >= 0)
+        role_blocked[users[hit], projects[hit]] = True
+
+        matrices[role] = matrix
+        blocked[role] = role_blocked
+
+    supervisor_matrix, assessor_matrix = matrices['supervisor'], matrices['assessor']
+    supervisors, assessors = solve_staff_allocation(
+        supervisor_matrix.dense(np.int64), supervisor_matrix.capacities, supervisor_matrix.user_ids,
+        assessor_matrix.dense(np.int64), assessor_matrix.capacities, assessor_matrix.user_ids,
+        supervisor_blocked=blocked['supervisor'], assessor_blocked=blocked['assessor'],
+        cost_exponent=cost_exponent
+    )
+
+    batch_id = new_allocation_batch_id(timeframe_id)
+    now = datetime.utcnow()
+    allocation_rows = []
+    unallocated_rows = []
+    summary = {'success': True, 'batch_id': batch_id, 'locked_allocations': len(kept)}
+
+    for role, matrix, assignment in (('supervisor', supervisor_matrix, supervisors),
+                                     ('assessor', assessor_matrix, assessors)):
+        fulfilled = matrix.ranks_for_assignment(assignment)
+        for s, user_id in enumerate(matrix.user_ids.tolist()):
+            p = int(assignment[s])
+            if p >= 0:
+                allocation_rows.append({
+                    'user_id': user_id,
+                    'project_id': int(matrix.project_ids[p]),
+                    'timeframe_id': timeframe_id,
+                    'role_type': role,
+                    'preference_rank_fulfilled': int(fulfilled[s]) or None,
+                    'allocation_batch_id': batch_id,
+                    'allocation_method': AUTOMATIC_METHOD,
+                    'status': 'pending',
+                    'allocated_at': now,
+                    'allocated_by': allocated_by,
+                })
+            else:
+                unallocated_rows.append({
+                    'user_id': user_id,
+                    'timeframe_id': timeframe_id,
+                    'allocation_batch_id': batch_id,
+                    'expected_role': role,
+                    'reason': 'capacity_exceeded',
+                    'details': f'Automatic allocation batch {batch_id}',
+                    'manual_intervention_required': False,
+                    'resolved': False,
+                    'created_at': now,
+                })
+
+        assigned = assignment >= 0
+        open_slots = matrix.capacities - np.bincount(assignment[assigned], minlength=matrix.n_projects)
+        summary[f'{role}s_considered'] = matrix.n_users
+        summary[f'{role}s_assigned'] = int(assigned.sum())
+        summary[f'{role}s_ranked_choice'] = int((fulfilled > 0).sum())
+        summary[f'open_{role}_slots'] = int(open_slots.sum())
+
+    if allocation_rows:
+        db.session.execute(AllocationResult.__table__.insert(), allocation_rows)
+    if unallocated_rows:
+        db.session.execute(UnallocatedUser.__table__.insert(), unallocated_rows)
+
+    logger.info(
+        f"Staff allocation batch {batch_id} for timeframe {timeframe_id}: "
+        f"{summary['supervisors_assigned']} supervisors, {summary['assessors_assigned']} assessors"
+    )
+    return summary
@@ -0,0 +1,143 @@
+import logging
+import random
+import threading
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+
+from database import db
+from shared.models import ExternalAPIConfig, Timeframe
+from shared.service.import_jobs import EXTERNAL_SYNC_JOB, enqueue_job
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Used outside an app context; deployments override these through Config / environment
+DEFAULT_SCHEDULE_SETTINGS = {
+    'EXTERNAL_SYNC_SCHEDULE_ENABLED': False,
+    'EXTERNAL_SYNC_SCHEDULE_HOUR': 2,  # server local time of the nightly run
+    'EXTERNAL_SYNC_JITTER_SECONDS': 3600,  # schools' start times are spread over this window
+}
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def schedule_setting(key):
+    source = current_app.config if has_app_context() else {}
+    value = source.get(key)
+    return DEFAULT_SCHEDULE_SETTINGS[key] if value is None else value
+
+
+def open_timeframes(school_id: int, today: Optional[date] = None):
+    """Timeframes of a school that have not ended yet; their rosters are kept in sync"""
+    today = today or date.today()
+    return Timeframe.query.filter(
+        Timeframe.school_id == school_id,
+        Timeframe.end_date >= today
+    ).order_by(Timeframe.id).all()
+
+
+def schedule_external_syncs(now: Optional[datetime] = None, jitter_seconds: Optional[float] = None,
+                            school_id: Optional[int] = None, mode: str = 'auto', rnd=random) -> dict:
+    """
+    Queue an external sync job for every open timeframe of every school with an active API config.
+
+    Each school gets a random start offset within the jitter window so hundreds of schools do not
+    all hit the database and their APIs at once; the import workers then run the jobs, at most
+    IMPORT_JOB_MAX_PER_SCHOOL per school at a time. A timeframe is queued at most once per day
+    (idempotency key), so several app processes running the schedule do not duplicate the work.
+    Returns a summary of what was queued.
+    """
+    now = now or datetime.utcnow()
+    if jitter_seconds is None:
+        jitter_seconds = float(schedule_setting('EXTERNAL_SYNC_JITTER_SECONDS'))
+
+    query = db.session.query(ExternalAPIConfig.school_id).filter(ExternalAPIConfig.is_active.is_(True))
+    if school_id is not None:
+        query = query.filter(ExternalAPIConfig.school_id == school_id)
+    school_ids = sorted({school for (school,) in query.distinct()})
+
+    summary = {'schools': len(school_ids), 'queued': 0, 'already_queued': 0}
+    for school in school_ids:
+        run_after = now + timedelta(seconds=rnd.uniform(0, jitter_seconds)) if jitter_seconds > 0 else None
+        for timeframe in open_timeframes(school, now.date()):
+            job, created = enqueue_job(
+                EXTERNAL_SYNC_JOB, timeframe.id, school,
+                options={'mode': mode, 'trigger': 'scheduled'},
+                idempotency_key=f'scheduled-sync:{now.date().isoformat()}:{mode}:{timeframe.id}',
+                dedupe_active=True,
+                run_after=run_after,
+            )
+            summary['queued' if created else 'already_queued'] += 1
+
+    logger.info(f"Scheduled external syncs: {summary}")
+    return summary
+
+
+def next_run_time(after: datetime, hour: int) -> datetime:
+    run = after.replace(hour=hour, minute=0, second=0, microsecond=0)
+    return run if run > after else run + timedelta(days=1)
+
+
+class ExternalSyncScheduler(threading.Thread):
+    """Daemon thread that queues the nightly syncs at EXTERNAL_SYNC_SCHEDULE_HOUR (server local time)"""
+
+    def __init__(self, app):
+        super().__init__(name='external-sync-scheduler', daemon=True)
+        self.app = app
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        hour = int(self.app.config.get('EXTERNAL_SYNC_SCHEDULE_HOUR', DEFAULT_SCHEDULE_SETTINGS['EXTERNAL_SYNC_SCHEDULE_HOUR']))
+        logger.info(f"External sync scheduler started (daily at {hour:02d}:00)")
+        while True:
+            run_at = next_run_time(datetime.now(), hour)
+            if self._stop_event.wait((run_at - datetime.now()).total_seconds()):
+                return
+            with self.app.app_context():
+                try:
+                    schedule_external_syncs()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"Scheduling external syncs failed: {e}")
+
+
+def start_sync_scheduler(app):
+    """Start the nightly scheduler once per process when EXTERNAL_SYNC_SCHEDULE_ENABLED is set"""
+    global _scheduler
+    if not app.config.get('EXTERNAL_SYNC_SCHEDULE_ENABLED', DEFAULT_SCHEDULE_SETTINGS['EXTERNAL_SYNC_SCHEDULE_ENABLED']):
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ExternalSyncScheduler(app)
+            _scheduler.start()
+        return _scheduler
+
+
+def stop_sync_scheduler():
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            _scheduler.stop()
+            _scheduler.join(timeout=5)
+            _scheduler = None
+
+
+@click.command('sync-external')
+@click.option('--school', 'school_id', type=int, default=None, help='Only this school')
+@click.option('--mode', type=click.Choice(['auto', 'delta', 'full']), default='auto')
+@click.option('--jitter', type=float, default=None, help='Spread start times over this many seconds')
+@with_appcontext
+def sync_external_command(school_id, mode, jitter):
+    """Queue external API syncs for all open timeframes (for cron; the import workers run them)"""
+    summary = schedule_external_syncs(jitter_seconds=jitter, school_id=school_id, mode=mode)
+    click.echo(f"{summary['queued']} syncs queued for {summary['schools']} schools "
+               f"({summary['already_queued']} already queued today)")
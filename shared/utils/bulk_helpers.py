@@ -0,0 +1,51 @@
+# shared/utils/bulk_helpers.py
+from itertools import islice
+from typing import Iterable, Iterator, List, Sequence
+
+from sqlalchemy import insert
+
+from database import db
+
+# Rows per INSERT statement; keeps bound parameters well under driver limits
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunked(iterable: Iterable, size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List]:
+    """Yield lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_ignore_statement(table):
+    """
+    INSERT that silently skips rows hitting a primary key / unique constraint:
+    ON CONFLICT DO NOTHING on PostgreSQL and SQLite, INSERT IGNORE on MySQL.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(table).on_conflict_do_nothing()
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(table).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return insert(table).prefix_with('IGNORE')
+    raise NotImplementedError(f"insert_ignore is not supported for dialect '{dialect}'")
+
+
+def insert_ignore(table, rows: Sequence[dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Bulk insert `rows` into `table` (a Table or model class), skipping existing keys.
+    Runs one executemany per chunk; returns the number of rows submitted.
+    """
+    if not rows:
+        return 0
+    table = getattr(table, '__table__', table)
+    statement = insert_ignore_statement(table)
+    for chunk in chunked(rows, chunk_size):
+        db.session.execute(statement, chunk)
+    return len(rows)
@@ -0,0 +1,127 @@
+# shared/utils/roster_file_reader.py
+import csv
+import io
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from shared.utils.bulk_helpers import chunked
+
+ROSTER_EXTENSIONS = {'xlsx', 'xls', 'csv'}
+
+# (row number in the file, {header: value})
+RosterRecord = Tuple[int, dict]
+
+
+class RosterFileError(ValueError):
+    """The file cannot be read as a roster (unknown type, unreadable, or missing columns)"""
+
+
+def file_extension(filename: str) -> str:
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+
+def _normalise(value):
+    # Spreadsheet numbers come back as floats; an ID of 1234 must not become "1234.0"
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _is_blank(values) -> bool:
+    # None, NaN (pandas' empty cell) or whitespace
+    return all(value is None or value != value or (isinstance(value, str) and not value.strip())
+               for value in values)
+
+
+class RosterFileReader:
+    """
+    Streaming reader for roster uploads.
+
+    .xlsx is read with openpyxl in read-only mode and .csv with the csv module, one row at a
+    time, so memory stays flat however long the file is and callers can start loading the first
+    batch before the rest is parsed. Legacy .xls has no streaming reader and is loaded with pandas.
+    The header row is read and checked against `required_columns` on construction.
+    """
+
+    def __init__(self, source, filename: str, required_columns: Iterable[str] = ()):
+        self.filename = filename
+        self.format = file_extension(filename)
+        if self.format not in ROSTER_EXTENSIONS:
+            raise RosterFileError(f'Unsupported file type ".{self.format}"; upload .xlsx, .xls or .csv')
+
+        self.estimated_rows: Optional[int] = None
+        self._workbook = None
+        try:
+            if self.format == 'xlsx':
+                rows = self._open_xlsx(source)
+            elif self.format == 'csv':
+                rows = self._open_csv(source)
+            else:
+                rows = self._open_xls(source)
+            header = next(rows, None)
+        except RosterFileError:
+            raise
+        except Exception as e:
+            self.close()
+            raise RosterFileError(f'Could not read {self.format.upper()} file: {e}')
+
+        if header is None:
+            self.close()
+            raise RosterFileError('The file is empty')
+        self.columns = [str(name).strip() if name is not None else '' for name in header]
+        missing = [column for column in required_columns if column not in self.columns]
+        if missing:
+            self.close()
+            raise RosterFileError(f'Missing required columns: {", ".join(missing)}')
+        self._rows = rows
+
+    def _open_xlsx(self, source) -> Iterator[tuple]:
+        from openpyxl import load_workbook
+
+        self._workbook = load_workbook(source, read_only=True, data_only=True)
+        sheet = self._workbook.worksheets[0]
+        # From the sheet's <dimension> tag; only an estimate, and absent in some generated files
+        if sheet.max_row:
+            self.estimated_rows = max(sheet.max_row - 1, 0)
+        return sheet.iter_rows(values_only=True)
+
+    def _open_csv(self, source) -> Iterator[list]:
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        if source.seekable():
+            # One pass over the raw bytes in 1 MB chunks is far cheaper than parsing
+            start = source.tell()
+            lines = sum(chunk.count(b'\n') for chunk in iter(lambda: source.read(1 << 20), b''))
+            source.seek(start)
+            self.estimated_rows = max(lines - 1, 0)
+        text = io.TextIOWrapper(source, encoding='utf-8-sig', newline='')
+        return csv.reader(text)
+
+    def _open_xls(self, source) -> Iterator[list]:
+        import pandas as pd
+
+        df = pd.read_excel(source, dtype=object, header=None)
+        self.estimated_rows = max(len(df) - 1, 0)
+        return (list(row) for row in df.itertuples(index=False, name=None))
+
+    def records(self) -> Iterator[RosterRecord]:
+        """Yield (row_number, record) for each non-blank data row; the header is row 1"""
+        try:
+            for row_number, values in enumerate(self._rows, 2):
+                if _is_blank(values):
+                    continue
+                values = [_normalise(value) for value in values]
+                yield row_number, dict(zip(self.columns, values))
+        except Exception as e:
+            raise RosterFileError(f'Could not read {self.format.upper()} file: {e}')
+        finally:
+            self.close()
+
+    def batches(self, batch_size: int, skip: int = 0) -> Iterator[List[RosterRecord]]:
+        """Yield lists of at most `batch_size` records, after skipping the first `skip` records"""
+        return chunked(islice(self.records(), skip, None), batch_size)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None